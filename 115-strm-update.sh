@@ -6,6 +6,9 @@ export LC_ALL=en_US.UTF-8
 # 配置文件路径，改用$HOME来确保路径正确解析
 # 一定要配置url地址，存储目录，详细见附件
 config_file="$HOME/.strm/115-strm-update.conf"
+# .strm 生成记录（.manifest.db）和运行报告（.report.json）由处理引擎保存在配置文件旁边
+# 上次成功更新时目录树的 ETag、Last-Modified 和内容摘要，用于判断目录树是否有变化
+tree_state_file="${config_file%.conf}.tree.state"
 
 # 读取配置文件函数
 read_config() {
@@ -19,6 +22,18 @@ read_config() {
     last_interval_time="${last_interval_time:-3}"
     last_user_formats="${last_user_formats:-}"
     exclude_option="${exclude_option:-2}"   # 确保 exclude_option 有默认值
+    strm_source="${strm_source:-2}"         # 默认值为 2（流式读取目录树）
+    use_manifest="${use_manifest:-1}"       # 默认值为 1（使用生成记录）
+    strm_workers="${strm_workers:-0}"       # 默认值为 0（按 CPU 核心数自动设置）
+    strm_worker_mode="${strm_worker_mode:-1}" # 默认值为 1（多线程）
+    metrics_report="${metrics_report:-${config_file%.conf}.report.json}" # 运行报告（JSON）
+    metrics_textfile="${metrics_textfile:-}" # Prometheus 指标文件，留空不输出
+    emby_url="${emby_url:-}"                 # Emby 地址，留空不通知
+    emby_api_key="${emby_api_key:-}"
+    emby_strm_path="${emby_strm_path:-}"     # Emby 中看到的 .strm 目录，留空与本机相同
+    batch_jobs_file="${batch_jobs_file:-}"   # 批量任务文件，设置后一次处理其中的全部目录树
+    db_file="${db_file:-}"                   # 批量处理时导入索引的 alist 数据库，留空不导入
+    index_mode="${index_mode:-3}"            # 默认值为 3（增量更新）
 }
 
 
@@ -38,6 +53,18 @@ delete_absent="$delete_absent"
 last_strm_directory="$last_strm_directory"
 last_interval_time="$last_interval_time"
 last_user_formats="$last_user_formats"
+strm_source="$strm_source"
+use_manifest="$use_manifest"
+strm_workers="$strm_workers"
+strm_worker_mode="$strm_worker_mode"
+metrics_report="$metrics_report"
+metrics_textfile="$metrics_textfile"
+emby_url="$emby_url"
+emby_api_key="$emby_api_key"
+emby_strm_path="$emby_strm_path"
+batch_jobs_file="$batch_jobs_file"
+db_file="$db_file"
+index_mode="$index_mode"
 EOF
 }
 
@@ -45,6 +72,35 @@ EOF
 # 初始化配置
 read_config
 
+# 处理引擎 strm_engine.py：解析目录树和生成 .strm 都由它完成，脚本只负责下载目录树和判断是否有变化。
+# 优先使用与脚本放在同一目录的文件；通过 curl 直接运行脚本时，从仓库下载到配置文件旁边
+engine_url="https://raw.githubusercontent.com/suixing8/115-strm/main/strm_engine.py"
+engine_file="$(cd "$(dirname "${BASH_SOURCE[0]:-$0}")" 2>/dev/null && pwd)/strm_engine.py"
+if [ ! -f "$engine_file" ]; then
+    engine_file="${config_file%.conf}_engine.py"
+    if curl -fsSL -o "$engine_file.part" "$engine_url"; then
+        mv "$engine_file.part" "$engine_file"
+    elif [ -f "$engine_file" ]; then
+        rm -f "$engine_file.part"
+        echo "处理引擎下载失败，使用上次下载的版本：$engine_file"
+    else
+        rm -f "$engine_file.part"
+        echo "处理引擎 strm_engine.py 下载失败，请把它和脚本放在同一目录后再运行。"
+        exit 1
+    fi
+fi
+
+# 调用处理引擎，先保存配置，引擎从配置文件读取设置
+run_engine() {
+    save_config
+    python3 "$engine_file" -c "$config_file" --name 115-strm-update "$@"
+}
+
+# 解码 URL 中的 %XX，代替每次启动 python3 调用 urllib.parse.unquote
+url_decode() {
+    printf '%b' "${1//%/\\x}"
+}
+
 # 初始化全局变量，存储生成的目录文件路径和自定义扩展名
 generated_directory_file="${generated_directory_file:-}"
 custom_extensions="${custom_extensions:-}"
@@ -55,8 +111,84 @@ builtin_video_extensions=("mp4" "mkv" "avi" "mov" "wmv" "flv" "webm" "vob" "mpg"
 builtin_image_extensions=("jpg" "jpeg" "png" "gif" "bmp" "tiff" "svg" "heic")
 builtin_other_extensions=("iso" "img" "bin" "nrg" "cue" "dvd" "lrc" "srt" "sub" "ssa" "ass" "vtt" "txt" "pdf" "doc" "docx" "csv" "xml" "new")
 
-# 将目录树文件转换为目录文件的函数
-convert_directory_tree() {
+# 从 curl -D 保存的响应头中取出指定字段，跟随跳转时取最后一个响应中的值
+header_value() {
+    awk -v name="$(echo "$1" | tr '[:upper:]' '[:lower:]'):" '
+        /^HTTP\// { value = "" }
+        tolower($1) == name { sub(/^[^:]*:[ \t]*/, ""); sub(/\r$/, ""); value = $0 }
+        END { print value }' "$2"
+}
+
+# 判断目录树是否有变化，结果保存在 tree_changed（1 有变化，0 没有变化）
+# 下载链接会带上上次的 ETag/Last-Modified 发送条件请求，服务器返回 304 时不下载；
+# 返回 200 或使用本地文件时，计算内容的 sha256 与上次成功更新时的摘要比较。
+# 生成 .strm 用到的配置有变化，或设置了环境变量 FORCE_UPDATE=1 时，总是视为有变化
+check_directory_tree() {
+    local source="$1" target="$2"
+    local part_file="${target}.part" headers_file="${target}.headers"
+    local conditional_headers=() http_code
+
+    tree_etag="" tree_last_modified="" tree_digest="" tree_signature=""
+    if [ -f "$tree_state_file" ]; then
+        # shellcheck source=/dev/null
+        . "$tree_state_file"
+    fi
+    new_tree_signature="$strm_save_path|${alist_url%/}|$mount_path|$exclude_option|$custom_extensions|$strm_source"
+    local reusable=0
+    if [ -f "$target" ] && [ "$tree_signature" = "$new_tree_signature" ] && [ "${FORCE_UPDATE:-0}" != "1" ]; then
+        reusable=1
+    fi
+
+    if [[ $source == http* ]]; then
+        if [ "$reusable" = "1" ]; then
+            [ -n "$tree_etag" ] && conditional_headers+=(-H "If-None-Match: $tree_etag")
+            [ -n "$tree_last_modified" ] && conditional_headers+=(-H "If-Modified-Since: $tree_last_modified")
+        fi
+        if ! http_code=$(curl -sS -L "${conditional_headers[@]}" -D "$headers_file" -o "$part_file" -w '%{http_code}' "$source"); then
+            http_code="000"
+        fi
+        if [ "$http_code" = "304" ]; then
+            rm -f "$part_file" "$headers_file"
+            new_tree_etag="$tree_etag" new_tree_last_modified="$tree_last_modified" new_tree_digest="$tree_digest"
+            tree_changed=0
+            echo "目录树没有变化（HTTP 304），跳过下载。"
+            return 0
+        fi
+        if [ "$http_code" != "200" ]; then
+            rm -f "$part_file" "$headers_file"
+            echo "目录树下载失败（HTTP $http_code）。"
+            return 1
+        fi
+        new_tree_etag=$(header_value ETag "$headers_file")
+        new_tree_last_modified=$(header_value Last-Modified "$headers_file")
+        rm -f "$headers_file"
+        new_tree_digest=$(sha256sum "$part_file" | cut -d ' ' -f 1)
+        mv "$part_file" "$target"
+    else
+        new_tree_etag="" new_tree_last_modified=""
+        new_tree_digest=$(sha256sum "$target" | cut -d ' ' -f 1)
+    fi
+
+    if [ "$reusable" = "1" ] && [ "$new_tree_digest" = "$tree_digest" ]; then
+        tree_changed=0
+        echo "目录树内容没有变化，跳过更新。"
+    else
+        tree_changed=1
+    fi
+}
+
+# 更新成功后保存目录树的下载状态，下次运行时用于判断是否有变化
+save_tree_state() {
+    {
+        printf 'tree_etag=%q\n' "$new_tree_etag"
+        printf 'tree_last_modified=%q\n' "$new_tree_last_modified"
+        printf 'tree_digest=%q\n' "$new_tree_digest"
+        printf 'tree_signature=%q\n' "$new_tree_signature"
+    } >"$tree_state_file"
+}
+
+# 获取目录树文件并判断是否有变化的函数，下载链接会下载到当前目录
+prepare_directory_tree() {
 #    if [ -n "$directory_tree_file" ]; then
 #        echo "请输入目录树文件的路径或者下载链接，上次配置:${directory_tree_file}，回车确认："
 #    else
@@ -71,13 +203,17 @@ convert_directory_tree() {
         url="$directory_tree_file"
 
         filename=$(basename "$url")
-        decoded_filename=$(python3 -c "import urllib.parse; print(urllib.parse.unquote('$filename'))")
-
-        # 下载文件
-        curl -L -o "$filename" "$url"
+        decoded_filename=$(url_decode "$filename")
 
-        # 重命名文件
-        mv "$filename" "$decoded_filename"
+        # 下载文件（目录树没有变化时不下载），记录下载耗时和大小写入运行报告
+        download_started=$(date +%s.%N)
+        if ! check_directory_tree "$url" "$PWD/$decoded_filename"; then
+            return 1
+        fi
+        download_finished=$(date +%s.%N)
+        if [ "$tree_changed" = "1" ]; then
+            download_bytes=$(stat -c %s "$decoded_filename" 2>/dev/null)
+        fi
 
         # 更新 directory_tree_file 为新下载文件的完整路径
         directory_tree_file="$PWD/$decoded_filename"
@@ -88,58 +224,13 @@ convert_directory_tree() {
 
     if [ ! -f "$directory_tree_file" ]; then
         echo "目录树文件不存在，请提供有效的文件路径。"
-        return
+        return 1
     fi
 
-    # 获取目录树文件的目录和文件名
-    directory_tree_dir=$(dirname "$directory_tree_file")
-    directory_tree_base=$(basename "$directory_tree_file")
-
-    # 转换目录树文件为 UTF-8 格式，以便处理（如有需要）
-    converted_file="$directory_tree_dir/$directory_tree_base.converted"
-    iconv -f utf-16le -t utf-8 "$directory_tree_file" >"$converted_file"
-
-    # 生成的目录文件路径
-    generated_directory_file="${converted_file}_目录文件.txt"
-
-    # 使用 Python 解析目录树
-    python3 - <<EOF
-import os
-
-def parse_directory_tree(file_path):
-    current_path_stack = []
-    directory_list_file = "${generated_directory_file}"
-
-    # 打开输入文件和输出文件
-    with open(file_path, 'r', encoding='utf-8') as file, \
-         open(directory_list_file, 'w', encoding='utf-8') as output_file:
-        for line in file:
-            # 移除 BOM 和多余空白
-            line = line.lstrip('\ufeff').rstrip()
-            line_depth = line.count('|')  # 计算目录级别
-            item_name = line.split('|-')[-1].strip()  # 获取当前项名称
-            if not item_name:
-                continue
-            while len(current_path_stack) > line_depth:
-                current_path_stack.pop()  # 移出多余的路径层级
-            if len(current_path_stack) == line_depth:
-                if current_path_stack:
-                    current_path_stack.pop()
-            current_path_stack.append(item_name)  # 添加当前项到路径栈
-            full_path = '/' + '/'.join(current_path_stack)  # 构建完整路径
-            output_file.write(full_path + '\n')  # 写入输出文件
-
-parse_directory_tree("$converted_file")
-EOF
-    # 使用 sed 在 bash 中处理生成文件，替换每行开头的 "/|——" 为 "/"
-    sed -i 's/^.\{4\}/\//' "${converted_file}_目录文件.txt"
-
-    # 清理临时转换文件
-    rm "$converted_file"
-    echo "目录文件已生成：$generated_directory_file"
-
-    # 保存配置
-    save_config
+    # 本地的目录树文件只比较内容摘要
+    if [[ $directory_tree_url != http* ]]; then
+        check_directory_tree "$directory_tree_file" "$directory_tree_file"
+    fi
 }
 
 # 生成 .strm 文件的函数
@@ -169,7 +260,7 @@ generate_strm_files() {
     fi
 
     # 提示用户输入挂载路径信息
-    decoded_mount_path=$(python3 -c "import urllib.parse; print(urllib.parse.unquote('${mount_path}'))")
+    decoded_mount_path=$(url_decode "$mount_path")
 #    if [ -n "$decoded_mount_path" ]; then
 #        echo "请输入alist存储里对应的挂载路径信息，上次配置:${decoded_mount_path}，回车确认："
 #    else
@@ -192,12 +283,6 @@ generate_strm_files() {
         fi
     fi
 
-    # 编码挂载路径
-    encoded_mount_path=$(python3 -c "import urllib.parse; print(urllib.parse.quote('${mount_path}'))")
-
-    # 拼接 URL
-    full_alist_url="${alist_url%/}/d${encoded_mount_path}/"
-
     # 提示用户输入剔除选项，增加默认值为2
 #    if [ -n "$exclude_option" ]; then
 #        echo "请输入剔除选项（输入要剔除的目录层级数量，默认为2），上次配置:${exclude_option}，回车确认："
@@ -215,176 +300,74 @@ generate_strm_files() {
 #    echo "如果本次目录中存在本次未创建的strm文件，是否删除（上次配置: ${delete_absent:-2}）：1. 删除 2. 不删除"
 #    read -r input_delete_absent
     delete_absent="${input_delete_absent:-$delete_absent}"
+    # 提示是否使用生成记录
+#    echo "是否使用生成记录，只写入新增或链接有变化的strm，并按记录删除多余文件，不再扫描strm目录（手动删除的strm不会被重新创建）（上次配置: ${use_manifest:-1}）：1. 使用 2. 不使用"
+#    read -r input_use_manifest
+    use_manifest="${input_use_manifest:-$use_manifest}"
+#    # 提示设置并行任务数和并行方式
+#    echo "请输入并行任务数，0 为按 CPU 核心数自动设置（最多 32）（上次配置: ${strm_workers:-0}）："
+#    read -r input_strm_workers
+    strm_workers="${input_strm_workers:-$strm_workers}"
+#    echo "请选择并行方式（上次配置: ${strm_worker_mode:-1}）：1. 多线程（适合 NFS 等网络存储） 2. 多进程（适合本地磁盘）"
+#    read -r input_strm_worker_mode
+    strm_worker_mode="${input_strm_worker_mode:-$strm_worker_mode}"
+
+    # 转换目录文件（流式模式不需要）并生成 .strm，在同一个进程中完成，目录树只解析一次；
+    # 配置了 Emby 时按变更记录通知 Emby 只刷新有变化的目录。
+    # 目录树没有变化时不生成 .strm，只重试上次没有通知成功的变化并更新运行报告
+    engine_args=(--tree "$directory_tree_file")
+    if [ "$strm_source" = "2" ]; then
+        engine_args+=(strm)
+    else
+        engine_args+=(convert strm)
+    fi
+    if [ -n "$emby_url" ]; then
+        engine_args+=(notify)
+    fi
+    if [ -n "$download_started" ]; then
+        engine_args+=(--shell-stage "download,$download_started,$download_finished,$download_bytes")
+    fi
+    if [ "$tree_changed" = "0" ]; then
+        engine_args+=(--tree-unchanged)
+    fi
+    run_engine "${engine_args[@]}"
+}
 
-    # 创建临时文件来存储现有的目录结构
-    temp_existing_structure=$(mktemp)
-    temp_new_structure=$(mktemp)
-
-    # 获取现有的 .strm 文件目录结构并存入临时文件
-    find "$strm_save_path" -type f -name "*.strm" >"$temp_existing_structure"
-
-    # 使用 Python 生成 .strm 文件并处理多线程与进度显示
-    python3 - <<EOF
-import os
-import urllib.parse
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
-
-# 定义一些变量
-update_existing = $update_existing
-delete_absent = $delete_absent
-
-
-# 定义常见的媒体文件扩展名，并合并用户自定义扩展名
-media_extensions = set([
-    "mp4", "mkv", "avi", "mov", "wmv", "flv", "webm", "vob", "mpg", "mpeg",
-    "iso", "img", "dvd", "ts", "rm", "rmvb", "3gp", "dat", "ogg", "m2ts"
-])
-custom_extensions = set("${custom_extensions}".split())
-media_extensions.update(custom_extensions)
-
-# 设定变量
-exclude_option = $exclude_option
-alist_url = "$full_alist_url"
-strm_save_path = "$strm_save_path"
-generated_directory_file = "$generated_directory_file"
-
-# 临时文件路径，存放在当前脚本执行目录
-temp_existing_structure = os.path.join("${script_dir}", "existing_structure.txt")
-temp_new_structure = os.path.join("${script_dir}", "new_structure.txt")
-temp_to_create = os.path.join("${script_dir}", "to_create.txt")
-temp_to_delete = os.path.join("${script_dir}", "to_delete.txt")
-
-# 获取现有的 .strm 文件目录结构
-def list_existing_files():
-    existing_files = []
-    for root, _, files in os.walk(strm_save_path):
-        for file in files:
-            if file.endswith('.strm'):
-                existing_files.append(os.path.join(root, file))
-    with open(temp_existing_structure, 'w', encoding='utf-8') as f:
-        f.writelines(f"{line}\n" for line in existing_files)
-
-# 处理生成目录结构
-def process_directory_structure():
-    with open(generated_directory_file, 'r', encoding='utf-8') as file, open(temp_new_structure, 'w', encoding='utf-8') as new_structure_file:
-        for line in file:
-            line = line.strip()
-            if line.count('/') < exclude_option + 1:
-                continue
-
-            adjusted_path = '/'.join(line.split('/')[exclude_option + 1:])
-            if adjusted_path.split('.')[-1].lower() in media_extensions:
-                new_structure_file.write(adjusted_path + '\n')
-
-# 根据文件列表创建或更新 .strm 文件
-def create_strm_files():
-    total = 0
-    with open(temp_new_structure, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        total = len(lines)
-    
-    processed = 0
-    lock = threading.Lock()
-    with open(temp_to_create, 'w', encoding='utf-8') as to_create_file:
-        def process_line(line):
-            nonlocal processed
-            line = line.strip()
-            parent_path, file_name = os.path.split(line)
-            strm_file_path = os.path.join(strm_save_path, parent_path, f"{file_name}.strm")
-            os.makedirs(os.path.join(strm_save_path, parent_path), exist_ok=True)
-
-            if not os.path.exists(strm_file_path) or update_existing == 2:
-                encoded_path = urllib.parse.quote(line)
-                with open(strm_file_path, 'w', encoding='utf-8') as strm_file:
-                    strm_file.write(f"{alist_url}{encoded_path}")
-                to_create_file.write(strm_file_path + '\n')
-
-            with lock:
-                processed += 1
-                print(f"\r创建 .strm：{processed}/{total} ({processed / total:.2%})", end='')
-
-        with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as executor:
-            futures = [executor.submit(process_line, line) for line in lines]
-            for _ in as_completed(futures):
-                pass
-
-# 删除多余的 .strm 文件
-def delete_obsolete_files():
-    if delete_absent != 1:
-        return
-
-    with open(temp_existing_structure, 'r', encoding='utf-8') as existing_file:
-        existing_files = set(existing_file.read().splitlines())
-    with open(temp_new_structure, 'r', encoding='utf-8') as new_file:
-        new_files = {os.path.join(strm_save_path, '/'.join(path.split('/')[:-1]), path.split('/')[-1] + '.strm') for path in new_file.read().splitlines()}
-    
-    files_to_delete = existing_files - new_files
-    total = len(files_to_delete)
-    processed = 0
-    lock = threading.Lock()
-
-    with open(temp_to_delete, 'w', encoding='utf-8') as to_delete_file:
-        def process_deletion(file_path):
-            nonlocal processed
-            try:
-                os.remove(file_path)
-                to_delete_file.write(file_path + '\n')
-                parent_dir = os.path.dirname(file_path)
-                while parent_dir and parent_dir != strm_save_path:
-                    try:
-                        os.rmdir(parent_dir)
-                    except OSError:
-                        break
-                    parent_dir = os.path.dirname(parent_dir)
-            except OSError:
-                pass
-
-            with lock:
-                processed += 1
-                print(f"\r删除 .strm：{processed}/{total} ({processed / total:.2%})", end='')
-
-        with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as executor:
-            futures = [executor.submit(process_deletion, file_path) for file_path in files_to_delete]
-            for _ in as_completed(futures):
-                pass
-
-print("检测现有 .strm 文件...")
-list_existing_files()
-
-print("生成新的目录结构...")
-process_directory_structure()
-
-print("创建 .strm 文件...")
-create_strm_files()
-
-print("\n删除多余的 .strm 文件...")
-delete_obsolete_files()
-
-print("\n操作完成。")
-
-EOF
-
-    # 定义当前脚本的执行目录
-    script_dir=$(pwd)
-
-    # 清理临时文件
-    for temp_file in "existing_structure.txt" "new_structure.txt" "to_create.txt" "to_delete.txt"; do
-        temp_file_path="${script_dir}/${temp_file}"
-        if [ -f "$temp_file_path" ]; then
-            rm "$temp_file_path"
-            echo "已删除临时文件：'$temp_file_path'"
-        else
-            echo "没有检测到需要删除的文件：'$temp_file_path'"
-        fi
-    done
-
-    # 保存配置
-    save_config
+# 批量处理：批量任务文件中的多个目录树一次完成，并行解析，.strm 共用一个线程池写入，索引在一个事务中写入。
+# 各任务的目录树没有变化时直接加载目录快照，按生成记录只写入有变化的 .strm
+run_batch_jobs() {
+    if [ ! -f "$batch_jobs_file" ]; then
+        echo "批量任务文件不存在：$batch_jobs_file"
+        return 1
+    fi
+    engine_args=(--jobs "$batch_jobs_file")
+    if [ "$strm_source" != "2" ]; then
+        engine_args+=(convert)
+    fi
+    engine_args+=(strm)
+    if [ -n "$db_file" ]; then
+        engine_args+=(index)
+    fi
+    if [ -n "$emby_url" ]; then
+        engine_args+=(notify)
+    fi
+    run_engine "${engine_args[@]}"
 }
 
 # 主程序
 
-convert_directory_tree
-
-generate_strm_files
+if [ -n "$batch_jobs_file" ]; then
+    run_batch_jobs
+    exit $?
+fi
+
+if ! prepare_directory_tree; then
+    exit 1
+fi
+
+# 生成成功后才记录目录树的状态，失败时下次运行会重新处理
+if generate_strm_files; then
+    save_tree_state
+else
+    exit 1
+fi
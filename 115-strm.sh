@@ -5,6 +5,8 @@ export LC_ALL=en_US.UTF-8
 
 # 配置文件路径，改用$HOME来确保路径正确解析
 config_file="$HOME/.115-strm.conf"
+# .strm 生成记录（.manifest.db）、下载任务状态（.download.db）和运行报告（.report.json）
+# 由处理引擎保存在配置文件旁边，例如 ~/.115-strm.manifest.db
 
 # 读取配置文件函数
 read_config() {
@@ -18,25 +20,51 @@ read_config() {
     last_interval_time="${last_interval_time:-3}"
     last_user_formats="${last_user_formats:-}"
     exclude_option="${exclude_option:-2}"   # 确保 exclude_option 有默认值
+    strm_source="${strm_source:-1}"         # 默认值为 1（目录文件）
+    use_manifest="${use_manifest:-1}"       # 默认值为 1（使用生成记录）
+    strm_workers="${strm_workers:-0}"       # 默认值为 0（按 CPU 核心数自动设置）
+    strm_worker_mode="${strm_worker_mode:-1}" # 默认值为 1（多线程）
+    metrics_report="${metrics_report:-${config_file%.conf}.report.json}" # 运行报告（JSON）
+    metrics_textfile="${metrics_textfile:-}" # Prometheus 指标文件，留空不输出
+    emby_url="${emby_url:-}"                 # Emby 地址，留空不通知
+    emby_api_key="${emby_api_key:-}"
+    emby_strm_path="${emby_strm_path:-}"     # Emby 中看到的 .strm 目录，留空与本机相同
+    download_workers="${download_workers:-2}" # 默认值为 2（同时下载的连接数）
+    batch_jobs_file="${batch_jobs_file:-}"   # 批量任务文件
 }
 
 
 
-# 保存配置文件函数
+# 保存配置文件函数：值用单引号括起（值中的单引号转义为 '\''），路径中有引号、$ 等字符时
+# source 配置文件不会出错或执行其中的内容，处理引擎按 shell 的引号规则读取结果相同
 save_config() {
-    cat <<EOF >"$config_file"
-directory_tree_file="$directory_tree_file"
-strm_save_path="$strm_save_path"
-alist_url="$alist_url"
-mount_path="$mount_path"
-exclude_option="$exclude_option"
-custom_extensions="$custom_extensions"
-update_existing="$update_existing"
-delete_absent="$delete_absent"
-last_strm_directory="$last_strm_directory"
-last_interval_time="$last_interval_time"
-last_user_formats="$last_user_formats"
-EOF
+    local key value
+    for key in \
+        directory_tree_file \
+        strm_save_path \
+        alist_url \
+        mount_path \
+        exclude_option \
+        custom_extensions \
+        update_existing \
+        delete_absent \
+        last_strm_directory \
+        last_interval_time \
+        last_user_formats \
+        strm_source \
+        use_manifest \
+        strm_workers \
+        strm_worker_mode \
+        metrics_report \
+        metrics_textfile \
+        emby_url \
+        emby_api_key \
+        emby_strm_path \
+        download_workers \
+        batch_jobs_file; do
+        value="${!key}"
+        printf "%s='%s'\n" "$key" "${value//\'/\'\\\'\'}"
+    done >"$config_file"
 }
 
 
@@ -46,18 +74,6 @@ if ! command -v python3 &>/dev/null; then
     exit 1
 fi
 
-# 检查是否安装了 iconv
-if ! command -v iconv &>/dev/null; then
-    echo "iconv 未安装，请安装后再运行此脚本。"
-    exit 1
-fi
-
-# 检查是否安装了 sqlite3
-if ! command -v sqlite3 &>/dev/null; then
-    echo "sqlite3 未安装，请安装后再运行此脚本。"
-    exit 1
-fi
-
 # 检查是否安装了 curl
 if ! command -v curl &>/dev/null; then
     echo "curl 未安装，请安装后再运行此脚本。"
@@ -67,6 +83,35 @@ fi
 # 初始化配置
 read_config
 
+# 处理引擎 strm_engine.py：解析目录树、生成 .strm、导入索引和下载都由它完成，菜单只负责交互。
+# 优先使用与脚本放在同一目录的文件；通过 curl 直接运行脚本时，从仓库下载到配置文件旁边
+engine_url="https://raw.githubusercontent.com/suixing8/115-strm/main/strm_engine.py"
+engine_file="$(cd "$(dirname "${BASH_SOURCE[0]:-$0}")" 2>/dev/null && pwd)/strm_engine.py"
+if [ ! -f "$engine_file" ]; then
+    engine_file="${config_file%.conf}_engine.py"
+    if curl -fsSL -o "$engine_file.part" "$engine_url"; then
+        mv "$engine_file.part" "$engine_file"
+    elif [ -f "$engine_file" ]; then
+        rm -f "$engine_file.part"
+        echo "处理引擎下载失败，使用上次下载的版本：$engine_file"
+    else
+        rm -f "$engine_file.part"
+        echo "处理引擎 strm_engine.py 下载失败，请把它和脚本放在同一目录后再运行。"
+        exit 1
+    fi
+fi
+
+# 调用处理引擎，先保存配置，引擎从配置文件读取设置
+run_engine() {
+    save_config
+    python3 "$engine_file" -c "$config_file" "$@"
+}
+
+# 解码 URL 中的 %XX，代替每次启动 python3 调用 urllib.parse.unquote
+url_decode() {
+    printf '%b' "${1//%/\\x}"
+}
+
 show_menu() {
     echo "请选择操作："
     echo "1: 将目录树转换为目录文件"
@@ -83,6 +128,8 @@ show_menu() {
 other_functions_menu() {
     echo "其他功能："
     echo "1: 去除文件格式，如果有字幕建议提前下载好，比如xx.mp4.strm，去除后为xx.strm"
+    echo "2: 设置 Emby 通知，生成 .strm 后只刷新有变化的目录，不需要扫描整个媒体库"
+    echo "3: 批量处理多个目录树，一次生成全部 .strm，并可一次导入 alist 索引数据库"
     echo "0: 返回主菜单"
 }
 
@@ -98,27 +145,22 @@ builtin_video_extensions=("mp4" "mkv" "avi" "mov" "wmv" "flv" "webm" "vob" "mpg"
 builtin_image_extensions=("jpg" "jpeg" "png" "gif" "bmp" "tiff" "svg" "heic")
 builtin_other_extensions=("iso" "img" "bin" "nrg" "cue" "dvd" "lrc" "srt" "sub" "ssa" "ass" "vtt" "txt" "pdf" "doc" "docx" "csv" "xml" "new")
 
-# 将目录树文件转换为目录文件的函数
-convert_directory_tree() {
-    if [ -n "$directory_tree_file" ]; then
-        echo "请输入目录树文件的路径或者下载链接，上次配置:${directory_tree_file}，回车确认："
-    else
-        echo "请输入目录树文件的路径或者下载链接，路径示例：/path/to/alist20250101000000_目录树.txt，回车确认："
-    fi
-    read -r input_directory_tree_file
-    directory_tree_file="${input_directory_tree_file:-$directory_tree_file}"
-
+# 获取目录树文件，如果是下载链接则先下载到当前目录
+resolve_directory_tree_file() {
     if [[ $directory_tree_file == http* ]]; then
         url="$directory_tree_file"
 
         filename=$(basename "$url")
-        decoded_filename=$(python3 -c "import urllib.parse; print(urllib.parse.unquote('$filename'))")
+        decoded_filename=$(url_decode "$filename")
 
-        # 下载文件
+        # 下载文件，记录下载耗时和大小写入运行报告
+        download_started=$(date +%s.%N)
         curl -L -o "$filename" "$url"
+        download_finished=$(date +%s.%N)
 
         # 重命名文件
         mv "$filename" "$decoded_filename"
+        download_bytes=$(stat -c %s "$decoded_filename" 2>/dev/null)
 
         # 更新 directory_tree_file 为新下载文件的完整路径
         directory_tree_file="$PWD/$decoded_filename"
@@ -129,58 +171,29 @@ convert_directory_tree() {
 
     if [ ! -f "$directory_tree_file" ]; then
         echo "目录树文件不存在，请提供有效的文件路径。"
-        return
+        return 1
     fi
+}
 
-    # 获取目录树文件的目录和文件名
-    directory_tree_dir=$(dirname "$directory_tree_file")
-    directory_tree_base=$(basename "$directory_tree_file")
+# 将目录树文件转换为目录文件的函数
+convert_directory_tree() {
+    if [ -n "$directory_tree_file" ]; then
+        echo "请输入目录树文件的路径或者下载链接，上次配置:${directory_tree_file}，回车确认："
+    else
+        echo "请输入目录树文件的路径或者下载链接，路径示例：/path/to/alist20250101000000_目录树.txt，回车确认："
+    fi
+    read -r input_directory_tree_file
+    directory_tree_file="${input_directory_tree_file:-$directory_tree_file}"
 
-    # 转换目录树文件为 UTF-8 格式，以便处理（如有需要）
-    converted_file="$directory_tree_dir/$directory_tree_base.converted"
-    iconv -f utf-16le -t utf-8 "$directory_tree_file" >"$converted_file"
+    if ! resolve_directory_tree_file; then
+        return
+    fi
 
     # 生成的目录文件路径
-    generated_directory_file="${converted_file}_目录文件.txt"
-
-    # 使用 Python 解析目录树
-    python3 - <<EOF
-import os
-
-def parse_directory_tree(file_path):
-    current_path_stack = []
-    directory_list_file = "${generated_directory_file}"
-
-    # 打开输入文件和输出文件
-    with open(file_path, 'r', encoding='utf-8') as file, \
-         open(directory_list_file, 'w', encoding='utf-8') as output_file:
-        for line in file:
-            # 移除 BOM 和多余空白
-            line = line.lstrip('\ufeff').rstrip()
-            line_depth = line.count('|')  # 计算目录级别
-            item_name = line.split('|-')[-1].strip()  # 获取当前项名称
-            if not item_name:
-                continue
-            while len(current_path_stack) > line_depth:
-                current_path_stack.pop()  # 移出多余的路径层级
-            if len(current_path_stack) == line_depth:
-                if current_path_stack:
-                    current_path_stack.pop()
-            current_path_stack.append(item_name)  # 添加当前项到路径栈
-            full_path = '/' + '/'.join(current_path_stack)  # 构建完整路径
-            output_file.write(full_path + '\n')  # 写入输出文件
-
-parse_directory_tree("$converted_file")
-EOF
-    # 使用 sed 在 bash 中处理生成文件，替换每行开头的 "/|——" 为 "/"
-    sed -i 's/^.\{4\}/\//' "${converted_file}_目录文件.txt"
-
-    # 清理临时转换文件
-    rm "$converted_file"
-    echo "目录文件已生成：$generated_directory_file"
+    generated_directory_file="${directory_tree_file%.txt}_目录文件.txt"
 
-    # 保存配置
-    save_config
+    # 解析目录树，一次读取直接写出目录文件
+    run_engine convert --tree "$directory_tree_file"
 }
 
 # 自动查找可能的目录文件
@@ -216,11 +229,31 @@ find_possible_directory_file() {
 
 # 生成 .strm 文件的函数
 generate_strm_files() {
-    # 检查是否已有生成的目录文件
-    if [ -z "$generated_directory_file" ]; then
-        if ! find_possible_directory_file; then
+    # 选择数据来源：目录文件，或直接流式读取原始目录树（不生成中间文件）
+    echo "请选择生成 .strm 的数据来源（上次配置: ${strm_source:-1}）：1. 目录文件 2. 直接读取目录树文件（流式处理，不生成中间文件）"
+    read -r input_strm_source
+    strm_source="${input_strm_source:-$strm_source}"
+
+    if [ "$strm_source" = "2" ]; then
+        if [ -n "$directory_tree_file" ]; then
+            echo "请输入目录树文件的路径或者下载链接，上次配置:${directory_tree_file}，回车确认："
+        else
+            echo "请输入目录树文件的路径或者下载链接，路径示例：/path/to/alist20250101000000_目录树.txt，回车确认："
+        fi
+        read -r input_directory_tree_file
+        directory_tree_file="${input_directory_tree_file:-$directory_tree_file}"
+
+        if ! resolve_directory_tree_file; then
             return
         fi
+    else
+        strm_source=1
+        # 检查是否已有生成的目录文件
+        if [ -z "$generated_directory_file" ]; then
+            if ! find_possible_directory_file; then
+                return
+            fi
+        fi
     fi
 
     # 提示用户输入用于保存 .strm 文件的路径
@@ -247,7 +280,7 @@ generate_strm_files() {
     fi
 
     # 提示用户输入挂载路径信息
-    decoded_mount_path=$(python3 -c "import urllib.parse; print(urllib.parse.unquote('${mount_path}'))")
+    decoded_mount_path=$(url_decode "$mount_path")
     if [ -n "$decoded_mount_path" ]; then
         echo "请输入alist存储里对应的挂载路径信息，上次配置:${decoded_mount_path}，回车确认："
     else
@@ -270,12 +303,6 @@ generate_strm_files() {
         fi
     fi
 
-    # 编码挂载路径
-    encoded_mount_path=$(python3 -c "import urllib.parse; print(urllib.parse.quote('${mount_path}'))")
-
-    # 拼接 URL
-    full_alist_url="${alist_url%/}/d${encoded_mount_path}/"
-
     # 提示用户输入剔除选项，增加默认值为2
     if [ -n "$exclude_option" ]; then
         echo "请输入剔除选项（输入要剔除的目录层级数量，默认为2），上次配置:${exclude_option}，回车确认："
@@ -293,172 +320,32 @@ generate_strm_files() {
     echo "如果本次目录中存在本次未创建的strm文件，是否删除（上次配置: ${delete_absent:-2}）：1. 删除 2. 不删除"
     read -r input_delete_absent
     delete_absent="${input_delete_absent:-$delete_absent}"
-
-    # 创建临时文件来存储现有的目录结构
-    temp_existing_structure=$(mktemp)
-    temp_new_structure=$(mktemp)
-
-    # 获取现有的 .strm 文件目录结构并存入临时文件
-    find "$strm_save_path" -type f -name "*.strm" >"$temp_existing_structure"
-
-    # 使用 Python 生成 .strm 文件并处理多线程与进度显示
-    python3 - <<EOF
-import os
-import urllib.parse
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
-
-# 定义一些变量
-update_existing = $update_existing
-delete_absent = $delete_absent
-
-
-# 定义常见的媒体文件扩展名，并合并用户自定义扩展名
-media_extensions = set([
-    "mp4", "mkv", "avi", "mov", "wmv", "flv", "webm", "vob", "mpg", "mpeg",
-    "iso", "dvd", "ts", "rm", "rmvb", "3gp", "dat", "ogg", "m2ts"
-])
-custom_extensions = set("${custom_extensions}".split())
-media_extensions.update(custom_extensions)
-
-# 设定变量
-exclude_option = $exclude_option
-alist_url = "$full_alist_url"
-strm_save_path = "$strm_save_path"
-generated_directory_file = "$generated_directory_file"
-
-# 临时文件路径，存放在当前脚本执行目录
-temp_existing_structure = os.path.join("${script_dir}", "existing_structure.txt")
-temp_new_structure = os.path.join("${script_dir}", "new_structure.txt")
-temp_to_create = os.path.join("${script_dir}", "to_create.txt")
-temp_to_delete = os.path.join("${script_dir}", "to_delete.txt")
-
-# 获取现有的 .strm 文件目录结构
-def list_existing_files():
-    existing_files = []
-    for root, _, files in os.walk(strm_save_path):
-        for file in files:
-            if file.endswith('.strm'):
-                existing_files.append(os.path.join(root, file))
-    with open(temp_existing_structure, 'w', encoding='utf-8') as f:
-        f.writelines(f"{line}\n" for line in existing_files)
-
-# 处理生成目录结构
-def process_directory_structure():
-    with open(generated_directory_file, 'r', encoding='utf-8') as file, open(temp_new_structure, 'w', encoding='utf-8') as new_structure_file:
-        for line in file:
-            line = line.strip()
-            if line.count('/') < exclude_option + 1:
-                continue
-
-            adjusted_path = '/'.join(line.split('/')[exclude_option + 1:])
-            if adjusted_path.split('.')[-1].lower() in media_extensions:
-                new_structure_file.write(adjusted_path + '\n')
-
-# 根据文件列表创建或更新 .strm 文件
-def create_strm_files():
-    total = 0
-    with open(temp_new_structure, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        total = len(lines)
-    
-    processed = 0
-    lock = threading.Lock()
-    with open(temp_to_create, 'w', encoding='utf-8') as to_create_file:
-        def process_line(line):
-            nonlocal processed
-            line = line.strip()
-            parent_path, file_name = os.path.split(line)
-            strm_file_path = os.path.join(strm_save_path, parent_path, f"{file_name}.strm")
-            os.makedirs(os.path.join(strm_save_path, parent_path), exist_ok=True)
-
-            if not os.path.exists(strm_file_path) or update_existing == 2:
-                encoded_path = urllib.parse.quote(line)
-                with open(strm_file_path, 'w', encoding='utf-8') as strm_file:
-                    strm_file.write(f"{alist_url}{encoded_path}")
-                to_create_file.write(strm_file_path + '\n')
-
-            with lock:
-                processed += 1
-                print(f"\r创建 .strm：{processed}/{total} ({processed / total:.2%})", end='')
-
-        with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as executor:
-            futures = [executor.submit(process_line, line) for line in lines]
-            for _ in as_completed(futures):
-                pass
-
-# 删除多余的 .strm 文件
-def delete_obsolete_files():
-    if delete_absent != 1:
-        return
-
-    with open(temp_existing_structure, 'r', encoding='utf-8') as existing_file:
-        existing_files = set(existing_file.read().splitlines())
-    with open(temp_new_structure, 'r', encoding='utf-8') as new_file:
-        new_files = {os.path.join(strm_save_path, '/'.join(path.split('/')[:-1]), path.split('/')[-1] + '.strm') for path in new_file.read().splitlines()}
-    
-    files_to_delete = existing_files - new_files
-    total = len(files_to_delete)
-    processed = 0
-    lock = threading.Lock()
-
-    with open(temp_to_delete, 'w', encoding='utf-8') as to_delete_file:
-        def process_deletion(file_path):
-            nonlocal processed
-            try:
-                os.remove(file_path)
-                to_delete_file.write(file_path + '\n')
-                parent_dir = os.path.dirname(file_path)
-                while parent_dir and parent_dir != strm_save_path:
-                    try:
-                        os.rmdir(parent_dir)
-                    except OSError:
-                        break
-                    parent_dir = os.path.dirname(parent_dir)
-            except OSError:
-                pass
-
-            with lock:
-                processed += 1
-                print(f"\r删除 .strm：{processed}/{total} ({processed / total:.2%})", end='')
-
-        with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as executor:
-            futures = [executor.submit(process_deletion, file_path) for file_path in files_to_delete]
-            for _ in as_completed(futures):
-                pass
-
-print("检测现有 .strm 文件...")
-list_existing_files()
-
-print("生成新的目录结构...")
-process_directory_structure()
-
-print("创建 .strm 文件...")
-create_strm_files()
-
-print("\n删除多余的 .strm 文件...")
-delete_obsolete_files()
-
-print("\n操作完成。")
-
-EOF
-
-    # 定义当前脚本的执行目录
-    script_dir=$(pwd)
-
-    # 清理临时文件
-    for temp_file in "existing_structure.txt" "new_structure.txt" "to_create.txt" "to_delete.txt"; do
-        temp_file_path="${script_dir}/${temp_file}"
-        if [ -f "$temp_file_path" ]; then
-            rm "$temp_file_path"
-            echo "已删除临时文件：'$temp_file_path'"
-        else
-            echo "没有检测到需要删除的文件：'$temp_file_path'"
-        fi
-    done
-
-    # 保存配置
-    save_config
+    # 提示是否使用生成记录
+    echo "是否使用生成记录，只写入新增或链接有变化的strm，并按记录删除多余文件，不再扫描strm目录（手动删除的strm不会被重新创建）（上次配置: ${use_manifest:-1}）：1. 使用 2. 不使用"
+    read -r input_use_manifest
+    use_manifest="${input_use_manifest:-$use_manifest}"
+    # 提示设置并行任务数和并行方式
+    echo "请输入并行任务数，0 为按 CPU 核心数自动设置（最多 32）（上次配置: ${strm_workers:-0}）："
+    read -r input_strm_workers
+    strm_workers="${input_strm_workers:-$strm_workers}"
+    echo "请选择并行方式（上次配置: ${strm_worker_mode:-1}）：1. 多线程（适合 NFS 等网络存储） 2. 多进程（适合本地磁盘）"
+    read -r input_strm_worker_mode
+    strm_worker_mode="${input_strm_worker_mode:-$strm_worker_mode}"
+
+    # 生成 .strm 文件：多线程或多进程写入，进度和运行报告由引擎输出；配置了 Emby 时通知 Emby 只刷新有变化的目录
+    engine_args=(strm)
+    if [ -n "$emby_url" ]; then
+        engine_args+=(notify)
+    fi
+    if [ "$strm_source" = "2" ]; then
+        engine_args+=(--tree "$directory_tree_file")
+    else
+        engine_args+=(--directory-file "$generated_directory_file")
+    fi
+    if [ -n "$download_started" ]; then
+        engine_args+=(--shell-stage "download,$download_started,$download_finished,$download_bytes")
+    fi
+    run_engine "${engine_args[@]}"
 }
 # 建立 alist 索引数据库的函数
 build_index_database() {
@@ -479,6 +366,7 @@ build_index_database() {
                 echo "文件不存在，请重新输入。"
                 return
             fi
+            db_file=$input_db_file
             break
             ;;
         *.db)
@@ -492,7 +380,7 @@ build_index_database() {
     done
 
     # 提示用户输入挂载路径信息
-    decoded_mount_path=$(python3 -c "import urllib.parse; print(urllib.parse.unquote('${mount_path}'))")
+    decoded_mount_path=$(url_decode "$mount_path")
     if [ -n "$decoded_mount_path" ]; then
         echo "请输入alist存储里对应的挂载路径信息，上次配置:${decoded_mount_path}，回车确认："
     else
@@ -519,128 +407,22 @@ build_index_database() {
     read -r input_exclude_option
     exclude_option=${input_exclude_option:-$exclude_option}
 
-    # 创建临时数据库文件以存储处理结果
-    temp_db_file=$(mktemp --suffix=.db)
-
-    python3 - <<EOF
-import sqlite3
-import os
-import time
-
-# 设置变量
-exclude_option = $exclude_option
-generated_directory_file = "$generated_directory_file"
-mount_path = "$mount_path"
-temp_db_file = "$temp_db_file"
-
-def is_directory(name):
-    # 判断路径是否为文件夹
-    return '.' not in name
-
-# 将数据插入到临时数据库中
-def insert_data_into_temp_db(file_path, db_path, exclude_level, mount_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # 创建表结构
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS x_search_nodes (
-        parent TEXT,
-        name TEXT,
-        is_dir INTEGER,
-        size INTEGER
-    )
-    ''')
-
-    with open(file_path, 'r', encoding='utf-8') as file:
-        total_lines = sum(1 for _ in file)
-        file.seek(0)
-        valid_lines = total_lines - exclude_level
-        processed_lines = 0
-        start_time = time.time()
-
-        for line in file:
-            line = line.rstrip()
-            path_parts = line.split('/')[exclude_level+1:]
-
-            if len(path_parts) < 1:
-                continue
-
-            # 新增目录层级加到剔除目录层级后的信息前面
-            parent = mount_path + '/' + '/'.join(path_parts[:-1])
-            name = path_parts[-1]
-            
-            is_dir = 1 if is_directory(name) else 0
-
-            # 插入数据到表中
-            cursor.execute('INSERT INTO x_search_nodes (parent, name, is_dir, size) VALUES (?, ?, ?, 0)', (parent, name, is_dir))
-            
-            processed_lines += 1
-            elapsed_time = time.time() - start_time
-            minutes, seconds = divmod(int(elapsed_time), 60)
-            progress_percentage = processed_lines / valid_lines if valid_lines else 0
-            print(f"\r总文件：{total_lines}，剔除数：{exclude_level}，有效数：{valid_lines}，已处理：{processed_lines}，进度：{progress_percentage:.2%}，耗时：{minutes:02}:{seconds:02}", end='')
-
-    print()  # 换行显示
-    conn.commit()
-    conn.close()
-
-insert_data_into_temp_db(generated_directory_file, temp_db_file, exclude_option, mount_path)
-EOF
-
-    echo "数据已处理完毕。请选择操作："
+    echo "请选择导入方式："
     echo "1: 新增到现有数据库索引表，如果你数据库已经有索引信息，选择1"
     echo "2: 替换现有数据库索引表，如果你数据库已经没有索引信息，选择2"
+    echo "3: 增量更新，只写入与上次导入相比有变化的索引，alist 运行中也可以使用"
 
     read -r db_choice
-
-    # 根据选择执行相应操作
     case $db_choice in
-    1)
-        # 新增数据到数据库
-        sqlite3 "$db_file" <<SQL
-ATTACH DATABASE '$temp_db_file' AS tempdb;
-INSERT INTO main.x_search_nodes (parent, name, is_dir, size)
-SELECT parent, name, is_dir, size FROM tempdb.x_search_nodes;
-DETACH DATABASE tempdb;
-
--- 去重逻辑
-DELETE FROM x_search_nodes 
-WHERE rowid NOT IN (
-    SELECT MIN(rowid)
-    FROM x_search_nodes
-    GROUP BY parent, name
-);
-SQL
-        ;;
-    2)
-        # 替换数据库表数据
-        sqlite3 "$db_file" <<SQL
-DELETE FROM x_search_nodes;
-ATTACH DATABASE '$temp_db_file' AS tempdb;
-INSERT INTO main.x_search_nodes (parent, name, is_dir, size)
-SELECT parent, name, is_dir, size FROM tempdb.x_search_nodes;
-DETACH DATABASE tempdb;
-SQL
-        ;;
+    1 | 2 | 3) ;;
     *)
         echo "无效的选项，操作已取消。"
-        rm "$temp_db_file"
         return
         ;;
     esac
 
-    # 在数据库中创建索引
-    sqlite3 "$db_file" <<SQL
-CREATE INDEX IF NOT EXISTS idx_x_search_nodes_parent ON x_search_nodes (parent);
-SQL
-
-    # 删除临时数据库文件
-    rm "$temp_db_file"
-    echo "操作完成，索引已更新。"
-
-    # 保存配置
-    save_config
+    # 读取目录文件并写入索引表，完成后在数据库中创建索引
+    run_engine index --directory-file "$generated_directory_file" --db-file "$db_file" --index-mode "$db_choice"
 }
 
 # 打印内置格式的函数
@@ -671,6 +453,8 @@ create_auto_update_script() {
         read -r script_dir
 
         mkdir -p "$script_dir"
+        # 定时任务的工作目录不固定，脚本中使用绝对路径
+        script_dir="$(cd "$script_dir" && pwd)"
 
         if [ -n "$directory_tree_file" ]; then
             echo "请输入目录树文件的路径或者下载链接，上次配置:${directory_tree_file}，回车确认："
@@ -707,106 +491,128 @@ create_auto_update_script() {
         read -r input_exclude_option
         exclude_option="${input_exclude_option:-$exclude_option}"
 
-        # 定义脚本内容
-        script_content="#!/bin/bash
-# 下载目录树文件
-curl -L -H 'Cache-Control: no-cache' -H 'Pragma: no-cache' \"$download_link?\$(date +%s)\" -o \"$script_dir/目录树.txt\"
-
-# 转换目录树为目录文件并生成 .strm 文件
-python3 -c \"
-import os
-import urllib.parse
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-def parse_directory_tree(file_path):
-    current_path_stack = []
-    directory_list_file = '$script_dir/目录文件.txt'
-
-    with open(file_path, 'rb') as file, open(directory_list_file, 'w', encoding='utf-8') as output_file:
-        content = file.read()
-        try:
-            content = content.decode('utf-16')
-        except UnicodeDecodeError:
-            content = content.decode('utf-8', errors='ignore')
-
-        for line in content.splitlines():
-            line = line.lstrip('\ufeff').rstrip()
-            line_depth = line.count('|')
-            item_name = line.split('|-')[-1].strip()
-            if not item_name:
-                continue
-            while len(current_path_stack) > line_depth:
-                current_path_stack.pop()
-            if len(current_path_stack) == line_depth:
-                if current_path_stack:
-                    current_path_stack.pop()
-            current_path_stack.append(item_name)
-            full_path = '/' + '/'.join(current_path_stack)
-            output_file.write(full_path + '\\n')
-
-# 处理每一行并生成 .strm 文件
-def process_line(line, media_extensions, exclude_option, alist_url, mount_path, strm_save_path):
-    line = line.rstrip()
-    line_depth = line.count('/')
-    if line_depth < exclude_option:
-        return
-    adjusted_path = '/'.join(line.split('/')[exclude_option:])
-    if not adjusted_path:
-        return
-    file_extension = adjusted_path.split('.')[-1].lower()
-    if file_extension not in media_extensions:
-        return
-    file_name = os.path.basename(adjusted_path)
-    parent_path = os.path.dirname(adjusted_path)
-    os.makedirs(os.path.join(strm_save_path, parent_path), exist_ok=True)
-    
-    encoded_path = urllib.parse.quote(f'd{mount_path}/{parent_path}/{file_name}')
-    strm_file_path = os.path.join(strm_save_path, parent_path, f'{file_name}.strm')
-    with open(strm_file_path, 'w', encoding='utf-8') as strm_file:
-        strm_file.write(f'{alist_url}{encoded_path}')
-
-# 创建 .strm 文件，使用多线程以提高效率
-def create_strm_files():
-    with open('$script_dir/目录文件.txt', 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-
-    media_extensions = {
-        'mp4', 'mkv', 'avi', 'mov', 'wmv', 'flv', 'webm', 'vob', 'mpg', 'mpeg',
-        'iso', 'img', 'dvd', 'ts', 'rm', 'rmvb', '3gp', 'dat', 'ogg', 'm2ts'
-    }
-
-    custom_extensions = set('$custom_extensions'.split())
-    media_extensions.update(custom_extensions)
-
-    exclude_option = $exclude_option + 1  # 增加一层
-    alist_url = '$alist_url'
-    mount_path = '$mount_path'
-    strm_save_path = '$strm_save_path'
-
-    # 使用线程池来并行化 .strm 文件的生成
-    max_workers = min(4, os.cpu_count() or 1)
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                process_line, line, media_extensions, exclude_option, 
-                alist_url, mount_path, strm_save_path
-            ) 
-            for line in lines
-        ]
-        # 确保所有任务完成
-        for _ in as_completed(futures):
-            pass
-
-# 解析目录树并创建 .strm 文件
-parse_directory_tree('$script_dir/目录树.txt')
-create_strm_files()
-\"
-
-echo \"strm文件已更新。\"
-"
+        echo "如需输出 Prometheus 指标（node_exporter 的 textfile collector），请输入指标文件的完整路径，例如 /var/lib/node_exporter/textfile/strm.prom，留空不输出，上次配置:${metrics_textfile}，回车确认："
+        read -r input_metrics_textfile
+        metrics_textfile="${input_metrics_textfile:-$metrics_textfile}"
+
+        # 自动更新脚本的配置单独保存一份，之后在菜单中修改配置不影响定时任务；
+        # 生成记录、变更记录和运行报告由处理引擎保存在这个配置文件旁边
         script_name="update-115-strm.sh"
-        echo "$script_content" >"$script_dir/$script_name"
+        update_config_file="$script_dir/update-115-strm.conf"
+        (
+            config_file="$update_config_file"
+            directory_tree_file="$download_link"
+            metrics_report="$script_dir/update-115-strm.report.json"
+            save_config
+        )
+
+        # 脚本开头记录配置文件、处理引擎和目录树的路径（按 shell 规则转义），其余内容固定不变
+        {
+            echo "#!/bin/bash"
+            printf 'config_file=%q\n' "$update_config_file"
+            printf 'engine_file=%q\n' "$engine_file"
+            printf 'tree_file=%q\n' "$script_dir/目录树.txt"
+            printf 'state_file=%q\n' "$script_dir/目录树.state"
+            cat <<'EOF'
+# 由 115-strm.sh 的自动更新功能生成：下载目录树，有变化时调用处理引擎 strm_engine.py 生成 .strm，
+# 配置了 Emby 时通知 Emby 刷新有变化的目录。配置保存在 config_file 中，可以直接修改
+export LANG=en_US.UTF-8
+export LC_ALL=en_US.UTF-8
 
+if [ ! -f "$config_file" ] || [ ! -f "$engine_file" ]; then
+    echo "配置文件或处理引擎不存在，请重新生成自动更新脚本：$config_file $engine_file"
+    exit 1
+fi
+# shellcheck source=/dev/null
+. "$config_file"
+
+# 上次成功更新时目录树的 ETag、Last-Modified 和内容摘要，用于判断目录树是否有变化
+tree_etag='' tree_last_modified='' tree_digest='' tree_signature=''
+if [ -f "$state_file" ]; then
+    # shellcheck source=/dev/null
+    . "$state_file"
+fi
+# 生成 .strm 用到的配置，配置有变化时总是完整更新一次
+new_tree_signature="$strm_save_path|$alist_url|$mount_path|$exclude_option|$custom_extensions|$strm_source"
+
+# 从 curl -D 保存的响应头中取出指定字段，跟随跳转时取最后一个响应中的值
+header_value() {
+    awk -v name="$1" '
+        BEGIN { name = tolower(name) ":" }
+        /^HTTP\// { value = "" }
+        tolower($1) == name { sub(/^[^:]*:[ \t]*/, ""); sub(/\r$/, ""); value = $0 }
+        END { print value }' "$2"
+}
+
+# 下载目录树文件，记录下载耗时写入运行报告
+# 上次的目录树还在且配置没有变化时发送条件请求，服务器返回 304 表示没有变化，不重新下载；
+# 返回 200 时比较内容的 sha256，与上次相同也视为没有变化。设置环境变量 FORCE_UPDATE=1 时总是完整更新
+conditional_headers=()
+if [ -f "$tree_file" ] && [ "$tree_signature" = "$new_tree_signature" ] && [ "${FORCE_UPDATE:-0}" != "1" ]; then
+    [ -n "$tree_etag" ] && conditional_headers+=(-H "If-None-Match: $tree_etag")
+    [ -n "$tree_last_modified" ] && conditional_headers+=(-H "If-Modified-Since: $tree_last_modified")
+else
+    tree_digest=''
+fi
+download_started=$(date +%s.%N)
+if ! http_code=$(curl -sS -L -H 'Cache-Control: no-cache' -H 'Pragma: no-cache' "${conditional_headers[@]}" -D "$tree_file.headers" -o "$tree_file.part" -w '%{http_code}' "$directory_tree_file?$(date +%s)"); then
+    http_code=000
+fi
+download_finished=$(date +%s.%N)
+download_bytes=0
+if [ "$http_code" = "304" ]; then
+    tree_changed=0
+    new_tree_etag="$tree_etag" new_tree_last_modified="$tree_last_modified" new_tree_digest="$tree_digest"
+    echo "目录树没有变化（HTTP 304），跳过下载。"
+elif [ "$http_code" = "200" ]; then
+    new_tree_etag=$(header_value ETag "$tree_file.headers")
+    new_tree_last_modified=$(header_value Last-Modified "$tree_file.headers")
+    new_tree_digest=$(sha256sum "$tree_file.part" | cut -d ' ' -f 1)
+    mv "$tree_file.part" "$tree_file"
+    if [ -n "$tree_digest" ] && [ "$new_tree_digest" = "$tree_digest" ]; then
+        tree_changed=0
+        echo "目录树内容没有变化，跳过更新。"
+    else
+        tree_changed=1
+        download_bytes=$(stat -c %s "$tree_file" 2>/dev/null)
+    fi
+else
+    rm -f "$tree_file.part" "$tree_file.headers"
+    echo "目录树下载失败（HTTP $http_code），本次没有更新。"
+    exit 1
+fi
+rm -f "$tree_file.part" "$tree_file.headers"
+
+# 转换目录树（流式模式不需要）并生成 .strm，按生成记录只写入有变化的文件、删除多余的文件；
+# 配置了 Emby 时按变更记录通知 Emby。目录树没有变化时不生成 .strm，只重试上次没有通知成功的变化并更新运行报告
+engine_args=(--tree "$tree_file")
+if [ "$strm_source" = "2" ]; then
+    engine_args+=(strm)
+else
+    engine_args+=(convert strm)
+fi
+if [ -n "$emby_url" ]; then
+    engine_args+=(notify)
+fi
+engine_args+=(--shell-stage "download,$download_started,$download_finished,$download_bytes")
+if [ "$tree_changed" = "0" ]; then
+    engine_args+=(--tree-unchanged)
+fi
+python3 "$engine_file" -c "$config_file" --name update-115-strm "${engine_args[@]}" || exit 1
+
+# 更新成功后保存目录树的下载状态，下次运行时用于判断是否有变化
+{
+    printf 'tree_etag=%q\n' "$new_tree_etag"
+    printf 'tree_last_modified=%q\n' "$new_tree_last_modified"
+    printf 'tree_digest=%q\n' "$new_tree_digest"
+    printf 'tree_signature=%q\n' "$new_tree_signature"
+} >"$state_file"
+
+if [ "$tree_changed" = "1" ]; then
+    echo "strm文件已更新。"
+fi
+EOF
+        } >"$script_dir/$script_name"
         chmod +x "$script_dir/$script_name"
         echo "自动更新脚本 $script_dir/$script_name 已生成，请添加到任务计划，可配置定时执行，在执行前，记得先到115生成目录树。"
 
@@ -950,75 +756,14 @@ download_specified_files() {
     interval_time="${interval_time:-3}"  # 默认值
     last_interval_time="$interval_time"  # 保存用户输入
 
-    while true; do
-        temp_download_list=$(mktemp)
-        
-        echo "正在扫描目录 $strm_directory 中的指定文件格式 .strm..."
-        find "$strm_directory" -type f -name "*.strm" >"$temp_download_list"
-
-        total_files=$(wc -l <"$temp_download_list")
-        if [ "$total_files" -eq 0 ]; then
-            echo "目录中没有发现任何带有指定格式的 .strm，请检查路径或文件内容。"
-            rm "$temp_download_list"
-            return
-        fi
-
-        # 下载指定格式的文件
-        downloaded_count=0
-        small_file_count=0
-        
-        while IFS= read -r strm_file; do
-            # 检查文件是否为用户指定的格式
-            url=$(cat "$strm_file")
-            file_extension=$(basename "$url" | awk -F. '{print tolower($NF)}')
-
-            if [[ " ${specified_formats[*]} " == *" $file_extension "* ]]; then
-                target_dir=$(dirname "$strm_file")
-                original_filename=$(basename "$strm_file" .strm)
-                target_file="$target_dir/$original_filename"
-
-                echo "正在下载文件：$url"
-                curl -L -o "$target_file" "$url"
-
-                if [ $? -eq 0 ]; then
-                    file_size=$(stat -c%s "$target_file")
-                    if [ "$file_size" -gt 1024 ]; then
-                        echo "文件下载完成：$target_file"
-                        rm "$strm_file"
-                        echo "已删除对应的 .strm 文件：$strm_file"
-                        downloaded_count=$((downloaded_count + 1))
-                        small_file_count=0  # 重置计数器
-                    else
-                        echo "文件下载失败（小于1KB），删除下载文件，保留 .strm 文件：$strm_file"
-                        rm "$target_file"
-                        small_file_count=$((small_file_count + 1))
-                    fi
-                else
-                    echo "文件下载失败：$url"
-                fi
-
-                # 如果连续5次小于1KB，等待1小时
-                if [ "$small_file_count" -ge 5 ]; then
-                    echo "连续5次下载文件小于1KB，等待1小时..."
-                    sleep 1h
-                    break
-                fi
-
-                # 等待设定的间隔时间
-                sleep "$interval_time"
-            else
-                echo "跳过非指定格式文件：$strm_file"
-            fi
-        done <"$temp_download_list"
-
-        echo "文件下载完成，共处理 $total_files 个 .strm 文件，成功下载 $downloaded_count 个文件。"
-        rm "$temp_download_list"
+    echo "请输入同时下载的连接数（上次配置: ${download_workers:-2}），回车确认："
+    read -r input_download_workers
+    download_workers="${input_download_workers:-$download_workers}"
+    download_workers="${download_workers:-2}"
+    save_config
 
-        # 如果没有连续小文件下载，正常退出循环
-        if [ "$small_file_count" -lt 5 ]; then
-            break
-        fi
-    done
+    # 下载：长连接复用、令牌桶限速、断点续传、自动识别风控返回的占位内容，任务状态保存在数据库中，中断后再次运行会继续
+    run_engine download
 }
 
 
@@ -1038,68 +783,13 @@ remove_file_extension() {
     done
     last_strm_directory="$strm_directory"  # 保存用户输入
 
-    echo "正在扫描目录 $strm_directory 中的所有 .strm 文件..."
-
-    # 存储冲突文件的映射
-    declare -A target_files
-    declare -a all_files
-    declare -a rename_operations
-
-    # 扫描 .strm 文件
-    while IFS= read -r -d '' strm_file; do
-        base_name=$(basename "$strm_file")
-        new_name=$(echo "$base_name" | sed 's/\.[^.]*\.strm$/\.strm/')
-        target_path="$(dirname "$strm_file")/$new_name"
-
-        all_files+=("$strm_file")
-        rename_operations+=("$strm_file -> $target_path")
-
-        # 如果文件名发生变化，记录潜在冲突
-        if [ "$base_name" != "$new_name" ]; then
-            if [ -n "${target_files[$target_path]}" ]; then
-                target_files["$target_path"]+=$'\n'"$strm_file"
-            else
-                target_files["$target_path"]="$strm_file"
-            fi
-        fi
-    done < <(find "$strm_directory" -type f -name "*.strm" -print0)
-
-    # 显示扫描结果
-    echo "扫描完毕。以下是即将执行的文件重命名操作："
-    echo "================================================================"
-    for operation in "${rename_operations[@]}"; do
-        echo "$operation"
-    done
-
-    # 检测冲突文件并优化输出
-    has_conflicts=false
-
-    if [ ${#target_files[@]} -gt 0 ]; then
-        for target in "${!target_files[@]}"; do
-            # 如果目标文件已存在，或者来自多个源文件
-            if [ -e "$target" ] || [[ "${target_files[$target]}" == *$'\n'* ]]; then
-                has_conflicts=true
-                break
-            fi
-        done
-    fi
-
-    if [ "$has_conflicts" = true ]; then
-        echo ""
-        echo "注意：以下文件重命名后会产生文件名冲突："
-        echo "================================================================"
-        for target in "${!target_files[@]}"; do
-            conflict_sources=$(echo -e "${target_files[$target]}")
-            if [ -e "$target" ] || [[ "$conflict_sources" == *$'\n'* ]]; then
-                echo "目标文件：$target"
-                echo "冲突文件："
-                echo "$conflict_sources" | while IFS= read -r line; do
-                    echo "  - $line"
-                done
-                echo "================================================================"
-            fi
-        done
-
+    # 扫描一次 .strm 目录，重命名计划写入文件，只列出冲突文件；有冲突时返回 3
+    run_engine rename --dry-run
+    case $? in
+    0)
+        user_choice=""
+        ;;
+    3)
         echo ""
         echo "请选择如何处理这些冲突文件："
         echo "1. 覆盖冲突文件"
@@ -1120,46 +810,92 @@ remove_file_extension() {
             return
             ;;
         esac
+        ;;
+    *)
+        echo "扫描失败，返回主菜单。"
+        return
+        ;;
+    esac
+
+    # 按扫描时写出的计划按目录并行改名，不再重新扫描
+    run_engine rename --plan ${user_choice:+--rename-conflict "$user_choice"}
+}
+
+# 设置 Emby 通知：生成 .strm 后按变更记录调用 Emby 的 /Library/Media/Updated，只刷新有变化的目录
+configure_emby_notify() {
+    echo "请输入 Emby 的地址+端口（例如：http://127.0.0.1:8096），输入 0 关闭通知，上次配置:${emby_url:-无}，回车确认："
+    read -r input_emby_url
+    if [ "$input_emby_url" = "0" ]; then
+        emby_url=""
+        save_config
+        echo "已关闭 Emby 通知。"
+        return
+    fi
+    emby_url="${input_emby_url:-$emby_url}"
+    if [ -z "$emby_url" ]; then
+        echo "没有输入 Emby 地址，返回。"
+        return
     fi
 
-    # 处理文件
-    echo "正在处理文件..."
-    for strm_file in "${all_files[@]}"; do
-        base_name=$(basename "$strm_file")
-        new_name=$(echo "$base_name" | sed 's/\.[^.]*\.strm$/\.strm/')
-        target_path="$(dirname "$strm_file")/$new_name"
-
-        if [ "$base_name" != "$new_name" ]; then
-            if [ -e "$target_path" ]; then
-                case $user_choice in
-                1) # 覆盖
-                    echo "覆盖文件：$target_path"
-                    mv -f "$strm_file" "$target_path"
-                    ;;
-                2) # 跳过
-                    echo "跳过文件：$base_name"
-                    ;;
-                3) # 自动重命名
-                    counter=1
-                    new_target_path="${target_path%.*}(${counter}).strm"
-                    while [ -e "$new_target_path" ]; do
-                        counter=$((counter + 1))
-                        new_target_path="${target_path%.*}(${counter}).strm"
-                    done
-                    echo "自动重命名文件为：$new_target_path"
-                    mv "$strm_file" "$new_target_path"
-                    ;;
-                esac
-            else
-                echo "重命名文件：$base_name 为 $new_name"
-                mv "$strm_file" "$target_path"
-            fi
-        else
-            echo "文件无需重命名：$base_name"
+    echo "请输入 Emby 的 API 密钥（在 设置-高级-API 密钥 中创建），上次配置:${emby_api_key:-无}，回车确认："
+    read -r input_emby_api_key
+    emby_api_key="${input_emby_api_key:-$emby_api_key}"
+
+    echo "请输入 Emby 中 .strm 保存目录的路径（例如 Docker 中挂载为 /media/strm），与本机路径相同请直接回车，上次配置:${emby_strm_path:-与本机相同}："
+    read -r input_emby_strm_path
+    emby_strm_path="${input_emby_strm_path:-$emby_strm_path}"
+
+    save_config
+    echo "Emby 通知已设置，生成 .strm 后会通知 Emby 刷新有变化的目录。"
+}
+
+# 批量处理多个目录树：任务文件中每个任务以 [名称] 开头，之后是覆盖本脚本配置的配置项，例如
+# [电影]
+# directory_tree_file="/root/电影_目录树.txt"
+# mount_path="/115/电影"
+# strm_save_path="/media/strm/电影"
+run_batch_jobs() {
+    echo "请输入批量任务文件的完整路径，上次配置:${batch_jobs_file:-无}，回车确认："
+    read -r input_batch_jobs_file
+    batch_jobs_file="${input_batch_jobs_file:-$batch_jobs_file}"
+    if [ ! -f "$batch_jobs_file" ]; then
+        echo "批量任务文件不存在，请重新输入。"
+        return
+    fi
+
+    engine_args=(--jobs "$batch_jobs_file")
+    if [ "$strm_source" != "2" ]; then
+        engine_args+=(convert)
+    fi
+    engine_args+=(strm)
+
+    echo "如需同时导入 alist 索引数据库，请输入alist的data.db文件的完整路劲（建议备份后操作），不导入请直接回车："
+    read -r input_db_file
+    if [ -n "$input_db_file" ]; then
+        if [ ! -f "$input_db_file" ]; then
+            echo "文件不存在，请重新输入。"
+            return
         fi
-    done
+        echo "请选择导入方式："
+        echo "1: 新增到现有数据库索引表"
+        echo "2: 替换现有数据库索引表，替换为全部任务的目录"
+        echo "3: 增量更新，只写入与上次导入相比有变化的索引，alist 运行中也可以使用"
+        read -r db_choice
+        case $db_choice in
+        1 | 2 | 3) ;;
+        *)
+            echo "无效的选项，操作已取消。"
+            return
+            ;;
+        esac
+        engine_args+=(index --db-file "$input_db_file" --index-mode "$db_choice")
+    fi
+    if [ -n "$emby_url" ]; then
+        engine_args+=(notify)
+    fi
 
-    echo "文件处理完成。"
+    # 各任务并行解析目录树，.strm 共用一个线程池写入，同一个数据库的索引在一个事务中写入
+    run_engine "${engine_args[@]}"
 }
 
 # 主循环，持续显示菜单并处理用户输入
@@ -1202,12 +938,20 @@ while true; do
                 # 执行去除文件格式的功能
                 remove_file_extension
                 ;;
+            2)
+                # 设置生成 .strm 后通知 Emby
+                configure_emby_notify
+                ;;
+            3)
+                # 批量处理多个目录树
+                run_batch_jobs
+                ;;
             0)
                 # 返回主菜单
                 break
                 ;;
             *)
-                echo "无效的选项，请输入 0 或 1。"
+                echo "无效的选项，请输入 0、1、2 或 3。"
                 ;;
             esac
         done
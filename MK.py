@@ -1,9 +1,19 @@
+import argparse
 import csv
 import logging
+import queue
 import re
+import sqlite3
+import threading
 import time
 import os
+from urllib.parse import urlsplit
+import urllib3
 from bs4 import BeautifulSoup
+try:
+    import lxml.html as lxml_html
+except ImportError:  # 没有安装 lxml 时只用 BeautifulSoup 提取
+    lxml_html = None
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -11,27 +21,57 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("crawler.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
+# 浏览器和 HTTP 请求共用的 User-Agent
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+
+# 精简模式下按扩展名屏蔽的请求：图片、音视频和字体，页面只需要 HTML 和脚本就能显示内容
+LEAN_BLOCKED_EXTENSIONS = ("jpg", "jpeg", "png", "gif", "webp", "bmp", "svg", "ico",
+                           "mp4", "webm", "m3u8", "mp3", "woff", "woff2", "ttf", "otf", "eot")
+
+# 页面及其资源实际传输的字节数，从缓存读取的资源为 0（其他站点的资源没有 Timing-Allow-Origin 时也为 0）
+TRANSFER_SIZE_SCRIPT = (
+    "return performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'))"
+    ".reduce(function (total, entry) { return total + (entry.transferSize || 0); }, 0);"
 )
 
-# 全局变量：存储已处理的 URL
-url_index = set()
+def add_phase(timing, phase, started):
+    """把从 started 到现在的耗时累加到 timing[phase]，重试时各次相加"""
+    timing[phase] = timing.get(phase, 0) + time.time() - started
 
-def setup_driver():
-    """配置 Selenium WebDriver"""
+def page_transfer_size(driver):
+    """当前页面的传输字节数，取不到时返回 None"""
+    try:
+        return int(driver.execute_script(TRANSFER_SIZE_SCRIPT) or 0)
+    except Exception:
+        return None
+
+def setup_driver(lean=False, profile_dir=None, site_host=None):
+    """
+    配置 Selenium WebDriver
+    :param lean: 精简模式：DOM 加载完成即返回，不加载图片、音视频和字体
+    :param profile_dir: 浏览器配置和缓存目录，保留 Cookie 和缓存；为 None 时每次使用新的配置
+    :param site_host: 精简模式下只允许访问的站点（包括同一域名的子域名），其他站点的广告、统计等请求都被屏蔽
+    """
     try:
         options = Options()
         options.add_argument("--headless")
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36")
+        options.add_argument(f"user-agent={USER_AGENT}")
+        if lean:
+            # 不等待图片等资源，DOM 加载完成后 driver.get 即返回，之后由 WebDriverWait 等待需要的内容
+            options.page_load_strategy = "eager"
+            options.add_argument("--blink-settings=imagesEnabled=false")
+            options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+            if site_host:
+                site_domain = ".".join(site_host.split(".")[-2:])
+                options.add_argument(f"--host-resolver-rules=MAP * ~NOTFOUND, EXCLUDE {site_host}, "
+                                     f"EXCLUDE {site_domain}, EXCLUDE *.{site_domain}")
+        if profile_dir:
+            # 同一个配置目录同时只能由一个浏览器使用，每个浏览器使用自己的目录
+            os.makedirs(profile_dir, exist_ok=True)
+            options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+            options.add_argument(f"--disk-cache-dir={os.path.abspath(os.path.join(profile_dir, 'cache'))}")
 
         # 动态设置 chromedriver 路径和日志路径
         chromedriver_path = "/usr/bin/chromedriver" if os.name != "nt" else "C:\\path\\to\\chromedriver.exe"
@@ -39,32 +79,50 @@ def setup_driver():
 
         service = Service(chromedriver_path, log_path=log_path)
         driver = webdriver.Chrome(service=service, options=options)
+        if lean:
+            # 图片已在启动参数中关闭，音视频和字体按扩展名屏蔽（带查询参数的 URL 也屏蔽）
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {
+                "urls": [f"*.{extension}{suffix}" for extension in LEAN_BLOCKED_EXTENSIONS for suffix in ("", "?*")]
+            })
         logging.info("Selenium WebDriver 初始化成功。")
         return driver
     except Exception as e:
         logging.error(f"Selenium WebDriver 初始化失败: {e}")
         raise
 
-def fetch_html_with_selenium(url, driver, max_retries=3):
-    """获取 HTML 内容"""
+def fetch_html_with_selenium(url, driver, max_retries=3, first_visit=True, timing=None):
+    """
+    获取 HTML 内容，first_visit 为 False 时不再点击按钮（同一浏览器只需点击一次）
+    timing 为 dict 时累加各阶段的耗时（navigate、enter、wait），并记录尝试次数和传输字节数
+    """
+    timing = {} if timing is None else timing
     for attempt in range(max_retries):
+        timing["attempts"] = attempt + 1
         try:
             # 访问目标网页
+            started = time.time()
             driver.get(url)
+            add_phase(timing, "navigate", started)
             logging.info(f"尝试 {attempt + 1}/{max_retries}: 正在访问URL: {url}")
 
-            # 等待按钮加载完成并点击
-            try:
-                wait = WebDriverWait(driver, 10)
-                enter_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "enter-btn")))
-                logging.info(f"尝试 {attempt + 1}/{max_retries}: 找到按钮并准备点击...")
-                enter_button.click()
-                logging.info("按钮已点击。")
-            except Exception:
-                logging.warning(f"尝试 {attempt + 1}/{max_retries}: 未找到或无法点击按钮")
-                raise  # 继续抛出异常以触发重试
+            # 等待按钮加载完成并点击；使用保存的浏览器配置时可能已经点击过，内容已经出现时不需要再点击
+            if first_visit and not driver.find_elements(By.XPATH, "//a[contains(text(), '.torrent')]"):
+                started = time.time()
+                try:
+                    wait = WebDriverWait(driver, 10)
+                    enter_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "enter-btn")))
+                    logging.info(f"尝试 {attempt + 1}/{max_retries}: 找到按钮并准备点击...")
+                    enter_button.click()
+                    logging.info("按钮已点击。")
+                except Exception:
+                    logging.warning(f"尝试 {attempt + 1}/{max_retries}: 未找到或无法点击按钮")
+                    raise  # 继续抛出异常以触发重试
+                finally:
+                    add_phase(timing, "enter", started)
 
             # 等待页面加载完成
+            started = time.time()
             try:
                 wait = WebDriverWait(driver, 15)
                 torrent_link = wait.until(EC.presence_of_element_located((By.XPATH, "//a[contains(text(), '.torrent')]")))
@@ -72,8 +130,11 @@ def fetch_html_with_selenium(url, driver, max_retries=3):
             except Exception:
                 logging.warning(f"尝试 {attempt + 1}/{max_retries}: 页面内容加载超时或未找到 .torrent 字段")
                 raise  # 继续抛出异常以触发重试
+            finally:
+                add_phase(timing, "wait", started)
 
             html_content = driver.page_source
+            timing["bytes"] = page_transfer_size(driver)
             return html_content
         except Exception as e:
             logging.error(f"尝试 {attempt + 1}/{max_retries} 失败: {e}")
@@ -106,8 +167,8 @@ def extract_date(soup):
         logging.error(f"提取发表时间失败: {e}")
         return "N/A"
 
-def extract_data(html_content, url):
-    """解析 HTML 并提取数据"""
+def extract_data_with_soup(html_content, url):
+    """解析 HTML 并提取数据（BeautifulSoup，在整个页面中查找）"""
     try:
         soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -142,164 +203,743 @@ def extract_data(html_content, url):
         logging.error(f"数据提取失败: {e}")
         return None
 
-def load_url_index(index_file="url_index.csv"):
-    """加载 URL 索引文件到内存"""
-    global url_index
-    try:
-        with open(index_file, mode="r", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            url_index = {row[0] for row in reader}
-            logging.info(f"成功加载 URL 索引文件，共 {len(url_index)} 条记录。")
-    except FileNotFoundError:
-        logging.warning("未找到 URL 索引文件，初始化为空集合。")
-        url_index = set()
+# 第一楼的 div id 为 post_数字，字段都在这一楼中
+POST_ID_PATTERN = re.compile(r"post_\d+$")
 
-def is_duplicate(url):
-    """检查 URL 是否已存在"""
-    if url in url_index:
-        logging.info(f"URL 已处理过，跳过: {url}")
-        return True
-    return False
+# 文字字段及其标签
+FIELD_LABELS = {"title": ("影片名称",), "type": ("是否有码",), "size": ("影片容量",)}
 
-def update_url_index(urls, index_file="url_index.csv"):
-    """更新 URL 索引文件"""
-    global url_index
-    new_urls = []
+def single_string(element):
+    """与 BeautifulSoup 的 tag.string 相同：只有一个子节点时取其文本，否则为 None"""
+    while True:
+        if len(element) == 0:
+            return element.text
+        if len(element) > 1 or element.text or element[0].tail:
+            return None
+        element = element[0]
 
-    for url in urls:
-        if url not in url_index:
-            new_urls.append(url)
-            url_index.add(url)
+def stripped_text(element):
+    """与 BeautifulSoup 的 get_text(strip=True) 相同"""
+    return "".join(text.strip() for text in element.itertext())
 
-    if new_urls:
-        with open(index_file, mode="a", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            writer.writerows([[url] for url in new_urls])
-        logging.info(f"成功更新 URL 索引文件，新增 {len(new_urls)} 条记录。")
+def extract_date_fast(em_tag):
+    """与 extract_date 的规则相同，em_tag 为发表时间所在的 em 标签"""
+    if em_tag is None:
+        return "N/A"
+    em_text = stripped_text(em_tag).replace("发表于", "").strip()
+    if re.match(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}", em_text):
+        return em_text
+    for span_tag in em_tag.iter("span"):
+        title = span_tag.get("title")
+        if title and "-" in title:
+            return title.strip()
+    return "N/A"
+
+def find_fields(element, found):
+    """在 element 中按文档顺序查找 found 中还没有的字段，找到的是每个字段第一次出现的位置"""
+    for child in element.iter("em", "a", "div"):
+        tag = child.tag
+        if tag == "em":
+            if "em" not in found and (child.get("id") or "").startswith("authorposton"):
+                found["em"] = child
+        elif tag == "a":
+            if "torrent" not in found:
+                text = single_string(child)
+                if text and ".torrent" in text:
+                    found["torrent"] = child
+        elif "magnet" not in found and "blockcode" in (child.get("class") or "").split():
+            found["magnet"] = child
+        if "em" in found and "torrent" in found and "magnet" in found:
+            break
+
+    # 影片名称等文字字段在同一次文本遍历中取出
+    if all(key in found for key in FIELD_LABELS):
+        return
+    for text in element.itertext():
+        for key, names in FIELD_LABELS.items():
+            if key not in found and any(name in text for name in names):
+                found[key] = text
+        if all(key in found for key in FIELD_LABELS):
+            break
+
+def extract_data_fast(html_content, url):
+    """
+    用 lxml 解析一次页面，先在第一楼中一次遍历取出所有字段，
+    第一楼中没有的字段再在整个页面中查找，结果与 extract_data_with_soup 相同
+    """
+    root = lxml_html.document_fromstring(html_content)
+
+    post = root
+    for div in root.iter("div"):
+        if POST_ID_PATTERN.match(div.get("id") or ""):
+            post = div
+            break
+
+    found = {}
+    find_fields(post, found)
+    if post is not root and len(found) < len(FIELD_LABELS) + 3:
+        find_fields(root, found)
+    em_tag, torrent_tag, magnet_tag = found.get("em"), found.get("torrent"), found.get("magnet")
+
+    date = extract_date_fast(em_tag)
+
+    number = single_string(torrent_tag).strip()[:-8] if torrent_tag is not None else "N/A"
+    title_text, type_text, size_text = found.get("title"), found.get("type"), found.get("size")
+    title = title_text.split("：")[1].strip() if title_text and "：" in title_text else "N/A"
+    type_value = type_text.split("：")[1].strip() if type_text and "：" in type_text else "N/A"
+    size = size_text.split("：")[1].strip() if size_text and "：" in size_text else "N/A"
+
+    magnet_li = next(magnet_tag.iter("li"), None) if magnet_tag is not None else None
+    magnet = stripped_text(magnet_li).lower() if magnet_li is not None else "N/A"
+
+    return {
+        "date": date,
+        "number": number,
+        "title": title,
+        "size": size,
+        "type": type_value,
+        "magnet": magnet,
+        "LINK": url
+    }
 
-def update_csv(data_list, csv_file, insert_mode=False):
-    """更新 CSV 文件"""
+def extract_data(html_content, url):
+    """解析 HTML 并提取数据：优先用 lxml 快速提取，出错时退回 BeautifulSoup"""
+    if lxml_html is not None:
+        try:
+            data = extract_data_fast(html_content, url)
+        except Exception:
+            pass
+        else:
+            logging.info(f"成功提取数据: 编号={data['number']}, 标题={data['title']}, 容量={data['size']}, 类型={data['type']}, 磁力链接={data['magnet']}")
+            return data
+    return extract_data_with_soup(html_content, url)
+
+# 抓取队列：每个 URL 的状态（待处理、处理中、已完成、失败）、尝试次数和下次重试时间保存在 SQLite 中，
+# 查重走磁盘上的唯一索引，内存占用不随历史记录增长；中断后重新运行会从中断处继续
+class CrawlFrontier:
+    def __init__(self, db_file, max_attempts=5, retry_delay=300, max_retry_delay=86400):
+        self.db_file = db_file
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # 待抓取的 URL 在浏览器池的线程中读取，结果在主线程中写入
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS frontier (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_retry_at REAL DEFAULT 0,
+            updated REAL,
+            message TEXT
+        )
+        """)
+        # 待处理的 next_retry_at 为 0，按输入顺序排在前面；彻底失败的为 NULL，不再参与调度
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_frontier_due ON frontier (status, next_retry_at, id)")
+        # 上次运行中断时正在处理的 URL 重新放回待处理
+        cursor = self.conn.execute("UPDATE frontier SET status = 'pending' WHERE status = 'in_progress'")
+        if cursor.rowcount:
+            logging.info(f"上次运行中断，{cursor.rowcount} 个正在处理的 URL 已重新加入队列。")
+        self.conn.commit()
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM frontier LIMIT 1").fetchone() is None
+
+    def import_index(self, index_file):
+        """导入旧版脚本的 URL 索引文件，其中的 URL 都记为已完成"""
+        try:
+            with open(index_file, mode="r", encoding="utf-8") as file:
+                with self.lock:
+                    before = self.conn.total_changes
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO frontier (url, status, next_retry_at) VALUES (?, 'done', NULL)",
+                        ((row[0],) for row in csv.reader(file) if row)
+                    )
+                    self.conn.commit()
+                    added = self.conn.total_changes - before
+            logging.info(f"已从 {index_file} 导入 {added} 条 URL 记录到 {self.db_file}。")
+        except FileNotFoundError:
+            pass
+
+    def add_urls(self, urls):
+        """加入新的 URL，已有的 URL（无论什么状态）不会重复加入，返回新加入的数量"""
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO frontier (url) VALUES (?)", ((url,) for url in urls))
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    def due_count(self):
+        """现在可以抓取的 URL 数量（待处理和到了重试时间的失败 URL）"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM frontier WHERE status IN ('pending', 'failed') AND next_retry_at <= ?",
+                (time.time(),)
+            ).fetchone()[0]
+
+    def iter_due(self, batch_size=200):
+        """逐批取出现在可以抓取的 URL，取出时标记为处理中"""
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT id, url FROM frontier WHERE status IN ('pending', 'failed') AND next_retry_at <= ? "
+                    "ORDER BY next_retry_at, id LIMIT ?",
+                    (time.time(), batch_size)
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE frontier SET status = 'in_progress', updated = ? WHERE id = ?",
+                    ((time.time(), row[0]) for row in rows)
+                )
+                self.conn.commit()
+            if not rows:
+                return
+            for _, url in rows:
+                yield url
+
+    def mark_done(self, urls):
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE frontier SET status = 'done', next_retry_at = NULL, updated = ?, message = NULL WHERE url = ?",
+                ((time.time(), url) for url in urls)
+            )
+            self.conn.commit()
+
+    def mark_failed(self, url, message):
+        """记录一次失败并按指数退避安排下次重试，达到最大尝试次数时返回 True"""
+        with self.lock:
+            row = self.conn.execute("SELECT attempts FROM frontier WHERE url = ?", (url,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            given_up = attempts >= self.max_attempts
+            next_retry_at = None if given_up else time.time() + min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+            self.conn.execute(
+                "UPDATE frontier SET status = 'failed', attempts = ?, next_retry_at = ?, updated = ?, message = ? WHERE url = ?",
+                (attempts, next_retry_at, time.time(), message, url)
+            )
+            self.conn.commit()
+        if given_up:
+            logging.error(f"URL 已失败 {attempts} 次，不再重试（运行时加 --retry-failed 可重新加入抓取队列）: {url}")
+        else:
+            logging.info(f"URL 第 {attempts} 次失败，将在 {int(next_retry_at - time.time())} 秒后重试: {url}")
+        return given_up
+
+    def retry_failed(self):
+        """把已达到最大尝试次数、不再重试的 URL 重新放回待处理，尝试次数从头计算，返回数量"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE frontier SET status = 'pending', attempts = 0, next_retry_at = 0, updated = ?, message = NULL "
+                "WHERE status = 'failed' AND next_retry_at IS NULL",
+                (time.time(),)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+
+    def summary(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM frontier GROUP BY status").fetchall())
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# 结果数据库：magnet 建唯一索引，查重和追加都不需要读取已有数据
+class ResultStore:
     fieldnames = ["NO.", "date", "number", "title", "size", "type", "magnet", "LINK"]
 
-    # 读取现有的 CSV 数据
-    existing_data = []
-    try:
-        with open(csv_file, mode="r", encoding="utf-8") as file:
-            reader = csv.DictReader(file)
-            existing_data = list(reader)
-    except FileNotFoundError:
-        logging.warning("未找到 CSV 文件，初始化为空列表。")
-
-    # 去重：确保新数据不会重复插入
-    seen_magnets = {data["magnet"] for data in existing_data}
-    filtered_new_data = []
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            number TEXT,
+            title TEXT,
+            size TEXT,
+            type TEXT,
+            magnet TEXT NOT NULL,
+            link TEXT
+        )
+        """)
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_results_magnet ON results (magnet)")
+        self.conn.commit()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def insert(self, data):
+        """写入一条记录，magnet 已存在时返回 False"""
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO results (date, number, title, size, type, magnet, link) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (data["date"], data["number"], data["title"], data["size"], data["type"], data["magnet"], data["LINK"])
+        )
+        return cursor.rowcount > 0
+
+    def add(self, data_list):
+        """逐条写入，magnet 重复的记录单独跳过，返回实际写入的条数"""
+        added = 0
+        for data in data_list:
+            if self.insert(data):
+                added += 1
+            else:
+                logging.info(f"发现重复数据，跳过写入: URL={data['LINK']}, Magnet={data['magnet']}")
+        self.conn.commit()
+        return added
 
-    for data in data_list:
-        if data["magnet"] in seen_magnets:
-            logging.info(f"发现重复数据，跳过写入: URL={data['LINK']}, Magnet={data['magnet']}")
-            return False
+    def import_csv(self, csv_file):
+        """导入旧版脚本写出的 CSV，文件中靠前的记录较新，因此倒序写入"""
+        existing_data = []
+        try:
+            with open(csv_file, mode="r", encoding="utf-8") as file:
+                existing_data = list(csv.DictReader(file))
+        except FileNotFoundError:
+            return
+        added = sum(1 for data in reversed(existing_data) if self.insert(data))
+        self.conn.commit()
+        if added:
+            logging.info(f"已从 {csv_file} 导入 {added} 条记录到 {self.db_file}。")
+
+    def export_csv(self, csv_file):
+        """导出为带编号的 CSV，新的记录在前"""
+        temp_file = csv_file + ".tmp"
+        count = 0
+        with open(temp_file, mode="w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.fieldnames)
+            rows = self.conn.execute(
+                "SELECT date, number, title, size, type, magnet, link FROM results ORDER BY id DESC"
+            )
+            for count, row in enumerate(rows, start=1):
+                writer.writerow((count,) + row)
+        os.replace(temp_file, csv_file)
+        logging.info(f"成功导出 CSV 文件 {csv_file}，共 {count} 条记录。")
+
+    def close(self):
+        self.conn.close()
+
+# 页面中出现 .torrent 链接说明内容已加载完成（与 fetch_html_with_selenium 等待的条件一致）
+PAGE_READY_PATTERN = re.compile(r"<a\b[^>]*>[^<]*\.torrent", re.I)
+
+# 直接用 HTTP 获取页面：连接保持复用、支持 gzip，复用浏览器点击按钮后得到的 Cookie
+class HttpFetcher:
+    def __init__(self, per_host_limit=2, timeout=15):
+        self.pool = urllib3.PoolManager(
+            maxsize=per_host_limit,
+            timeout=urllib3.Timeout(connect=5, read=timeout),
+            retries=urllib3.Retry(total=2, redirect=5, backoff_factor=1),
+        )
+        self.cookies = {}
+        self.lock = threading.Lock()
+
+    def update_cookies(self, url, driver):
+        """保存浏览器中的 Cookie，之后同一站点的请求都带上"""
+        try:
+            cookies = driver.get_cookies()
+        except Exception:
+            return
+        cookie_header = "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+        with self.lock:
+            self.cookies[urlsplit(url).netloc] = cookie_header
+
+    def fetch(self, url):
+        """返回页面 HTML；请求失败或页面中没有 .torrent 字段时返回 None，由浏览器重新获取"""
+        headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+        with self.lock:
+            cookie_header = self.cookies.get(urlsplit(url).netloc)
+        if cookie_header:
+            headers["Cookie"] = cookie_header
+        try:
+            response = self.pool.request("GET", url, headers=headers)
+        except Exception as e:
+            logging.warning(f"HTTP 请求失败，改用浏览器获取: {url} ({e})")
+            return None
+        if response.status != 200:
+            logging.warning(f"HTTP 状态码 {response.status}，改用浏览器获取: {url}")
+            return None
+
+        # 编码优先取响应头，其次取页面 meta 中的 charset
+        match = re.search(r"charset=([\w-]+)", response.headers.get("Content-Type", ""))
+        if match:
+            charset = match.group(1)
         else:
-            filtered_new_data.append(data)
+            match = re.search(rb"charset=[\"']?([\w-]+)", response.data[:4096])
+            charset = match.group(1).decode("ascii") if match else "utf-8"
+        try:
+            html_content = response.data.decode(charset, errors="replace")
+        except LookupError:
+            html_content = response.data.decode("utf-8", errors="replace")
+
+        if not PAGE_READY_PATTERN.search(html_content):
+            logging.info(f"页面中没有 .torrent 字段，改用浏览器获取: {url}")
+            return None
+        return html_content
 
-    # 如果没有新数据需要写入，直接返回
-    if not filtered_new_data:
-        logging.info("没有新数据需要写入，退出更新操作。")
+def is_driver_alive(driver):
+    """检查浏览器是否仍可用，浏览器崩溃或会话失效时访问 current_url 会抛出异常"""
+    try:
+        driver.current_url
+        return True
+    except Exception:
         return False
 
-    # 合并数据
-    if insert_mode:
-        updated_data = filtered_new_data + existing_data  # 插入模式：新数据在前
-    else:
-        updated_data = existing_data + filtered_new_data  # 顺序模式：新数据在后
+# 每个 URL 各阶段的耗时：http 直接获取、navigate 打开页面、enter 点击按钮、wait 等待内容、parse 解析，
+# 逐行追加到 CSV，结束时按获取方式汇总；汇总只保存耗时，不保存 URL
+class CrawlTimings:
+    phases = ["http", "navigate", "enter", "wait", "parse"]
+    fieldnames = ["time", "url", "mode", "path", "status", "attempts", "bytes"] + phases + ["total"]
+
+    def __init__(self, csv_file, mode):
+        self.csv_file = csv_file
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.stats = {}
+        self.file = open(csv_file, mode="a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(self.fieldnames)
+
+    def begin(self, url):
+        """开始处理一个 URL，返回由抓取线程填写的耗时记录"""
+        timing = {}
+        with self.lock:
+            self.pending[url] = timing
+        return timing
+
+    def finish(self, url, status, parse_seconds=None):
+        """URL 处理结束（在主线程中调用），写出一行并计入汇总；total 为获取的总耗时（含排队和重试等待）加解析耗时"""
+        with self.lock:
+            timing = self.pending.pop(url, None)
+        if timing is None:
+            return
+        if parse_seconds is not None:
+            timing["parse"] = parse_seconds
+        timing["total"] = timing.get("fetch", 0) + timing.get("parse", 0)
+        path = timing.get("path", "none")
+        self.writer.writerow(
+            [time.strftime("%Y-%m-%d %H:%M:%S"), url, self.mode, path, status, timing.get("attempts", 0), timing.get("bytes", "")]
+            + [f"{timing[key]:.3f}" if key in timing else "" for key in self.phases + ["total"]]
+        )
+        self.file.flush()
+
+        stats = self.stats.setdefault(path, {})
+        for key in self.phases + ["total", "bytes"]:
+            if timing.get(key) is not None:
+                stats.setdefault(key, []).append(timing[key])
+
+    def log_summary(self):
+        """按获取方式输出页数、各阶段耗时的平均值、p50 和 p90，以及平均传输量"""
+        logging.info(f"各 URL 的耗时已写入 {self.csv_file}（{self.mode} 模式）。")
+        for path, stats in self.stats.items():
+            parts = []
+            for key in self.phases + ["total"]:
+                values = sorted(stats.get(key, []))
+                if values:
+                    p50 = values[min(len(values) - 1, int(len(values) * 0.5))]
+                    p90 = values[min(len(values) - 1, int(len(values) * 0.9))]
+                    parts.append(f"{key} 平均 {sum(values) / len(values):.2f} 秒 p50 {p50:.2f} p90 {p90:.2f}")
+            if stats.get("bytes"):
+                parts.append(f"平均传输 {sum(stats['bytes']) / len(stats['bytes']) / 1024:.0f} KB")
+            logging.info(f"耗时汇总 [{self.mode}/{path}] {len(stats.get('total', []))} 页：" + "，".join(parts))
+
+    def close(self):
+        self.file.close()
+
+# 浏览器池：多个 WebDriver 并行抓取，共用一个 URL 队列
+class BrowserPool:
+    """
+    并行抓取页面
+    :param size: 浏览器数量
+    :param per_host_limit: 同一站点同时打开的页面数上限
+    :param http_first: 是否先直接用 HTTP 获取页面，取不到时再用浏览器
+    :param lean: 精简模式，见 setup_driver
+    :param block_third_party: 精简模式下是否屏蔽其他站点的请求
+    :param profile_dir: 浏览器配置和缓存的上级目录，每个浏览器使用其中的一个子目录；为 None 时每次使用新的配置
+    :param timings: CrawlTimings，记录每个 URL 各阶段的耗时
+    """
+
+    def __init__(self, size=4, per_host_limit=2, http_first=True, lean=False, block_third_party=True,
+                 profile_dir=None, timings=None):
+        self.size = size
+        self.per_host_limit = per_host_limit
+        self.tasks = None
+        self.results = queue.Queue()
+        self.host_slots = {}
+        self.host_lock = threading.Lock()
+        self.processed = 0
+        self.total = 0
+        self.counter_lock = threading.Lock()
+        self.http = HttpFetcher(per_host_limit) if http_first else None
+        self.path_counts = {"http": 0, "browser": 0}
+        self.lean = lean
+        self.block_third_party = block_third_party
+        self.profile_dir = profile_dir
+        self.timings = timings
+
+    def host_slot(self, url):
+        """取得 URL 所在站点的并发名额"""
+        host = urlsplit(url).netloc
+        with self.host_lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.host_slots[host]
+
+    def start_driver(self, worker_name, url):
+        site_host = urlsplit(url).hostname if self.lean and self.block_third_party else None
+        profile_dir = os.path.join(self.profile_dir, worker_name) if self.profile_dir else None
+        try:
+            return setup_driver(self.lean, profile_dir, site_host)
+        except Exception:
+            logging.error(f"{worker_name}: 浏览器启动失败，该线程退出。")
+            return None
+
+    def fetch_with_http(self, url, timing):
+        if not self.http:
+            return None
+        with self.host_slot(url):
+            started = time.time()
+            html_content = self.http.fetch(url)
+            add_phase(timing, "http", started)
+            return html_content
 
-    # 重新编号
-    for i, data in enumerate(updated_data, start=1):
-        data["NO."] = str(i)
+    def put_result(self, url, html_content, timing, started):
+        """把结果交给主线程，并记录获取的总耗时"""
+        timing["fetch"] = time.time() - started
+        self.results.put((url, html_content))
+
+    def count_path(self, path):
+        with self.counter_lock:
+            self.path_counts[path] += 1
+
+    def worker(self, worker_name):
+        # 浏览器在第一次需要时才启动，HTTP 能取到的页面不会用到浏览器
+        driver = None
+        driver_host = None
+        # 每个浏览器只需要在第一次访问时点击一次按钮
+        first_visit = True
+        try:
+            while True:
+                url = self.tasks.get()
+                if url is None:
+                    break
+                with self.counter_lock:
+                    self.processed += 1
+                    logging.info(f"正在处理URL ({self.processed}/{self.total}): {url}")
+
+                timing = self.timings.begin(url) if self.timings else {}
+                started = time.time()
+                html_content = self.fetch_with_http(url, timing)
+                if html_content:
+                    self.count_path("http")
+                    timing["path"] = "http"
+                    self.put_result(url, html_content, timing, started)
+                    continue
+                timing["path"] = "browser"
+
+                # 精简模式只允许访问启动浏览器时的站点，换了站点时重新启动浏览器
+                host = urlsplit(url).hostname
+                if driver is not None and self.lean and self.block_third_party and host != driver_host:
+                    try:
+                        driver.quit()
+                    except Exception:
+                        pass
+                    driver = None
+
+                if driver is None:
+                    driver = self.start_driver(worker_name, url)
+                    driver_host = host
+                    first_visit = True
+                    if not driver:
+                        self.put_result(url, None, timing, started)
+                        break
+
+                # 浏览器崩溃时重建，并在新浏览器上重试一次当前 URL
+                for _ in range(2):
+                    with self.host_slot(url):
+                        html_content = fetch_html_with_selenium(url, driver, first_visit=first_visit, timing=timing)
+                    if html_content:
+                        first_visit = False
+                        self.count_path("browser")
+                        # 浏览器点击按钮后的 Cookie 交给 HTTP 请求复用
+                        if self.http:
+                            self.http.update_cookies(url, driver)
+                        break
+                    if is_driver_alive(driver):
+                        break
+                    logging.warning(f"{worker_name}: 浏览器已崩溃，重新启动...")
+                    try:
+                        driver.quit()
+                    except Exception:
+                        pass
+                    driver = self.start_driver(worker_name, url)
+                    first_visit = True
+                    if not driver:
+                        break
+                self.put_result(url, html_content, timing, started)
+                if not driver:
+                    break
+        finally:
+            if driver:
+                driver.quit()
+            self.results.put(None)  # 通知主线程该线程已退出
+
+    def run(self, urls, total=None):
+        """
+        按完成顺序产出 (url, html_content)，获取失败时 html_content 为 None
+        urls 可以是生成器，在单独的线程中边读取边分发，total 为 URL 总数（用于显示进度）
+        """
+        self.total = len(urls) if total is None else total
+        # 队列有上限，生成器不会一次读出全部 URL
+        self.tasks = queue.Queue(maxsize=self.size * 4)
+        worker_count = max(1, min(self.size, self.total))
+
+        def feed():
+            for url in urls:
+                self.tasks.put(url)
+            for _ in range(worker_count):
+                self.tasks.put(None)
+
+        threading.Thread(target=feed, daemon=True).start()
+        for index in range(worker_count):
+            threading.Thread(target=self.worker, args=(f"浏览器{index + 1}",), daemon=True).start()
+
+        finished_workers = 0
+        while finished_workers < worker_count:
+            result = self.results.get()
+            if result is None:
+                finished_workers += 1
+                continue
+            yield result
+
+        unprocessed = self.total - self.processed
+        if unprocessed > 0:
+            logging.error(f"所有浏览器均已退出，仍有 {unprocessed} 个 URL 未处理。")
+        logging.info(f"抓取完成：HTTP 直接获取 {self.path_counts['http']} 页，浏览器获取 {self.path_counts['browser']} 页。")
 
-    # 写入 CSV 文件
-    with open(csv_file, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(updated_data)
+def setup_logging():
+    """配置日志；在 main() 中调用，其他脚本导入本文件时不会创建 crawler.log"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler("crawler.log", encoding="utf-8"),
+            logging.StreamHandler()
+        ]
+    )
 
-    logging.info(f"成功更新 CSV 文件，共写入 {len(updated_data)} 条记录。")
-    return True
 
 def main():
+    setup_logging()
+    parser = argparse.ArgumentParser(description="抓取页面中的磁力链接")
+    parser.add_argument("command", nargs="?", default="crawl", choices=["crawl", "export"],
+                        help="crawl 抓取（默认）；export 把结果数据库导出为带编号的 CSV，新的记录在前")
+    parser.add_argument("--full", action="store_true",
+                        help="加载完整页面（不使用精简模式），用于和精简模式对比每页的耗时和传输量")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="把已达到最大尝试次数、不再重试的 URL 重新加入抓取队列，例如网站临时故障之后")
+    args = parser.parse_args()
+
     input_csv = "input.csv"
-    output_csv = "output.csv"
-    index_file = "url_index.csv"  # URL 索引文件
+    output_csv = "output.csv"  # 由结果数据库导出
+    db_file = "output.db"  # 结果数据库
+    index_file = "url_index.csv"  # 旧版的 URL 索引文件，第一次运行时导入抓取队列
+    frontier_db = "url_index.db"  # 抓取队列
+    profile_dir = "chrome_profile"  # 浏览器配置和缓存目录，保留 Cookie 和缓存，下次运行不用重新点击按钮；设为 None 时每次使用新的配置
+    timings_csv = "crawl_timings.csv"  # 每个 URL 各阶段的耗时
     batch_size = 1  # 示例：单条写入
+    browser_count = 4  # 并行的浏览器数量
+    per_host_limit = 2  # 同一站点同时打开的页面数上限
+    http_first = True  # 先直接用 HTTP 获取页面，取不到时再用浏览器
+    lean_mode = not args.full  # 精简模式：DOM 加载完成即返回，不加载图片、音视频和字体
+    block_third_party = True  # 精简模式下屏蔽其他站点的请求（广告、统计等），页面依赖其他站点的脚本时改为 False
+    export_after_crawl = True  # 抓取结束后导出一次 CSV
+    max_attempts = 5  # 每个 URL 最多尝试的次数
+    retry_delay = 300  # 第一次失败后等待多少秒重试，之后每次翻倍
+
+    # 打开结果数据库，第一次运行时导入旧版的 CSV
+    store = ResultStore(db_file)
+    if store.count() == 0:
+        store.import_csv(output_csv)
+
+    if args.command == "export":
+        store.export_csv(output_csv)
+        store.close()
+        return
 
-    # 加载 URL 索引文件
-    load_url_index(index_file)
+    # 打开抓取队列，第一次运行时导入旧版的 URL 索引文件
+    frontier = CrawlFrontier(frontier_db, max_attempts=max_attempts, retry_delay=retry_delay)
+    if frontier.is_empty():
+        frontier.import_index(index_file)
+    if args.retry_failed:
+        logging.info(f"已将 {frontier.retry_failed()} 个不再重试的 URL 重新加入抓取队列。")
 
-    # 判断 output.csv 是否为空，并初始化 insert_mode
-    insert_mode = False
-    try:
-        with open(output_csv, mode="r", encoding="utf-8") as file:
-            reader = csv.DictReader(file)
-            existing_data = list(reader)
-            insert_mode = len(existing_data) > 0  # 如果有数据，则启用插入模式
-    except FileNotFoundError:
-        logging.warning("未找到 output.csv 文件，初始化为空。")
-        insert_mode = False  # 如果文件为空，则按顺序写入
-
-    urls = []
+    # 读取输入文件，新的 URL 加入抓取队列（已处理过的 URL 不会重复加入）
     try:
         with open(input_csv, mode="r", encoding="utf-8") as file:
             reader = csv.DictReader(file)
             if "URL" not in reader.fieldnames:
                 logging.error("输入文件缺少 'URL' 列，请检查文件格式。")
                 return
-            urls = [row["URL"] for row in reader]
+            added = frontier.add_urls(row["URL"] for row in reader if row["URL"])
+            logging.info(f"输入文件中新增 {added} 个 URL。")
     except FileNotFoundError:
         logging.error(f"未找到输入文件 {input_csv}，请检查文件路径。")
         return
 
-    if not urls:
-        logging.warning("未找到任何URL，请检查输入的CSV文件。")
+    due_count = frontier.due_count()
+    if not due_count:
+        logging.info(f"没有需要抓取的URL，抓取队列状态: {frontier.summary()}")
         return
 
-    # 初始化 WebDriver
-    driver = setup_driver()
-    try:
-        batch_data = []
-        for i, url in enumerate(urls):
-            logging.info(f"正在处理URL ({i + 1}/{len(urls)}): {url}")
-
-            # 检查是否重复（基于 URL 字段）
-            if is_duplicate(url):
-                continue
-
-            html_content = fetch_html_with_selenium(url, driver)
-            if not html_content:
-                logging.error(f"无法获取HTML内容，跳过URL: {url}")
-                continue
-
-            data = extract_data(html_content, url)
-            if not data:
-                logging.error(f"数据提取失败，跳过URL: {url}")
-                continue
-
-            batch_data.append(data)
-
-            # 如果达到批量大小，则写入 CSV 文件
-            if len(batch_data) >= batch_size:
-                success = update_csv(batch_data, output_csv, insert_mode=insert_mode)
-                if success:
-                    update_url_index([data["LINK"] for data in batch_data], index_file)
-                    logging.info(f"已写入 {batch_size} 条数据到 {output_csv} 文件中！")
-                batch_data.clear()
-
-        # 写入剩余数据（如果有）
-        if batch_data:
-            success = update_csv(batch_data, output_csv, insert_mode=insert_mode)
-            if success:
-                update_url_index([data["LINK"] for data in batch_data], index_file)
-                logging.info(f"已写入剩余 {len(batch_data)} 条数据到 {output_csv} 文件中！")
-    finally:
-        driver.quit()
+    # 多个浏览器并行抓取，抓取结果统一在主线程中提取和写入
+    timings = CrawlTimings(timings_csv, "lean" if lean_mode else "full")
+    pool = BrowserPool(size=browser_count, per_host_limit=per_host_limit, http_first=http_first, lean=lean_mode,
+                       block_third_party=block_third_party, profile_dir=profile_dir, timings=timings)
+    batch_data = []
+    for url, html_content in pool.run(frontier.iter_due(), total=due_count):
+        if not html_content:
+            logging.error(f"无法获取HTML内容，跳过URL: {url}")
+            timings.finish(url, "fetch_failed")
+            frontier.mark_failed(url, "无法获取HTML内容")
+            continue
+
+        started = time.time()
+        data = extract_data(html_content, url)
+        parse_seconds = time.time() - started
+        if not data:
+            logging.error(f"数据提取失败，跳过URL: {url}")
+            timings.finish(url, "extract_failed", parse_seconds)
+            frontier.mark_failed(url, "数据提取失败")
+            continue
+
+        timings.finish(url, "ok", parse_seconds)
+        batch_data.append(data)
+
+        # 如果达到批量大小，则写入结果数据库（重复的记录逐条跳过，URL 都记为已完成）
+        if len(batch_data) >= batch_size:
+            added = store.add(batch_data)
+            frontier.mark_done([data["LINK"] for data in batch_data])
+            logging.info(f"已写入 {added} 条数据到 {db_file} 中！")
+            batch_data.clear()
+
+    # 写入剩余数据（如果有）
+    if batch_data:
+        added = store.add(batch_data)
+        frontier.mark_done([data["LINK"] for data in batch_data])
+        logging.info(f"已写入剩余 {added} 条数据到 {db_file} 中！")
+
+    logging.info(f"抓取队列状态: {frontier.summary()}")
+    frontier.close()
+    timings.log_summary()
+    timings.close()
+
+    if export_after_crawl:
+        store.export_csv(output_csv)
+    store.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# 批量处理性能测试：对比逐个目录树运行 strm_engine.py 和用 --jobs 一次处理全部目录树的总耗时
+#
+# 按 --sizes 生成多个模拟目录树，两种方式都执行 convert、strm、index（增量更新，导入同一个 data.db），
+# 各自在独立的目录中运行，结束后核对两边生成的 .strm 和索引表是否一致。
+# 批量处理的总耗时应接近最大的一个目录树单独处理的耗时（解析需要多个 CPU 核心才能并行）。
+#
+# 用法：
+#   python3 benchmarks/bench_batch.py
+#   python3 benchmarks/bench_batch.py --sizes 100k,300k,1m --worker-mode 2
+import argparse
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+ENGINE = os.path.join(REPO_DIR, "strm_engine.py")
+sys.path.insert(0, BENCH_DIR)
+from gen_tree import generate_tree, parse_size  # noqa: E402
+
+MOUNT_PATH = "/bench"
+ALIST_URL = "http://127.0.0.1:5244/"
+
+
+def create_db(db_path):
+    """与 alist 相同的索引表"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE x_search_nodes (parent TEXT, name TEXT, is_dir NUMERIC, size INTEGER)")
+    conn.commit()
+    conn.close()
+
+
+def write_config(path, values):
+    with open(path, "w", encoding="utf-8") as file:
+        for key, value in values.items():
+            file.write(f"{key}='{value}'\n")
+
+
+def job_values(name, tree_file, work_dir):
+    return {
+        "directory_tree_file": tree_file,
+        "mount_path": f"{MOUNT_PATH}/{name}",
+        "strm_save_path": os.path.join(work_dir, "strm", name),
+    }
+
+
+def run_engine(config_file, *args):
+    """运行一次引擎，返回耗时（秒）"""
+    start_time = time.time()
+    subprocess.run([sys.executable, ENGINE, "-c", config_file, "convert", "strm", "index", *args],
+                   check=True, stdout=subprocess.DEVNULL)
+    return time.time() - start_time
+
+
+def digest_strm(strm_dir):
+    """.strm 目录的摘要：按相对路径排序后计算路径和内容的 sha256"""
+    files = []
+    for root, _, names in os.walk(strm_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, strm_dir), path))
+    digest = hashlib.sha256()
+    for relative_path, path in sorted(files):
+        digest.update(relative_path.encode("utf-8"))
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return len(files), digest.hexdigest()
+
+
+def digest_db(db_path):
+    conn = sqlite3.connect(db_path)
+    digest = hashlib.sha256()
+    count = 0
+    for row in conn.execute("SELECT parent, name, is_dir FROM x_search_nodes ORDER BY parent, name"):
+        digest.update(repr(row).encode("utf-8"))
+        count += 1
+    conn.close()
+    return count, digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量处理性能测试")
+    parser.add_argument("--sizes", default="50k,100k,200k", help="各目录树的条目数，逗号分隔，默认 50k,100k,200k")
+    parser.add_argument("--worker-mode", choices=("1", "2"), default="1", help="写 .strm 的并行方式：1 多线程 2 多进程，默认 1")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，默认 1")
+    args = parser.parse_args()
+
+    sizes = [parse_size(size.strip()) for size in args.sizes.split(",")]
+    with tempfile.TemporaryDirectory(prefix="115-bench-batch-") as temp_dir:
+        base_values = {"alist_url": ALIST_URL, "exclude_option": "1", "index_mode": "3",
+                       "delete_absent": "1", "strm_worker_mode": args.worker_mode}
+        trees = []
+        print("生成目录树...", file=sys.stderr)
+        for index, size in enumerate(sizes):
+            name = f"tree{index + 1}"
+            tree_file = os.path.join(temp_dir, f"{name}_目录树.txt")
+            generate_tree(tree_file, size, seed=args.seed + index)
+            trees.append((name, size, tree_file))
+
+        # 逐个运行：每个目录树单独一个配置文件，依次导入同一个 data.db
+        serial_dir = os.path.join(temp_dir, "serial")
+        os.makedirs(serial_dir)
+        create_db(os.path.join(serial_dir, "data.db"))
+        serial_times = []
+        for name, _, tree_file in trees:
+            config_file = os.path.join(serial_dir, f"{name}.conf")
+            write_config(config_file, dict(base_values, db_file=os.path.join(serial_dir, "data.db"),
+                                           **job_values(name, tree_file, serial_dir)))
+            serial_times.append(run_engine(config_file))
+
+        # 批量处理：一个配置文件加一个批量任务文件
+        batch_dir = os.path.join(temp_dir, "batch")
+        os.makedirs(batch_dir)
+        create_db(os.path.join(batch_dir, "data.db"))
+        config_file = os.path.join(batch_dir, "batch.conf")
+        jobs_file = os.path.join(batch_dir, "jobs.conf")
+        write_config(config_file, dict(base_values, db_file=os.path.join(batch_dir, "data.db")))
+        with open(jobs_file, "w", encoding="utf-8") as file:
+            for name, _, tree_file in trees:
+                file.write(f"[{name}]\n")
+                for key, value in job_values(name, tree_file, batch_dir).items():
+                    file.write(f'{key}="{value}"\n')
+        batch_time = run_engine(config_file, "--jobs", jobs_file)
+
+        strm_same = digest_strm(os.path.join(serial_dir, "strm")) == digest_strm(os.path.join(batch_dir, "strm"))
+        db_same = digest_db(os.path.join(serial_dir, "data.db")) == digest_db(os.path.join(batch_dir, "data.db"))
+
+    print(f"CPU 核心数：{os.cpu_count()}")
+    for (name, size, _), elapsed in zip(trees, serial_times):
+        print(f"{name:<8} {size:>10} 条  单独运行 {elapsed:>7.2f} 秒")
+    print(f"逐个运行合计 {sum(serial_times):>7.2f} 秒，最大的目录树 {max(serial_times):>7.2f} 秒")
+    print(f"批量处理     {batch_time:>7.2f} 秒")
+    print(f"结果核对：.strm {'一致' if strm_same else '不一致'}，索引表 {'一致' if db_same else '不一致'}")
+    return 0 if strm_same and db_same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# 删除多余 .strm 的比较方式性能测试：对比集合差集（两边全部读入内存）和 strm_engine.py 的外部排序归并比较
+#
+# 先用模拟目录树生成本次的文件列表，再随机去掉约 5% 并加入约 5% 已不存在的文件作为现有的 .strm 列表。
+# 每种方式在单独的子进程中运行，分别统计耗时和内存峰值，并核对两种方式得出的待创建、待删除文件是否一致。
+#
+# 用法：
+#   python3 benchmarks/bench_diff.py
+#   python3 benchmarks/bench_diff.py --sizes 100k,1m,5m
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+from gen_tree import generate_tree, parse_size  # noqa: E402
+from strm_engine import ExternalSorter, iter_directory_tree, merge_diff, sort_key  # noqa: E402
+
+METHODS = ("set", "merge")
+
+
+def iter_lines(path):
+    with open(path, "r", encoding="utf-8", newline="\n") as file:
+        for line in file:
+            yield line[:-1]
+
+
+def digest(lines):
+    """与顺序无关的摘要：(行数, 各行哈希之和)"""
+    count = total = 0
+    for line in lines:
+        count += 1
+        total += int.from_bytes(hashlib.md5(line.encode("utf-8")).digest()[:8], "little")
+    return count, total % (1 << 64)
+
+
+def diff_with_set(new_file, existing_file):
+    new_paths = set(iter_lines(new_file))
+    existing_paths = set(iter_lines(existing_file))
+    return new_paths - existing_paths, existing_paths - new_paths
+
+
+def diff_with_merge(new_file, existing_file, temp_dir):
+    sorters = []
+    for name, path in (("new", new_file), ("existing", existing_file)):
+        sorter = ExternalSorter(temp_dir, name)
+        for line in iter_lines(path):
+            sorter.add(sort_key(line))
+        sorters.append(sorter)
+    to_create_file = os.path.join(temp_dir, "to_create.txt")
+    to_delete_file = os.path.join(temp_dir, "to_delete.txt")
+    with open(to_create_file, "w", encoding="utf-8", newline="\n") as to_create, \
+            open(to_delete_file, "w", encoding="utf-8", newline="\n") as to_delete:
+        for kind, key in merge_diff(*sorters):
+            if kind != "unchanged":
+                parent_path, _, file_name = key.partition("\0")
+                path = f"{parent_path}/{file_name}" if parent_path else file_name
+                (to_create if kind == "create" else to_delete).write(f"{path}\n")
+    return iter_lines(to_create_file), iter_lines(to_delete_file)
+
+
+def run_worker(method, new_file, existing_file, temp_dir):
+    """在子进程中运行一种比较方式，把结果以 JSON 输出到标准输出"""
+    start_time = time.time()
+    if method == "set":
+        to_create, to_delete = diff_with_set(new_file, existing_file)
+    else:
+        to_create, to_delete = diff_with_merge(new_file, existing_file, temp_dir)
+    elapsed = time.time() - start_time
+    # 摘要不计入耗时（合并方式的结果在文件中，逐行读取）
+    print(json.dumps({"elapsed": elapsed, "create": digest(to_create), "delete": digest(to_delete)}))
+    return 0
+
+
+def write_lists(tree_file, new_file, existing_file, seed):
+    """写出本次的文件列表和模拟的现有 .strm 列表，返回 (本次数量, 现有数量)"""
+    rng = random.Random(seed)
+    new_count = existing_count = 0
+    with open(new_file, "w", encoding="utf-8", newline="\n") as new_output, \
+            open(existing_file, "w", encoding="utf-8", newline="\n") as existing_output:
+        for path in iter_directory_tree(tree_file):
+            new_output.write(f"{path}\n")
+            new_count += 1
+            roll = rng.random()
+            if roll >= 0.05:
+                existing_output.write(f"{path}\n")
+                existing_count += 1
+            if roll >= 0.95:
+                existing_output.write(f"{path}.old\n")
+                existing_count += 1
+    return new_count, existing_count
+
+
+def run_method(method, new_file, existing_file, temp_dir):
+    """运行一种比较方式，返回 (结果, 内存峰值 MB)"""
+    work_dir = tempfile.mkdtemp(prefix=f"{method}-", dir=temp_dir)
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--worker", method, new_file, existing_file, work_dir],
+        stdout=subprocess.PIPE,
+    )
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+    if process.returncode != 0:
+        raise RuntimeError(f"{method} 执行失败（退出码 {process.returncode}）")
+    return json.loads(output), usage.ru_maxrss / 1024
+
+
+def main():
+    if len(sys.argv) == 6 and sys.argv[1] == "--worker":
+        return run_worker(*sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description="删除多余 .strm 的比较方式性能测试")
+    parser.add_argument("--sizes", default="100k,1m", help="目录树条目数，逗号分隔，默认 100k,1m")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，默认 1")
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'条目数':>10} {'方式':<6} {'耗时(秒)':>9} {'内存峰值(MB)':>12} {'待创建':>8} {'待删除':>8}")
+    for size in args.sizes.split(","):
+        with tempfile.TemporaryDirectory(prefix="115-bench-diff-") as temp_dir:
+            tree_file = os.path.join(temp_dir, "bench_目录树.txt")
+            generate_tree(tree_file, parse_size(size.strip()), seed=args.seed)
+            new_file = os.path.join(temp_dir, "new.txt")
+            existing_file = os.path.join(temp_dir, "existing.txt")
+            new_count, _ = write_lists(tree_file, new_file, existing_file, args.seed)
+            results = {}
+            for method in METHODS:
+                result, peak_rss_mb = run_method(method, new_file, existing_file, temp_dir)
+                results[method] = result
+                print(f"{new_count:>10} {method:<6} {result['elapsed']:>9.2f} {peak_rss_mb:>12.1f} "
+                      f"{result['create'][0]:>8} {result['delete'][0]:>8}")
+            if results["set"]["create"] != results["merge"]["create"] or results["set"]["delete"] != results["merge"]["delete"]:
+                print(f"  不一致：{new_count} 个条目时两种方式的结果不同", file=sys.stderr)
+                mismatches += 1
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
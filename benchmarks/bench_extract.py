@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# 页面提取性能测试：用保存的帖子页面对比 extract_data（lxml 快速提取）和 extract_data_with_soup（原来的 BeautifulSoup 提取）
+#
+# 每个页面先逐个字段核对两种提取结果是否一致，再分别统计单页耗时。
+# 需要安装 beautifulsoup4，lxml 未安装时 extract_data 会直接退回 BeautifulSoup。
+#
+# 用法：
+#   python3 benchmarks/bench_extract.py
+#   python3 benchmarks/bench_extract.py --crawlers MK.py,S --repeat 200
+#   python3 benchmarks/bench_extract.py --fixtures /path/to/saved/pages
+import argparse
+import glob
+import importlib.machinery
+import importlib.util
+import logging
+import os
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_crawler(path):
+    """按文件路径加载爬虫脚本（S 没有 .py 扩展名），不会执行其中的 main()"""
+    module_name = "crawler_" + os.path.basename(path).replace(".", "_")
+    loader = importlib.machinery.SourceFileLoader(module_name, path)
+    spec = importlib.util.spec_from_loader(module_name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def time_per_page(func, html_content, url, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func(html_content, url)
+    return (time.perf_counter() - start_time) / repeat * 1000
+
+
+def compare(crawler, name, html_content, url):
+    """返回不一致的字段列表 [(字段, 原结果, 新结果)]"""
+    expected = crawler.extract_data_with_soup(html_content, url)
+    actual = crawler.extract_data(html_content, url)
+    if expected is None or actual is None:
+        return [] if expected == actual else [("*", expected, actual)]
+    return [(key, expected.get(key), actual.get(key)) for key in expected if expected.get(key) != actual.get(key)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="页面提取性能测试")
+    parser.add_argument("--crawlers", default="MK.py,u2.py,S", help="要测试的爬虫脚本，逗号分隔，默认 MK.py,u2.py,S")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="保存的帖子页面所在目录，默认 benchmarks/fixtures")
+    parser.add_argument("--repeat", type=int, default=50, help="每个页面重复提取的次数，默认 50")
+    args = parser.parse_args()
+
+    # 测试时不输出爬虫脚本的日志
+    logging.disable(logging.CRITICAL)
+
+    fixtures = sorted(glob.glob(os.path.join(args.fixtures, "*.html")))
+    if not fixtures:
+        print(f"没有找到页面文件：{args.fixtures}", file=sys.stderr)
+        return 1
+    pages = []
+    for path in fixtures:
+        with open(path, "r", encoding="utf-8") as file:
+            pages.append((os.path.basename(path), file.read()))
+
+    mismatches = 0
+    print(f"{'脚本':<8} {'页面':<26} {'一致':<4} {'soup(毫秒)':>10} {'快速(毫秒)':>10} {'加速':>6}")
+    for crawler_name in args.crawlers.split(","):
+        crawler = load_crawler(os.path.join(REPO_DIR, crawler_name.strip()))
+        if crawler.lxml_html is None:
+            print(f"{crawler_name}：未安装 lxml，extract_data 与原提取方式相同", file=sys.stderr)
+        total_soup = total_fast = 0.0
+        for name, html_content in pages:
+            url = f"http://example/{name}"
+            differences = compare(crawler, name, html_content, url)
+            for key, expected, actual in differences:
+                print(f"  不一致：{crawler_name} {name} {key}：原={expected!r} 新={actual!r}")
+            mismatches += len(differences)
+            soup_ms = time_per_page(crawler.extract_data_with_soup, html_content, url, args.repeat)
+            fast_ms = time_per_page(crawler.extract_data, html_content, url, args.repeat)
+            total_soup += soup_ms
+            total_fast += fast_ms
+            print(f"{crawler_name:<8} {name:<26} {'是' if not differences else '否':<4} "
+                  f"{soup_ms:>10.2f} {fast_ms:>10.2f} {soup_ms / fast_ms:>5.1f}x")
+        print(f"{crawler_name:<8} {'平均':<26} {'':<4} {total_soup / len(pages):>10.2f} "
+              f"{total_fast / len(pages):>10.2f} {total_soup / total_fast:>5.1f}x")
+
+    if mismatches:
+        print(f"共有 {mismatches} 个字段不一致", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
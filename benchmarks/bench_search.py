@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# alist 搜索延迟测试：用模拟目录树生成 data.db，按 alist 的查询方式重放常见的搜索，对比整理索引前后的 p50/p99 延迟
+#
+# 整理前只有 alist 自己建立的 parent 索引；整理后为 strm_engine.py 导入索引时建立的全部索引，并执行过 ANALYZE。
+# 查询类型：
+#   search_root  在整个网盘中按名称关键字搜索（COUNT 加第一页，按名称排序）
+#   search_sub   在某个分类目录下按名称关键字搜索
+#   list         列出一个目录下的全部条目
+#   lookup       按目录和名称查找一个条目（alist 删除节点、增量更新时使用）
+#
+# 用法：
+#   python3 benchmarks/bench_search.py
+#   python3 benchmarks/bench_search.py --rows 5m --queries 100
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+from gen_tree import generate_tree, parse_size  # noqa: E402
+from strm_engine import PathTrie, insert_data_into_temp_db, maintain_search_indexes  # noqa: E402
+
+MOUNT_PATH = "/bench"
+# 剔除 "我的资源" 这一层
+EXCLUDE_OPTION = 1
+PAGE_SIZE = 100
+
+
+def where_in_parent(parent):
+    """与 alist 相同：根目录不限制，其他目录匹配自身和所有子目录"""
+    if parent == "/":
+        return "1 = 1", []
+    return "(parent LIKE ? OR parent = ?)", [parent + "/%", parent]
+
+
+def query_search(conn, parent, keyword):
+    where, args = where_in_parent(parent)
+    args.append(f"%{keyword}%")
+    conn.execute(f"SELECT COUNT(*) FROM x_search_nodes WHERE {where} AND name LIKE ?", args).fetchone()
+    conn.execute(f"SELECT parent, name, is_dir, size FROM x_search_nodes WHERE {where} AND name LIKE ? "
+                 f"ORDER BY name ASC LIMIT {PAGE_SIZE}", args).fetchall()
+
+
+def query_list(conn, parent):
+    conn.execute("SELECT parent, name, is_dir, size FROM x_search_nodes WHERE parent = ?", (parent,)).fetchall()
+
+
+def query_lookup(conn, parent, name):
+    conn.execute("SELECT parent, name, is_dir, size FROM x_search_nodes WHERE parent = ? AND name = ?", (parent, name)).fetchall()
+
+
+def build_queries(db_path, count, seed):
+    """从库中随机抽取目录和名称，组成各类型的查询 [(类型, 函数, 参数)]"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    total = conn.execute("SELECT MAX(rowid) FROM x_search_nodes").fetchone()[0]
+    samples = []
+    while len(samples) < count:
+        row = conn.execute("SELECT parent, name FROM x_search_nodes WHERE rowid = ?", (rng.randint(1, total),)).fetchone()
+        if row:
+            samples.append(row)
+    categories = [row[0] for row in conn.execute("SELECT DISTINCT parent FROM x_search_nodes WHERE parent LIKE ? LIMIT 20",
+                                                  (MOUNT_PATH + "/%",)) if row[0].count("/") == 2]
+    conn.close()
+
+    # 关键字取名称中的两个字符，与在 alist 中输入剧名的一部分相同
+    keywords = []
+    for _, name in samples:
+        start = rng.randint(0, max(0, len(name) - 2))
+        keywords.append(name[start:start + 2])
+    queries = []
+    for index in range(count):
+        parent, name = samples[index]
+        queries.append(("search_root", query_search, ("/", keywords[index])))
+        queries.append(("search_sub", query_search, (rng.choice(categories or [MOUNT_PATH]), keywords[index])))
+        queries.append(("list", query_list, (parent,)))
+        queries.append(("lookup", query_lookup, (parent, name)))
+    return queries
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_queries(db_path, queries, repeat):
+    """先完整执行一遍预热缓存，再把每个查询执行 repeat 次取最短耗时，返回 {类型: [毫秒]}"""
+    conn = sqlite3.connect(db_path)
+    for _, func, args in queries:
+        func(conn, *args)
+    latencies = {}
+    for kind, func, args in queries:
+        best = None
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            func(conn, *args)
+            elapsed = (time.perf_counter() - start_time) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        latencies.setdefault(kind, []).append(best)
+    conn.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="alist 搜索延迟测试")
+    parser.add_argument("--rows", default="1m", help="目录树条目数，例如 1m、5m，默认 1m")
+    parser.add_argument("--queries", type=int, default=50, help="每种查询的次数，默认 50")
+    parser.add_argument("--repeat", type=int, default=3, help="每个查询重复执行的次数，取最短耗时，默认 3")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，默认 1")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="115-bench-search-") as temp_dir:
+        tree_file = os.path.join(temp_dir, "bench_目录树.txt")
+        db_path = os.path.join(temp_dir, "data.db")
+        print("生成目录树和 data.db...", file=sys.stderr)
+        generate_tree(tree_file, parse_size(args.rows), seed=args.seed)
+        rows = insert_data_into_temp_db(PathTrie.from_directory_tree(tree_file), db_path, EXCLUDE_OPTION, MOUNT_PATH)
+        # 整理前：只有 alist 建表时建立的 parent 索引
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE INDEX idx_x_search_nodes_parent ON x_search_nodes (parent)")
+        conn.commit()
+        conn.close()
+
+        queries = build_queries(db_path, args.queries, args.seed)
+        before = run_queries(db_path, queries, args.repeat)
+        start_time = time.time()
+        maintain_search_indexes(db_path)
+        maintain_seconds = time.time() - start_time
+        after = run_queries(db_path, queries, args.repeat)
+
+    print(f"行数：{rows}，整理索引耗时：{maintain_seconds:.2f} 秒")
+    print(f"{'查询':<12} {'整理前 p50':>10} {'整理前 p99':>10} {'整理后 p50':>10} {'整理后 p99':>10}（毫秒）")
+    for kind in before:
+        print(f"{kind:<12} {percentile(before[kind], 0.5):>10.2f} {percentile(before[kind], 0.99):>10.2f} "
+              f"{percentile(after[kind], 0.5):>10.2f} {percentile(after[kind], 0.99):>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# 下载阶段识别风控占位内容的核对：在本机启动一个模拟 alist 的 HTTP 服务，用 strm_engine.py 的下载器下载，
+# 检查最后保存的文件内容是否都正确
+#
+# 场景：
+#   duplicate  多个目录中有完全相同的歌词（包括空文件），都应正常下载，不能当作占位内容
+#   html       前几个请求返回 HTML 页面，应识别为占位内容，暂停后重新下载
+#   repeat     一段时间内所有请求都返回相同的纯文本内容（Content-Type 不是 HTML），
+#              应识别为占位内容，已经保存的占位内容要撤销后重新下载
+#
+# 用法：
+#   python3 benchmarks/check_download_stub.py
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+import strm_engine  # noqa: E402
+
+LYRIC = "[00:00.00]纯音乐，请欣赏\n".encode("utf-8")
+STUB_BODY = b"115 risk control"
+STUB_HTML = b"<html><body>busy</body></html>"
+
+FILES = {
+    "/music/0/intro.lrc": "[00:00.00]前奏\n".encode("utf-8"),
+    "/music/0/song.flac": os.urandom(64 * 1024),
+    "/music/a/song.lrc": LYRIC,
+    "/music/b/song.lrc": LYRIC,
+    "/music/c/song.lrc": LYRIC,
+    "/music/d/song.lrc": LYRIC,
+    "/music/e/empty.lrc": b"",
+    "/music/f/empty.lrc": b"",
+    "/music/g/other.lrc": "[00:00.00]另一首\n".encode("utf-8"),
+}
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, stub_requests, stub_type):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.stub_requests = stub_requests  # 第几个请求（从 1 开始）返回占位内容
+        self.stub_type = stub_type
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            is_stub = self.server.requests in self.server.stub_requests
+        path = self.path.split("?", 1)[0]
+        if is_stub:
+            body = STUB_HTML if self.server.stub_type == "text/html" else STUB_BODY
+            content_type = self.server.stub_type
+        elif path in FILES:
+            body = FILES[path]
+            content_type = "text/plain" if path.endswith(".lrc") else "application/octet-stream"
+        else:
+            body = b""
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_scenario(name, stub_requests, stub_type):
+    server = Server(stub_requests, stub_type)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with tempfile.TemporaryDirectory(prefix="115-check-download-") as temp_dir:
+        strm_dir = os.path.join(temp_dir, "strm")
+        for path in FILES:
+            strm_path = os.path.join(strm_dir, path.lstrip("/") + ".strm")
+            os.makedirs(os.path.dirname(strm_path), exist_ok=True)
+            with open(strm_path, "w", encoding="utf-8") as file:
+                file.write(base_url + path)
+        downloader = strm_engine.Downloader(os.path.join(temp_dir, "state.db"), strm_dir, {"lrc", "flac"}, 0, 1)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            total, done, failed = downloader.run()
+        stubs = downloader.stats["stub"]
+
+        errors = []
+        for path, body in FILES.items():
+            target = os.path.join(strm_dir, path.lstrip("/"))
+            if not os.path.exists(target):
+                errors.append(f"未下载：{path}")
+                continue
+            with open(target, "rb") as file:
+                if file.read() != body:
+                    errors.append(f"内容错误：{path}")
+            if os.path.exists(target + ".strm"):
+                errors.append(f".strm 未删除：{path}")
+    server.shutdown()
+    server.server_close()
+    if done != total or failed:
+        errors.append(f"统计不符：共 {total} 个，成功 {done} 个，失败 {failed} 个")
+    return stubs, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下载阶段识别风控占位内容的核对")
+    parser.parse_args()
+    # 缩短暂停时间，几秒内完成
+    strm_engine.FIRST_BACKOFF = 0.05
+    strm_engine.MAX_BACKOFF = 0.2
+
+    scenarios = [
+        # 场景名称, 返回占位内容的请求序号, 占位内容的 Content-Type, 是否应识别到占位内容
+        ("duplicate", set(), "text/plain", False),
+        ("html", {1, 2}, "text/html", True),
+        ("repeat", set(range(3, 15)), "text/plain", True),
+    ]
+    ok = True
+    for name, stub_requests, stub_type, expect_stub in scenarios:
+        stubs, errors = run_scenario(name, stub_requests, stub_type)
+        if bool(stubs) != expect_stub:
+            errors.append(f"识别到占位内容 {stubs} 次，预期{'有' if expect_stub else '没有'}")
+        print(f"{name:<10} 识别到风控 {stubs} 次  {'通过' if not errors else '失败'}")
+        for error in errors:
+            print(f"  {error}")
+        ok = ok and not errors
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# 生成模拟的 115 目录树导出文件，用于离线测试和性能测试
+#
+# 输出格式与 115 导出的目录树一致：UTF-16LE 编码、带 BOM、\r\n 换行，
+# 根目录行为 "|——名称"，下级目录和文件为 "| |-名称"、"| | |-名称"……
+#
+# 用法：
+#   python3 benchmarks/gen_tree.py 100000 -o /tmp/bench_目录树.txt
+#   python3 benchmarks/gen_tree.py 1m -o /tmp/bench_目录树.txt --depth 3 --fanout 8 --seed 2
+import argparse
+import random
+import sys
+from itertools import islice
+
+# 顶层分类及其常见的文件扩展名（按权重抽取）
+CATEGORIES = {
+    "电视剧": [("mkv", 40), ("mp4", 30), ("ass", 10), ("srt", 8), ("nfo", 6), ("jpg", 6)],
+    "电影": [("mkv", 45), ("mp4", 25), ("iso", 5), ("srt", 10), ("nfo", 8), ("jpg", 7)],
+    "动漫": [("mkv", 50), ("mp4", 20), ("ass", 20), ("jpg", 10)],
+    "纪录片": [("mp4", 50), ("mkv", 30), ("ts", 10), ("srt", 10)],
+    "音乐": [("flac", 50), ("mp3", 30), ("lrc", 15), ("jpg", 5)],
+}
+
+# 用于拼接名称的常用汉字
+CJK_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"
+    "十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样"
+    "与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文"
+    "总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保"
+    "治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议"
+)
+
+
+def cjk_name(rng, min_len=2, max_len=6):
+    return "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(min_len, max_len)))
+
+
+def pick_extension(rng, weights):
+    extensions, counts = zip(*weights)
+    return rng.choices(extensions, weights=counts)[0]
+
+
+def iter_series(rng, level, extensions, depth, fanout, used_names):
+    """产出一个剧集/专辑目录的 (层级, 名称)，depth 为其下的目录层数"""
+    # 同一分类下的目录不重名，和真实的网盘目录一致
+    series_name = None
+    while series_name is None or series_name in used_names:
+        series_name = cjk_name(rng)
+        # 部分目录名带年份，和文件一样含有 "."，用于检验文件夹判断
+        if rng.random() < 0.3:
+            series_name += f".{rng.randint(1980, 2025)}"
+    used_names.add(series_name)
+    yield level, series_name
+    yield from iter_series_children(rng, level + 1, series_name, extensions, depth, fanout)
+
+
+def iter_series_children(rng, level, series_name, extensions, depth, fanout):
+    count = max(1, int(fanout * rng.uniform(0.5, 1.5)))
+    if depth <= 1:
+        for index in range(1, count + 1):
+            extension = pick_extension(rng, extensions)
+            if rng.random() < 0.5:
+                yield level, f"{series_name} S01E{index:02d}.{extension}"
+            else:
+                yield level, f"第{index:02d}集 {cjk_name(rng, 2, 10)}.{extension}"
+        return
+    for index in range(1, count + 1):
+        yield level, f"第{index}季" if rng.random() < 0.5 else f"Season {index:02d}"
+        yield from iter_series_children(rng, level + 1, series_name, extensions, depth - 1, fanout)
+
+
+def iter_tree(rng, depth, fanout, series_per_category):
+    """按目录树顺序无限产出 (层级, 名称)，由调用方截断到需要的条目数"""
+    yield 1, "我的资源"
+    round_index = 0
+    while True:
+        round_index += 1
+        for category, extensions in CATEGORIES.items():
+            yield 2, category if round_index == 1 else f"{category}{round_index}"
+            used_names = set()
+            for _ in range(series_per_category):
+                yield from iter_series(rng, 3, extensions, depth, fanout, used_names)
+
+
+def format_line(level, name):
+    if level == 1:
+        return f"|——{name}"
+    return "| " * (level - 1) + f"|-{name}"
+
+
+def parse_size(value):
+    """解析条目数，支持 10k、1m 这样的写法"""
+    value = value.strip().lower()
+    multiplier = 1
+    if value.endswith("k"):
+        multiplier, value = 1000, value[:-1]
+    elif value.endswith("m"):
+        multiplier, value = 1000000, value[:-1]
+    return int(float(value) * multiplier)
+
+
+def generate_tree(output_path, entries, depth=2, fanout=12, seed=1):
+    """写出包含 entries 个条目的目录树文件，返回实际写入的条目数"""
+    rng = random.Random(seed)
+    # 估算每个剧集目录的条目数，让条目大致平均分布到各个分类
+    series_size = 1 + sum(fanout ** level for level in range(1, depth + 1))
+    series_per_category = max(1, entries // (len(CATEGORIES) * series_size))
+    written = 0
+    with open(output_path, "w", encoding="utf-16-le", newline="\r\n") as file:
+        file.write("\ufeff")
+        for level, name in islice(iter_tree(rng, depth, fanout, series_per_category), entries):
+            file.write(format_line(level, name) + "\n")
+            written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成模拟的 115 目录树文件")
+    parser.add_argument("entries", help="条目数（目录和文件合计），例如 10000、100k、1m")
+    parser.add_argument("-o", "--output", required=True, help="输出文件路径，建议以 _目录树.txt 结尾")
+    parser.add_argument("--depth", type=int, default=2, help="每个剧集目录下的目录层数，默认 2（季/文件）")
+    parser.add_argument("--fanout", type=int, default=12, help="每个目录的平均子项数量，默认 12")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，相同参数生成的文件完全一致")
+    args = parser.parse_args()
+
+    written = generate_tree(args.output, parse_size(args.entries), args.depth, args.fanout, args.seed)
+    print(f"已生成 {written} 个条目：{args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
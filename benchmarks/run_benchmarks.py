@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# 端到端性能测试：用模拟目录树驱动 115-strm.sh 的各个菜单，分别统计每个阶段的耗时、吞吐量和内存峰值
+#
+# 所有操作都在临时目录中离线完成（HOME 也指向临时目录，不会改动本机的配置文件），
+# 结果写入 JSON 文件，方便对比不同版本的脚本。
+#
+# 用法：
+#   python3 benchmarks/run_benchmarks.py                       # 默认 10k、100k 两档
+#   python3 benchmarks/run_benchmarks.py --sizes 10k,100k,1m,10m -o results.json
+#   python3 benchmarks/run_benchmarks.py --script ./115-strm.sh --keep
+#
+# 阶段说明：
+#   parse   只解析目录树（strm_engine.py 中的 iter_directory_tree，旧版本为脚本中的 python_tree_parser）
+#   parse_parallel  用 --parse-workers 个进程分块并行解析目录树（只有使用 strm_engine.py 的版本才测试）
+#   convert 菜单 1：目录树转换为目录文件
+#   snapshot  加载菜单 1 写出的目录快照并遍历所有路径（只有写出快照的版本才测试），同时记录快照和目录文件的大小
+#   create  菜单 2：在空目录中生成 .strm（不使用生成记录）
+#   delete  菜单 2：目录文件删掉约 10% 的媒体文件后再次生成，删除多余的 .strm
+#   import  菜单 3：导入 alist 的 x_search_nodes 表（替换模式）
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gen_tree import generate_tree, parse_size  # noqa: E402
+
+ALIST_URL = "http://127.0.0.1:5244"
+MOUNT_PATH = "/bench"
+# 剔除 "我的资源" 这一层
+EXCLUDE_OPTION = 1
+
+
+def run_stage(args, stdin_text, cwd, env):
+    """运行一个阶段，返回 (耗时秒数, 内存峰值 MB, 输出)；内存峰值取该进程及其子进程中的最大值"""
+    start_time = time.time()
+    process = subprocess.Popen(
+        args, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    process.stdin.write(stdin_text.encode("utf-8"))
+    process.stdin.close()
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    # 已经通过 wait4 回收，避免 Popen 再次等待
+    process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+    elapsed = time.time() - start_time
+    if process.returncode != 0:
+        raise RuntimeError(f"阶段执行失败（退出码 {process.returncode}）：\n{output.decode('utf-8', 'replace')[-2000:]}")
+    return elapsed, usage.ru_maxrss / 1024, output.decode("utf-8", "replace")
+
+
+def menu_input(*answers):
+    """把菜单的各个输入拼成标准输入，最后输入 0 退出脚本"""
+    return "".join(f"{answer}\n" for answer in answers) + "0\n"
+
+
+def extract_tree_parser(script_path):
+    """取出目录树解析代码，用于单独测试解析速度
+
+    优先使用脚本旁边的 strm_engine.py；旧版本的脚本没有处理引擎，解析代码在 python_tree_parser 代码片段中。
+    """
+    engine_path = os.path.join(os.path.dirname(script_path), "strm_engine.py")
+    if os.path.exists(engine_path):
+        return (
+            "import sys\n"
+            f"sys.path.insert(0, {os.path.dirname(engine_path)!r})\n"
+            "from strm_engine import iter_directory_tree\n"
+        )
+    with open(script_path, "r", encoding="utf-8") as file:
+        match = re.search(r"python_tree_parser=\$\(cat <<'PYEOF'\n(.*?)\nPYEOF\n\)", file.read(), re.S)
+    if not match:
+        raise RuntimeError("脚本中没有找到 python_tree_parser 代码片段")
+    return match.group(1)
+
+
+def count_strm_files(path):
+    return sum(1 for _, _, files in os.walk(path) for name in files if name.endswith(".strm"))
+
+
+def write_reduced_directory_file(source_path, output_path):
+    """去掉约 10% 的文件行，返回去掉的行数；只去掉有扩展名的叶子行，不影响目录结构"""
+    dropped = 0
+    with open(source_path, "r", encoding="utf-8") as source, open(output_path, "w", encoding="utf-8") as output:
+        for index, line in enumerate(source):
+            if index % 10 == 5 and "." in line.rsplit("/", 1)[-1]:
+                dropped += 1
+                continue
+            output.write(line)
+    return dropped
+
+
+def create_alist_database(path):
+    """创建只有 x_search_nodes 表的 alist 数据库"""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE x_search_nodes (parent text, name text, is_dir numeric, size integer)")
+    conn.commit()
+    conn.close()
+
+
+def stage_result(elapsed, peak_rss_mb, items):
+    return {
+        "seconds": round(elapsed, 3),
+        "items": items,
+        "items_per_second": round(items / elapsed, 1) if elapsed > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def run_size(script_path, entries, args):
+    base_dir = tempfile.mkdtemp(prefix="115-strm-bench-", dir=args.workdir)
+    home_dir = os.path.join(base_dir, "home")
+    work_dir = os.path.join(base_dir, "work")
+    delete_dir = os.path.join(base_dir, "delete")
+    strm_dir = os.path.join(base_dir, "strm")
+    for path in (home_dir, work_dir, delete_dir):
+        os.makedirs(path)
+    env = dict(os.environ, HOME=home_dir)
+    stages = {}
+
+    try:
+        tree_file = os.path.join(work_dir, "bench_目录树.txt")
+        print(f"[{entries}] 生成目录树...", file=sys.stderr)
+        generate_tree(tree_file, entries, args.depth, args.fanout, args.seed)
+
+        # 只解析目录树
+        parse_code = extract_tree_parser(script_path) + (
+            "\ncount = 0\n"
+            f"for _ in iter_directory_tree({tree_file!r}):\n"
+            "    count += 1\n"
+            "print(count)\n"
+        )
+        elapsed, peak_rss, output = run_stage([sys.executable, "-"], parse_code, work_dir, env)
+        stages["parse"] = stage_result(elapsed, peak_rss, int(output.split()[-1]))
+
+        # 分块并行解析目录树，测试时不论目录树大小都分块
+        if os.path.exists(os.path.join(os.path.dirname(script_path), "strm_engine.py")):
+            parse_workers = args.parse_workers or os.cpu_count() or 1
+            parse_code = extract_tree_parser(script_path) + (
+                "import strm_engine\n"
+                "strm_engine.PARALLEL_PARSE_MIN_SIZE = 0\n"
+                "count = 0\n"
+                f"for _ in iter_directory_tree({tree_file!r}, {parse_workers}):\n"
+                "    count += 1\n"
+                "print(count)\n"
+            )
+            elapsed, peak_rss, output = run_stage([sys.executable, "-"], parse_code, work_dir, env)
+            stages["parse_parallel"] = stage_result(elapsed, peak_rss, int(output.split()[-1]))
+            stages["parse_parallel"]["workers"] = parse_workers
+
+        # 菜单 1：目录树转换为目录文件
+        elapsed, peak_rss, _ = run_stage(["bash", script_path], menu_input(1, tree_file), work_dir, env)
+        directory_file = os.path.join(work_dir, "bench_目录树_目录文件.txt")
+        with open(directory_file, "r", encoding="utf-8") as file:
+            directory_lines = sum(1 for _ in file)
+        stages["convert"] = stage_result(elapsed, peak_rss, directory_lines)
+        stages["convert"]["file_bytes"] = os.path.getsize(directory_file)
+
+        # 加载目录快照，之后的菜单使用同一个目录文件时都从快照读取
+        snapshot_file = os.path.join(work_dir, "bench_目录树_目录快照.bin")
+        if os.path.exists(snapshot_file):
+            snapshot_code = extract_tree_parser(script_path) + (
+                "from strm_engine import PathTrie\n"
+                f"trie = PathTrie.from_snapshot({snapshot_file!r})\n"
+                "print(sum(1 for _ in trie.iter_paths()))\n"
+            )
+            elapsed, peak_rss, output = run_stage([sys.executable, "-"], snapshot_code, work_dir, env)
+            stages["snapshot"] = stage_result(elapsed, peak_rss, int(output.split()[-1]))
+            stages["snapshot"]["file_bytes"] = os.path.getsize(snapshot_file)
+
+        # 菜单 2：生成 .strm（来源为目录文件，跳过已有文件，不删除，不使用生成记录）
+        strm_input = [
+            2, 1, 1, strm_dir, ALIST_URL, MOUNT_PATH, EXCLUDE_OPTION,
+            1, 2, 2, args.workers, args.worker_mode,
+        ]
+        elapsed, peak_rss, _ = run_stage(["bash", script_path], menu_input(*strm_input), work_dir, env)
+        strm_count = count_strm_files(strm_dir)
+        stages["create"] = stage_result(elapsed, peak_rss, strm_count)
+
+        # 菜单 2：删掉部分文件后再次生成，并删除多余的 .strm（扫描 .strm 目录）
+        write_reduced_directory_file(directory_file, os.path.join(delete_dir, "bench_目录文件.txt"))
+        strm_input[8] = 1
+        elapsed, peak_rss, _ = run_stage(["bash", script_path], menu_input(*strm_input), delete_dir, env)
+        deleted = strm_count - count_strm_files(strm_dir)
+        stages["delete"] = stage_result(elapsed, peak_rss, deleted)
+
+        # 菜单 3：导入 alist 索引（替换模式）
+        create_alist_database(os.path.join(work_dir, "data.db"))
+        import_input = [3, 1, 1, MOUNT_PATH, EXCLUDE_OPTION, 2]
+        elapsed, peak_rss, _ = run_stage(["bash", script_path], menu_input(*import_input), work_dir, env)
+        conn = sqlite3.connect(os.path.join(work_dir, "data.db"))
+        imported = conn.execute("SELECT COUNT(*) FROM x_search_nodes").fetchone()[0]
+        conn.close()
+        stages["import"] = stage_result(elapsed, peak_rss, imported)
+    finally:
+        if args.keep:
+            print(f"[{entries}] 临时文件保留在：{base_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    return {"entries": entries, "stages": stages}
+
+
+def git_revision(path):
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(path),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(runs):
+    print(f"{'条目数':>10} {'阶段':<14} {'耗时(秒)':>10} {'条目/秒':>12} {'内存峰值(MB)':>14}")
+    for run in runs:
+        for name, stage in run["stages"].items():
+            print(f"{run['entries']:>10} {name:<14} {stage['seconds']:>10.2f} "
+                  f"{stage['items_per_second'] or 0:>12.0f} {stage['peak_rss_mb']:>14.1f}")
+
+
+def main():
+    default_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "115-strm.sh")
+    parser = argparse.ArgumentParser(description="115-strm 端到端性能测试")
+    parser.add_argument("--sizes", default="10k,100k", help="条目数，逗号分隔，例如 10k,100k,1m,10m")
+    parser.add_argument("--script", default=default_script, help="要测试的脚本，默认为仓库中的 115-strm.sh")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="结果文件，默认 bench_results.json")
+    parser.add_argument("--depth", type=int, default=2, help="模拟目录树每个剧集目录下的目录层数")
+    parser.add_argument("--fanout", type=int, default=12, help="模拟目录树每个目录的平均子项数量")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--workers", type=int, default=0, help="生成 .strm 的并行任务数，0 为自动")
+    parser.add_argument("--parse-workers", type=int, default=0, help="并行解析目录树的进程数，0 为 CPU 核心数")
+    parser.add_argument("--worker-mode", type=int, default=1, choices=(1, 2), help="1 多线程，2 多进程")
+    parser.add_argument("--workdir", default=None, help="临时目录的位置，默认为系统临时目录")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录，便于检查生成的文件")
+    args = parser.parse_args()
+
+    script_path = os.path.abspath(args.script)
+    runs = [run_size(script_path, parse_size(size), args) for size in args.sizes.split(",") if size.strip()]
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "script": script_path,
+        "revision": git_revision(script_path),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": {
+            "depth": args.depth, "fanout": args.fanout, "seed": args.seed,
+            "workers": args.workers, "worker_mode": args.worker_mode, "parse_workers": args.parse_workers,
+        },
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+    print_summary(runs)
+    print(f"结果已写入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
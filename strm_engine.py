@@ -0,0 +1,2601 @@
+#!/usr/bin/env python3
+# 115-strm 处理引擎：解析目录树、生成 .strm、导入 alist 索引数据库、下载指定格式文件
+#
+# 115-strm.sh 和 115-strm-update.sh 的菜单只负责交互和保存配置，具体处理都调用这里；
+# 也可以在 cron 中直接运行，配置文件与 115-strm-update.conf 的格式和键相同。
+# 一次运行多个阶段时只启动一个 Python 进程，目录树只读取一次，解析结果在内存中交给后面的阶段。
+#
+# 用法：
+#   python3 strm_engine.py -c ~/.strm/115-strm-update.conf strm
+#   python3 strm_engine.py -c ~/.115-strm.conf convert strm index --db-file /opt/alist/data/data.db --index-mode 3
+#   python3 strm_engine.py -c ~/.115-strm.conf download --set last_user_formats="ass srt"
+#   python3 strm_engine.py -c ~/.115-strm.conf rename --dry-run
+#
+# 阶段（按下面的顺序执行，与命令行中的顺序无关）：
+#   convert  目录树转换为目录文件（每行一个以 / 开头的完整路径）
+#   strm     生成 .strm 文件
+#   index    导入 alist 的 x_search_nodes 索引表
+#   download 下载 .strm 目录中指定格式的文件，下载完成后删除对应的 .strm
+#   rename   去除 .strm 文件名中的原始格式（xx.mp4.strm -> xx.strm），--dry-run 只扫描并写出重命名计划
+#   notify   按变更记录通知 Emby 只刷新 .strm 有新增、更新或删除的目录
+import argparse
+import hashlib
+import heapq
+import http.client
+import json
+import mmap
+import multiprocessing
+import os
+import resource
+import shlex
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from itertools import groupby, islice
+from operator import itemgetter
+
+STAGES = ('convert', 'strm', 'index', 'download', 'rename', 'notify')
+
+# 配置项及默认值，与 shell 脚本保存的配置文件相同，值都按字符串保存
+DEFAULT_CONFIG = {
+    'directory_tree_file': '',
+    'directory_tree_url': '',
+    'strm_save_path': '',
+    'alist_url': '',
+    'mount_path': '',
+    'exclude_option': '2',
+    'custom_extensions': '',
+    'update_existing': '1',
+    'delete_absent': '2',
+    'last_strm_directory': '',
+    'last_interval_time': '3',
+    'last_user_formats': '',
+    'strm_source': '1',
+    'use_manifest': '1',
+    'strm_workers': '0',
+    'strm_worker_mode': '1',
+    'metrics_report': '',
+    'metrics_textfile': '',
+    'parse_workers': '0',
+    'download_workers': '2',
+    'db_file': '',
+    'index_mode': '3',
+    'rename_conflict': '2',
+    'emby_url': '',
+    'emby_api_key': '',
+    'emby_strm_path': '',
+    'batch_jobs_file': '',
+}
+
+# 常见的媒体文件扩展名，生成 .strm 时与用户自定义扩展名合并
+MEDIA_EXTENSIONS = {
+    'mp4', 'mkv', 'avi', 'mov', 'wmv', 'flv', 'webm', 'vob', 'mpg', 'mpeg',
+    'iso', 'img', 'dvd', 'ts', 'rm', 'rmvb', '3gp', 'dat', 'ogg', 'm2ts',
+}
+
+# 每个并行任务处理的路径数量，避免一次性为所有路径创建任务
+CHUNK_SIZE = 1000
+
+# 目录树不小于这个大小时才分块并行解析，小文件逐行解析更快
+PARALLEL_PARSE_MIN_SIZE = 32 * 1024 * 1024
+# 并行解析时每块的字节数；同时在途的块不超过进程数，内存占用与目录树大小无关
+PARSE_CHUNK_BYTES = 8 * 1024 * 1024
+
+# 目录快照：解析后的路径树保存为二进制文件，文件头之后依次是名称表、父节点、名称编号、层级和文件夹标记五段，
+# 每段分别用 zlib 快速压缩。文件头包含节点数、名称数、各段压缩后的字节数、目录树的 sha256，
+# 以及目录树和目录文件生成快照时的大小和修改时间
+SNAPSHOT_MAGIC = b'115TREE\0'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sIIQQ5Q32sQqQq')
+SnapshotHeader = namedtuple('SnapshotHeader', 'magic version reserved node_count name_count '
+                                              'names_size parents_size name_of_size depths_size flags_size '
+                                              'tree_digest tree_size tree_mtime_ns directory_size directory_mtime_ns')
+SNAPSHOT_COMPRESS_LEVEL = 1
+
+# 外部排序：每次在内存中排序的行数，以及同时归并的临时文件数量；内存占用由这两个值决定，与文件数量无关
+SORT_RUN_LINES = 100000
+SORT_MAX_RUNS = 64
+
+# 导入索引时每批插入的行数，以及刷新进度的时间间隔（秒）
+INDEX_BATCH_SIZE = 50000
+PROGRESS_INTERVAL = 0.5
+
+# x_search_nodes 的索引：parent 与 alist 自己建立的索引同名，用于列出目录；
+# (parent, name) 用于按目录和名称查找、删除（增量更新）；(name, parent) 用于按名称搜索和按名称排序分页，
+# 在子目录中搜索时不需要回表就能判断 parent
+SEARCH_NODE_INDEXES = (
+    ('idx_x_search_nodes_parent', 'parent'),
+    ('idx_x_search_nodes_parent_name', 'parent, name'),
+    ('idx_x_search_nodes_name_parent', 'name, parent'),
+)
+# ANALYZE 时每个索引最多抽样的行数，数百万行时也只需要很短时间
+ANALYZE_LIMIT = 10000
+
+# 下载：单个任务最多尝试的次数（包括遇到风控的次数）
+DOWNLOAD_MAX_ATTEMPTS = 8
+# 小于等于这个大小的响应先读入内存，检查是否是风控占位内容
+STUB_SIZE = 4096
+# 短时间内连续多少个不同文件返回完全相同的小内容时怀疑是风控占位内容
+STUB_REPEAT = 3
+STUB_WINDOW = 60
+# 遇到风控时暂停的时间：从 60 秒开始，连续遇到时翻倍，最长 1 小时
+FIRST_BACKOFF = 60
+MAX_BACKOFF = 3600
+REQUEST_TIMEOUT = 60
+READ_SIZE = 256 * 1024
+
+# 变更记录保留最近几次运行的内容
+JOURNAL_KEEP_RUNS = 30
+# 通知 Emby 时每个请求包含的目录数量；有变化的目录太多时改为刷新整个媒体库，比逐个目录刷新更快
+NOTIFY_BATCH_SIZE = 100
+NOTIFY_MAX_DIRECTORIES = 5000
+
+
+def parse_config_line(line):
+    """解析配置文件中的一行 key="value"，返回 (key, value)；空行、注释和格式不对的行返回 None"""
+    key, sep, value = line.strip().partition('=')
+    if not sep or key.startswith('#'):
+        return None
+    # 按 shell 的引号规则取值，和 source 配置文件的结果一致
+    values = shlex.split(value, comments=True)
+    return key, values[0] if values else ''
+
+
+def read_config(config_file):
+    """读取 shell 脚本保存的配置文件（每行 key="value"），未配置的项使用默认值"""
+    config = dict(DEFAULT_CONFIG)
+    if config_file and os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                item = parse_config_line(line)
+                if item:
+                    config[item[0]] = item[1]
+    return config
+
+
+def state_file(config_file, suffix):
+    """状态文件与配置文件放在一起，和 shell 脚本中 ${config_file%.conf}$suffix 的位置相同"""
+    if not config_file:
+        return f'115-strm{suffix}'
+    base = config_file[:-len('.conf')] if config_file.endswith('.conf') else config_file
+    return base + suffix
+
+
+def normalize_mount_path(mount_path):
+    """挂载路径统一为以 / 开头、不以 / 结尾，根目录为空字符串"""
+    if mount_path == '/' or not mount_path:
+        return ''
+    return '/' + mount_path.strip('/')
+
+
+def strm_base_url(alist_url, mount_path):
+    """.strm 中链接的前缀：alist 地址 + /d + 编码后的挂载路径"""
+    return f"{alist_url.rstrip('/')}/d{urllib.parse.quote(normalize_mount_path(mount_path))}/"
+
+
+# 运行指标：记录每个阶段的耗时、条目数、读写字节数、系统调用次数和内存峰值，
+# 运行结束后写出 JSON 报告，并可选写出 Prometheus textfile collector 使用的指标文件
+class RunMetrics:
+    def __init__(self, script_name, report_file, textfile):
+        self.script_name = script_name
+        self.report_file = report_file
+        self.textfile = textfile
+        self.started = time.time()
+        self.stages = {}
+        self.counts = {'parsed': 0, 'filtered': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'deleted': 0}
+
+    @staticmethod
+    def _snapshot():
+        # /proc/self/io 只在 Linux 上有；多进程模式下子进程的读写不计入，CPU 时间包含已结束的子进程
+        io_counters = {}
+        try:
+            with open('/proc/self/io', 'r') as file:
+                for line in file:
+                    key, _, value = line.partition(':')
+                    io_counters[key] = int(value)
+        except OSError:
+            pass
+        return time.time(), resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN), io_counters
+
+    @contextmanager
+    def stage(self, name):
+        start_time, start_self, start_children, start_io = self._snapshot()
+        try:
+            yield
+        finally:
+            end_time, end_self, end_children, end_io = self._snapshot()
+
+            def io_delta(key):
+                return end_io[key] - start_io[key] if key in end_io and key in start_io else None
+
+            self.stages[name] = {
+                'seconds': round(end_time - start_time, 3),
+                'cpu_user_seconds': round(end_self.ru_utime - start_self.ru_utime + end_children.ru_utime - start_children.ru_utime, 3),
+                'cpu_system_seconds': round(end_self.ru_stime - start_self.ru_stime + end_children.ru_stime - start_children.ru_stime, 3),
+                'bytes_read': io_delta('rchar'),
+                'bytes_written': io_delta('wchar'),
+                'read_syscalls': io_delta('syscr'),
+                'write_syscalls': io_delta('syscw'),
+                'context_switches': (end_self.ru_nvcsw + end_self.ru_nivcsw) - (start_self.ru_nvcsw + start_self.ru_nivcsw),
+                'peak_rss_mb': round(max(end_self.ru_maxrss, end_children.ru_maxrss) / 1024, 1),
+            }
+
+    def add_stage(self, name, started, finished, **values):
+        """记录在 shell 中完成的阶段（例如下载目录树），时间为 date +%s.%N 的输出"""
+        if started and finished:
+            self.stages[name] = dict(seconds=round(float(finished) - float(started), 3), **values)
+            self.started = min(self.started, float(started))
+
+    def write(self, status):
+        finished = time.time()
+        peak_rss_mb = max([stage.get('peak_rss_mb', 0) for stage in self.stages.values()] or [0])
+        report = {
+            'script': self.script_name,
+            'status': status,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(finished)),
+            'duration_seconds': round(finished - self.started, 3),
+            'peak_rss_mb': peak_rss_mb,
+            'counts': self.counts,
+            'stages': self.stages,
+        }
+        if self.report_file:
+            temp_file = self.report_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.report_file)
+        if self.textfile:
+            self._write_textfile(report, finished)
+
+    def _write_textfile(self, report, finished):
+        labels = f'script="{self.script_name}"'
+        lines = [
+            '# HELP strm_run_success 1 if the last run finished without error',
+            '# TYPE strm_run_success gauge',
+            f'strm_run_success{{{labels}}} {1 if report["status"] == "ok" else 0}',
+            '# HELP strm_run_last_timestamp_seconds Unix time the last run finished',
+            '# TYPE strm_run_last_timestamp_seconds gauge',
+            f'strm_run_last_timestamp_seconds{{{labels}}} {finished:.0f}',
+            '# HELP strm_run_duration_seconds Wall time of the last run',
+            '# TYPE strm_run_duration_seconds gauge',
+            f'strm_run_duration_seconds{{{labels}}} {report["duration_seconds"]}',
+            '# HELP strm_run_peak_rss_bytes Peak resident set size of the last run',
+            '# TYPE strm_run_peak_rss_bytes gauge',
+            f'strm_run_peak_rss_bytes{{{labels}}} {int(report["peak_rss_mb"] * 1024 * 1024)}',
+            '# HELP strm_run_items Items handled in the last run',
+            '# TYPE strm_run_items gauge',
+        ]
+        lines += [f'strm_run_items{{{labels},kind="{kind}"}} {count}' for kind, count in self.counts.items()]
+        stage_metrics = [
+            ('seconds', 'strm_stage_duration_seconds', 'Wall time of each stage'),
+            ('cpu_user_seconds', 'strm_stage_cpu_user_seconds', 'User CPU time of each stage'),
+            ('cpu_system_seconds', 'strm_stage_cpu_system_seconds', 'System CPU time of each stage'),
+            ('bytes_read', 'strm_stage_read_bytes', 'Bytes read by each stage'),
+            ('bytes_written', 'strm_stage_written_bytes', 'Bytes written by each stage'),
+            ('read_syscalls', 'strm_stage_read_syscalls', 'Read syscalls made by each stage'),
+            ('write_syscalls', 'strm_stage_write_syscalls', 'Write syscalls made by each stage'),
+        ]
+        for key, metric, description in stage_metrics:
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} gauge']
+            lines += [
+                f'{metric}{{{labels},stage="{name}"}} {stage[key]}'
+                for name, stage in self.stages.items() if stage.get(key) is not None
+            ]
+        # 先写临时文件再改名，避免 node_exporter 读到写了一半的文件
+        temp_file = self.textfile + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temp_file, self.textfile)
+
+
+# ---------------------------------------------------------------------------
+# 目录树解析
+# ---------------------------------------------------------------------------
+
+def iter_line_entries(lines, depth=0):
+    """按路径栈的规则处理目录树的行，产出 (层级, 名称)，层级为加入该项后路径栈的深度
+
+    depth 为开始时路径栈的深度。比当前深度深了不止一层的行只加深一层，和逐行维护路径栈的结果相同。
+    """
+    for line in lines:
+        # 移除 BOM 和多余空白
+        line = line.lstrip('\ufeff').rstrip()
+        item_name = line.split('|-')[-1].strip()  # 获取当前项名称
+        # 根目录行形如 "|——名称"，去掉前面的 "|——"
+        if item_name.startswith('|'):
+            item_name = item_name.lstrip('|—').strip()
+        if not item_name:
+            continue
+        line_depth = line.count('|')  # 计算目录级别
+        if depth >= line_depth:
+            depth = line_depth if line_depth > 0 else 1
+        else:
+            depth += 1
+        yield depth, item_name
+
+
+def split_tree_file(file_path, chunk_bytes):
+    """把 UTF-16LE 目录树按大约 chunk_bytes 切分，切分点都在行首，返回 [(开始, 结束)]"""
+    size = os.path.getsize(file_path)
+    bounds = []
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b'\n\x00', start + chunk_bytes)
+            # 换行符只能在偶数位置，奇数位置是前后两个字符的字节凑巧组成的
+            while end != -1 and end % 2:
+                end = data.find(b'\n\x00', end + 1)
+            end = size if end == -1 else end + 2
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def parse_tree_chunk(task):
+    """解析目录树中一块字节范围内的行，返回 (层级数组, 换行分隔的名称)
+
+    depth 为 None 时不知道块开始时路径栈的深度，按块的第一行层级完整计算，由合并时检查。
+    名称中不会有换行符，合并成一个字符串传回主进程比传字符串列表快得多。
+    """
+    file_path, start, end, depth = task
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-16-le', errors='ignore')
+    # 和按文本方式逐行读取相同，\r\n 和单独的 \r 都视为换行
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    del text
+    depths = array('H')
+    names = []
+    for item_depth, item_name in iter_line_entries(lines, 0xFFFF if depth is None else depth):
+        depths.append(item_depth)
+        names.append(item_name)
+    return depths, '\n'.join(names)
+
+
+def iter_tree_entries(file_path, workers=1):
+    """按目录树顺序产出每一项的 (层级, 名称)
+
+    目录树较大且 workers 大于 1 时，用内存映射把文件切成多块，在多个进程中并行解析后按顺序合并；
+    每块从任意一行开始，路径栈由合并时接上一块的结尾恢复，不要求在顶层目录处切分。
+    """
+    if workers <= 1 or os.path.getsize(file_path) < PARALLEL_PARSE_MIN_SIZE:
+        with open(file_path, 'r', encoding='utf-16-le', errors='ignore') as file:
+            yield from iter_line_entries(file)
+        return
+
+    bounds = split_tree_file(file_path, PARSE_CHUNK_BYTES)
+    tasks = [(file_path, start, end, None) for start, end in bounds]
+    depth = 0
+    # 使用 fork 启动子进程，和生成 .strm 的多进程模式相同
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        for task, (depths, names) in zip(tasks, run_bounded(executor, parse_tree_chunk, tasks, workers)):
+            if depths and depths[0] > depth + 1:
+                # 块的第一项比上一块的最后一项深了不止一层，需要按实际的深度重新解析
+                depths, names = parse_tree_chunk(task[:3] + (depth,))
+            yield from zip(depths, names.split('\n'))
+            if depths:
+                depth = depths[-1]
+
+
+def iter_directory_tree(file_path, workers=1):
+    """逐项解析 115 目录树，产出当前项的路径栈（同一个列表会被复用，需要保存时请复制）
+
+    直接按 UTF-16LE 解码原始目录树，不需要 iconv 和中间文件。
+    """
+    current_path_stack = []
+    for depth, item_name in iter_tree_entries(file_path, workers):
+        del current_path_stack[depth - 1:]  # 移出多余的路径层级
+        current_path_stack.append(item_name)  # 添加当前项到路径栈
+        yield current_path_stack
+
+
+def iter_directory_file(file_path):
+    """逐行读取目录文件（每行一个以 / 开头的完整路径），产出路径名称列表"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            components = line.strip().split('/')[1:]
+            if components:
+                yield components
+
+
+class PathTrie:
+    """紧凑的路径树：每个名称只保存一次，节点用数组保存父节点、名称编号和层级
+
+    节点按加入顺序编号，根节点的父节点为 -1，层级从 1 开始。
+    ordered=True 表示路径按目录树顺序加入（子项紧跟在父目录之后，同一目录不会分开出现），
+    此时加入路径不需要查找已有节点，也就不需要建立子节点索引。
+    """
+
+    def __init__(self, ordered=False):
+        self.ordered = ordered
+        self.names = []                   # 名称编号 -> 名称
+        self.name_ids = {}                # 名称 -> 名称编号
+        self.parents = array('i')         # 节点 -> 父节点
+        self.name_of = array('i')         # 节点 -> 名称编号
+        self.depths = array('H')          # 节点 -> 层级
+        self.has_children = bytearray()   # 节点 -> 是否有子节点
+        self._children = None             # (父节点, 名称编号) -> 节点，第一次查找时才建立
+        self._last_path = []              # 上一次 add_path 经过的节点，按顺序加入时复用公共前缀
+
+    def __len__(self):
+        return len(self.parents)
+
+    def _intern(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def _child_key(self, parent, name_id):
+        return (parent + 1) << 32 | name_id
+
+    def _add_node(self, parent, name_id):
+        node = len(self.parents)
+        self.parents.append(parent)
+        self.name_of.append(name_id)
+        self.depths.append(self.depths[parent] + 1 if parent >= 0 else 1)
+        self.has_children.append(0)
+        if parent >= 0:
+            self.has_children[parent] = 1
+        if self._children is not None:
+            self._children[self._child_key(parent, name_id)] = node
+        return node
+
+    def _build_index(self):
+        if len(self.name_ids) != len(self.names):
+            # 从快照加载的路径树没有保存名称索引，第一次查找时才建立
+            self.name_ids = {name: name_id for name_id, name in enumerate(self.names)}
+        self._children = {}
+        for node in range(len(self.parents)):
+            self._children[self._child_key(self.parents[node], self.name_of[node])] = node
+
+    def add_path(self, components):
+        """加入一条路径（名称列表），返回末端节点；已存在的节点不会重复加入"""
+        last_path = self._last_path
+        # 与上一条路径的公共前缀直接复用，按目录顺序加入时不需要查找
+        common = 0
+        while (common < len(last_path) and common < len(components)
+               and self.names[self.name_of[last_path[common]]] == components[common]):
+            common += 1
+        del last_path[common:]
+        parent = last_path[-1] if last_path else -1
+        for name in components[common:]:
+            name_id = self._intern(name)
+            node = None
+            if not self.ordered:
+                if self._children is None:
+                    self._build_index()
+                node = self._children.get(self._child_key(parent, name_id))
+            if node is None:
+                node = self._add_node(parent, name_id)
+            last_path.append(node)
+            parent = node
+        return parent
+
+    def find(self, components):
+        """查找路径对应的节点，不存在时返回 -1"""
+        if self._children is None:
+            self._build_index()
+        node = -1
+        for name in components:
+            name_id = self.name_ids.get(name)
+            if name_id is None:
+                return -1
+            node = self._children.get(self._child_key(node, name_id))
+            if node is None:
+                return -1
+        return node
+
+    def __contains__(self, components):
+        return self.find(components) >= 0
+
+    def is_dir(self, node):
+        """有子节点的是文件夹；没有子节点时与原脚本相同，名称中没有 '.' 的视为文件夹（空文件夹）"""
+        return bool(self.has_children[node]) or '.' not in self.names[self.name_of[node]]
+
+    def iter_nodes(self):
+        """按节点编号产出 (节点, 路径名称列表)，名称列表会被复用，需要保存时请复制"""
+        names, name_of, parents, depths = self.names, self.name_of, self.parents, self.depths
+        stack_nodes = []
+        stack_names = []
+        for node in range(len(parents)):
+            depth = depths[node]
+            parent = parents[node]
+            # 按目录顺序加入时，父节点一定在当前栈上，否则沿父节点重建路径
+            if depth - 1 <= len(stack_nodes) and (depth == 1 or stack_nodes[depth - 2] == parent):
+                del stack_nodes[depth - 1:]
+                del stack_names[depth - 1:]
+            else:
+                chain = []
+                ancestor = parent
+                while ancestor >= 0:
+                    chain.append(ancestor)
+                    ancestor = parents[ancestor]
+                chain.reverse()
+                stack_nodes[:] = chain
+                stack_names[:] = [names[name_of[ancestor]] for ancestor in chain]
+            stack_nodes.append(node)
+            stack_names.append(names[name_of[node]])
+            yield node, stack_names
+
+    def iter_paths(self):
+        """按目录树顺序产出路径名称列表，和 iter_directory_tree 的输出相同"""
+        for _, path_parts in self.iter_nodes():
+            yield path_parts
+
+    @classmethod
+    def from_directory_tree(cls, file_path, workers=1):
+        """从 115 目录树文件建立路径树，workers 大于 1 时并行解析大文件"""
+        trie = cls(ordered=True)
+        stack_nodes = []
+        for depth, item_name in iter_tree_entries(file_path, workers):
+            del stack_nodes[depth - 1:]
+            parent = stack_nodes[-1] if stack_nodes else -1
+            stack_nodes.append(trie._add_node(parent, trie._intern(item_name)))
+        return trie
+
+    @classmethod
+    def from_directory_file(cls, file_path):
+        """从目录文件（每行一个以 / 开头的完整路径）建立路径树"""
+        trie = cls(ordered=True)
+        for components in iter_directory_file(file_path):
+            trie.add_path(components)
+        return trie
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path):
+        """内存映射加载目录快照，不需要解析文本；加载得到的路径树只用于读取，不要再加入路径"""
+        trie = cls(ordered=True)
+        with open(snapshot_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                memoryview(data) as view:
+            header = SnapshotHeader._make(SNAPSHOT_HEADER.unpack_from(view))
+            sections = []
+            offset = SNAPSHOT_HEADER.size
+            for size in (header.names_size, header.parents_size, header.name_of_size, header.depths_size, header.flags_size):
+                sections.append(zlib.decompress(view[offset:offset + size]))
+                offset += size
+        names, parents, name_of, depths, flags = sections
+        if header.name_count:
+            trie.names = names.decode('utf-8').split('\n')
+        for values, data in ((trie.parents, parents), (trie.name_of, name_of), (trie.depths, depths)):
+            values.frombytes(data)
+            if sys.byteorder != 'little':
+                values.byteswap()
+        trie.has_children = bytearray(flags)
+        return trie
+
+
+class TreeSource:
+    """目录树数据来源：只有一个阶段使用时边读边处理，多个阶段使用时解析一次保存为路径树，各阶段在内存中共用
+
+    有与目录树（或目录文件）一致的快照时直接加载快照，不再解析文本。
+    """
+
+    def __init__(self, file_path, is_directory_file, metrics, workers=1, snapshot_file=None):
+        self.file_path = file_path
+        self.is_directory_file = is_directory_file
+        self.metrics = metrics
+        self.workers = workers
+        self.snapshot_file = snapshot_file
+        self.snapshot_header = read_snapshot_header(snapshot_file, file_path, is_directory_file) if snapshot_file else None
+        self._trie = None
+
+    def trie(self):
+        if self._trie is None:
+            with self.metrics.stage('parse'):
+                if self.snapshot_header:
+                    self._trie = PathTrie.from_snapshot(self.snapshot_file)
+                elif self.is_directory_file:
+                    self._trie = PathTrie.from_directory_file(self.file_path)
+                else:
+                    self._trie = PathTrie.from_directory_tree(self.file_path, self.workers)
+            self.metrics.stages['parse']['items'] = len(self._trie)
+            self.metrics.stages['parse']['from_snapshot'] = bool(self.snapshot_header)
+        return self._trie
+
+    @property
+    def parsed(self):
+        """本次从文本解析出了路径树（没有使用快照）"""
+        return self._trie is not None and not self.snapshot_header
+
+    def save_snapshot(self, directory_file=None):
+        """把路径树写成快照；目录树的摘要在快照仍然有效时直接沿用，不再重新计算"""
+        if self.is_directory_file:
+            tree_file, directory_file = None, self.file_path
+        else:
+            tree_file = self.file_path
+        tree_digest = self.snapshot_header.tree_digest if self.snapshot_header else None
+        try:
+            with self.metrics.stage('snapshot'):
+                write_tree_snapshot(self.trie(), self.snapshot_file, tree_file, directory_file, tree_digest)
+            self.metrics.stages['snapshot']['items'] = len(self._trie)
+        except OSError as e:
+            print(f"写入目录快照失败：{e}，下次仍会解析文本。")
+
+    def iter_paths(self):
+        if self._trie is not None or self.snapshot_header:
+            return self.trie().iter_paths()
+        if self.is_directory_file:
+            return iter_directory_file(self.file_path)
+        return iter_directory_tree(self.file_path, self.workers)
+
+
+def fetch_tree_file(url):
+    """下载目录树到当前目录，文件名为链接中解码后的文件名，返回文件的完整路径"""
+    file_name = urllib.parse.unquote(os.path.basename(urllib.parse.urlsplit(url).path))
+    file_path = os.path.abspath(file_name)
+    print(f"下载目录树：{url}")
+    with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as response, open(file_path + '.part', 'wb') as output:
+        while True:
+            chunk = response.read(READ_SIZE)
+            if not chunk:
+                break
+            output.write(chunk)
+    os.replace(file_path + '.part', file_path)
+    return file_path
+
+
+# ---------------------------------------------------------------------------
+# convert：目录树转换为目录文件
+# ---------------------------------------------------------------------------
+
+def write_directory_file(paths, output_path):
+    """把路径逐行写成目录文件，返回写入的行数"""
+    written = 0
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        for path_parts in paths:
+            output_file.write('/' + '/'.join(path_parts) + '\n')
+            written += 1
+    return written
+
+
+def default_snapshot_file(source_file):
+    """目录树和它的目录文件共用一个快照：文件名去掉 _目录文件.txt 或 .txt 后加上 _目录快照.bin"""
+    for suffix in ('_目录文件.txt', '.txt'):
+        if source_file.endswith(suffix):
+            return source_file[:-len(suffix)] + '_目录快照.bin'
+    return source_file + '_目录快照.bin'
+
+
+def file_digest(file_path):
+    """文件内容的 sha256，与 shell 脚本中 sha256sum 的结果相同"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def file_signature(file_path):
+    """文件的 (大小, 修改时间)，没有指定或不存在时为 (0, 0)"""
+    try:
+        stat = os.stat(file_path) if file_path else None
+    except FileNotFoundError:
+        stat = None
+    return (stat.st_size, stat.st_mtime_ns) if stat else (0, 0)
+
+
+def write_tree_snapshot(trie, snapshot_path, tree_file=None, directory_file=None, tree_digest=None):
+    """把路径树写成目录快照；先写临时文件再替换，中途失败不会留下不完整的快照"""
+    if tree_digest is None:
+        tree_digest = file_digest(tree_file) if tree_file else bytes(32)
+    sections = [zlib.compress('\n'.join(trie.names).encode('utf-8'), SNAPSHOT_COMPRESS_LEVEL)]
+    for values in (trie.parents, trie.name_of, trie.depths):
+        if sys.byteorder != 'little':
+            values = array(values.typecode, values)
+            values.byteswap()
+        sections.append(zlib.compress(values, SNAPSHOT_COMPRESS_LEVEL))
+    sections.append(zlib.compress(trie.has_children, SNAPSHOT_COMPRESS_LEVEL))
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(trie), len(trie.names),
+                                  *map(len, sections), tree_digest,
+                                  *file_signature(tree_file), *file_signature(directory_file))
+    with open(snapshot_path + '.part', 'wb') as output:
+        output.write(header)
+        output.writelines(sections)
+    os.replace(snapshot_path + '.part', snapshot_path)
+
+
+def read_snapshot_header(snapshot_path, source_file=None, is_directory_file=False):
+    """读取快照的文件头；指定了来源文件时，只有来源文件的大小和修改时间与生成快照时相同才返回，否则返回 None"""
+    try:
+        with open(snapshot_path, 'rb') as file:
+            data = file.read(SNAPSHOT_HEADER.size)
+    except OSError:
+        return None
+    if len(data) < SNAPSHOT_HEADER.size:
+        return None
+    header = SnapshotHeader._make(SNAPSHOT_HEADER.unpack(data))
+    if header.magic != SNAPSHOT_MAGIC or header.version != SNAPSHOT_VERSION:
+        return None
+    if source_file:
+        if is_directory_file:
+            signature = (header.directory_size, header.directory_mtime_ns)
+        else:
+            signature = (header.tree_size, header.tree_mtime_ns)
+        if signature == (0, 0) or signature != file_signature(source_file):
+            return None
+    return header
+
+
+# ---------------------------------------------------------------------------
+# strm：生成 .strm 文件
+# ---------------------------------------------------------------------------
+
+# .strm 生成记录：保存每个已生成文件的相对路径和写入的 URL，重复运行时只处理有变化的文件
+class StrmManifest:
+    def __init__(self, db_path, root):
+        self.root = root
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS strm_manifest (
+            root TEXT NOT NULL,
+            path TEXT NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (root, path)
+        ) WITHOUT ROWID
+        ''')
+        # 本次目录树中出现过的路径，放在临时表中，不占用内存
+        self.conn.execute('CREATE TEMP TABLE seen_paths (path TEXT PRIMARY KEY) WITHOUT ROWID')
+        # 该目录还没有任何记录时（首次使用），仍需要检查文件系统
+        self.populated = self.conn.execute(
+            'SELECT 1 FROM strm_manifest WHERE root = ? LIMIT 1', (root,)
+        ).fetchone() is not None
+
+    def lookup(self, paths):
+        """标记本批路径本次仍然存在，并返回其中已有记录的 {相对路径: URL}"""
+        self.conn.executemany('INSERT OR IGNORE INTO seen_paths (path) VALUES (?)', ((path,) for path in paths))
+        known_urls = {}
+        for path in paths:
+            row = self.conn.execute(
+                'SELECT url FROM strm_manifest WHERE root = ? AND path = ?', (self.root, path)
+            ).fetchone()
+            if row:
+                known_urls[path] = row[0]
+        return known_urls
+
+    def record(self, entries):
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO strm_manifest (root, path, url) VALUES (?, ?, ?)',
+            ((self.root, path, url) for path, url in entries)
+        )
+        self.conn.commit()
+
+    def absent_paths(self):
+        """返回有记录、但本次目录树中已经不存在的相对路径"""
+        cursor = self.conn.execute(
+            'SELECT path FROM strm_manifest WHERE root = ? AND path NOT IN (SELECT path FROM seen_paths)',
+            (self.root,)
+        )
+        return [row[0] for row in cursor]
+
+    def forget(self, paths):
+        self.conn.executemany(
+            'DELETE FROM strm_manifest WHERE root = ? AND path = ?', ((self.root, path) for path in paths)
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+# 变更记录：每次运行新增（added）、更新（updated）、删除（removed）的 .strm，按所在目录保存，
+# 通知媒体服务器时只刷新有变化的目录；通知成功前一直保留，下次运行时一起通知
+class ChangeJournal:
+    def __init__(self, db_path, root):
+        self.root = root
+        self.run_id = None
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS journal_runs (
+            run_id INTEGER PRIMARY KEY,
+            root TEXT NOT NULL,
+            started TEXT NOT NULL,
+            notified INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS journal_changes (
+            run_id INTEGER NOT NULL,
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            change TEXT NOT NULL
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS journal_changes_run ON journal_changes (run_id, directory)')
+
+    def start_run(self):
+        self.run_id = self.conn.execute(
+            'INSERT INTO journal_runs (root, started) VALUES (?, ?)', (self.root, time.strftime('%Y-%m-%dT%H:%M:%S'))
+        ).lastrowid
+        # 已通知的运行只保留最近几次的记录，还没有通知的一直保留
+        old_runs = [(row[0],) for row in self.conn.execute(
+            'SELECT run_id FROM journal_runs WHERE root = ? AND notified = 1 ORDER BY run_id DESC LIMIT -1 OFFSET ?',
+            (self.root, JOURNAL_KEEP_RUNS)
+        )]
+        self.conn.executemany('DELETE FROM journal_changes WHERE run_id = ?', old_runs)
+        self.conn.executemany('DELETE FROM journal_runs WHERE run_id = ?', old_runs)
+        self.conn.commit()
+
+    def record(self, change, strm_paths):
+        """记录一批相对于 .strm 根目录的路径"""
+        self.conn.executemany(
+            'INSERT INTO journal_changes (run_id, directory, name, change) VALUES (?, ?, ?, ?)',
+            ((self.run_id, path.rpartition('/')[0], path.rpartition('/')[2], change) for path in strm_paths)
+        )
+        self.conn.commit()
+
+    def pending_directories(self):
+        """返回 (还没有通知的运行, [(相对目录, {变化类型})])"""
+        run_ids = [row[0] for row in self.conn.execute(
+            'SELECT run_id FROM journal_runs WHERE root = ? AND notified = 0', (self.root,)
+        )]
+        cursor = self.conn.execute(f'''
+        SELECT directory, GROUP_CONCAT(DISTINCT change) FROM journal_changes
+        WHERE run_id IN ({','.join('?' * len(run_ids))})
+        GROUP BY directory ORDER BY directory
+        ''', run_ids)
+        return run_ids, [(directory, set(changes.split(','))) for directory, changes in cursor]
+
+    def mark_notified(self, run_ids):
+        self.conn.executemany('UPDATE journal_runs SET notified = 1 WHERE run_id = ?', ((run_id,) for run_id in run_ids))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+# 已创建（或确认存在）的目录，避免对同一目录重复 mkdir（多进程模式下每个进程各自缓存）
+_created_dirs = set()
+
+
+# 遍历现有的 .strm 文件，产出相对于 .strm 根目录、去掉 .strm 后缀的路径
+def iter_existing_files(strm_save_path):
+    prefix = os.path.join(strm_save_path, '')
+    for root, _, files in os.walk(strm_save_path):
+        relative_root = os.path.join(root, '')[len(prefix):]
+        for file in files:
+            if file.endswith('.strm'):
+                yield relative_root + file[:-len('.strm')]
+
+
+class ExternalSorter:
+    """有界内存的外部排序：每 SORT_RUN_LINES 行在内存中排序后写入临时文件，最后多路归并
+
+    行中不能有换行符；临时文件超过 SORT_MAX_RUNS 个时先分批归并，同时打开的文件数量也有上限。
+    """
+
+    def __init__(self, temp_dir, name):
+        self.temp_dir = temp_dir
+        self.name = name
+        self.buffer = []
+        self.runs = []
+        self._run_count = 0
+
+    def add(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= SORT_RUN_LINES:
+            self.buffer.sort()
+            self._write_run(self.buffer)
+            self.buffer = []
+
+    def _write_run(self, lines):
+        path = os.path.join(self.temp_dir, f'{self.name}.{self._run_count}')
+        self._run_count += 1
+        with open(path, 'w', encoding='utf-8', newline='\n') as file:
+            file.writelines(f'{line}\n' for line in lines)
+        self.runs.append(path)
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, 'r', encoding='utf-8', newline='\n') as file:
+            for line in file:
+                yield line[:-1]
+
+    def __iter__(self):
+        """按顺序产出所有行，重复的行会保留"""
+        self.buffer.sort()
+        if not self.runs:
+            # 没有超过一批时直接在内存中排序
+            return iter(self.buffer)
+        if self.buffer:
+            self._write_run(self.buffer)
+            self.buffer = []
+        while len(self.runs) > SORT_MAX_RUNS:
+            group, self.runs = self.runs[:SORT_MAX_RUNS], self.runs[SORT_MAX_RUNS:]
+            self._write_run(heapq.merge(*map(self._read_run, group)))
+            for path in group:
+                os.remove(path)
+        return heapq.merge(*map(self._read_run, self.runs))
+
+
+def merge_diff(new_lines, existing_lines):
+    """一次归并比较两个已排序的行流，产出 ('create' | 'delete' | 'unchanged', 行)，重复的行只产出一次"""
+    new_iter = map(itemgetter(0), groupby(new_lines))
+    existing_iter = map(itemgetter(0), groupby(existing_lines))
+    new_line = next(new_iter, None)
+    existing_line = next(existing_iter, None)
+    while new_line is not None or existing_line is not None:
+        if existing_line is None or (new_line is not None and new_line < existing_line):
+            yield 'create', new_line
+            new_line = next(new_iter, None)
+        elif new_line is None or existing_line < new_line:
+            yield 'delete', existing_line
+            existing_line = next(existing_iter, None)
+        else:
+            yield 'unchanged', new_line
+            new_line = next(new_iter, None)
+            existing_line = next(existing_iter, None)
+
+
+def sort_key(path):
+    """排序用的键：父目录和文件名之间用 \\0 分隔，同一目录的文件排在一起，子目录的内容排在它们之后"""
+    parent_path, _, file_name = path.rpartition('/')
+    return f'{parent_path}\0{file_name}'
+
+
+def diff_media_paths(media_paths, existing_paths, temp_dir, delete_list_file, pass_unchanged, counts):
+    """把本次的媒体文件路径排序后与现有的 .strm 归并比较
+
+    产出需要写入的相对路径（按目录排列），需要删除的写入 delete_list_file；
+    没有变化的文件在更新模式或使用生成记录时也要交给写入步骤（检查内容或记录 URL），否则直接跳过。
+    """
+    new_paths = ExternalSorter(temp_dir, 'new')
+    for path in media_paths:
+        new_paths.add(sort_key(path))
+    with open(delete_list_file, 'w', encoding='utf-8', newline='\n') as delete_file:
+        for kind, key in merge_diff(new_paths, existing_paths):
+            parent_path, _, file_name = key.partition('\0')
+            path = join_media_path(parent_path, file_name)
+            if kind == 'create':
+                yield path
+            elif kind == 'delete':
+                delete_file.write(f'{path}\n')
+            elif pass_unchanged:
+                yield path
+            else:
+                counts['skipped'] += 1
+
+
+# 按顺序产出需要生成 .strm 的相对路径（已剔除目录层级并按扩展名过滤）
+def iter_media_paths(paths, exclude_option, media_extensions, counts):
+    for path_parts in paths:
+        counts['parsed'] += 1
+        if len(path_parts) <= exclude_option:
+            continue
+
+        adjusted_path = '/'.join(path_parts[exclude_option:])
+        if adjusted_path.split('.')[-1].lower() in media_extensions:
+            counts['filtered'] += 1
+            yield adjusted_path
+
+
+# 创建并行执行器：多线程适合 NFS 等网络存储，多进程适合本地磁盘；任务数为 0 时按 CPU 核心数自动设置
+def create_executor(strm_workers, strm_worker_mode):
+    workers = strm_workers if strm_workers > 0 else min(32, os.cpu_count() or 1)
+    if strm_worker_mode == 2:
+        # 使用 fork 启动子进程，子进程直接继承当前的设置
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')), workers
+    return ThreadPoolExecutor(max_workers=workers), workers
+
+
+# 按提交顺序产出每个任务的结果；同时在途的任务不超过 max_in_flight 个，内存占用与任务总数无关
+def run_bounded(executor, func, tasks, max_in_flight):
+    in_flight = deque()
+    for task in tasks:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+        in_flight.append(executor.submit(func, task))
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+# 拼接相对路径
+def join_media_path(parent_path, file_name):
+    return f"{parent_path}/{file_name}" if parent_path else file_name
+
+
+# 将连续的同目录路径合并为一组，产出 (父目录, [文件名])，单个目录过大时分成多组
+def iter_directory_groups(media_paths):
+    for parent_path, lines in groupby(media_paths, key=lambda line: line.rpartition('/')[0]):
+        while True:
+            file_names = [line.rpartition('/')[2] for line in islice(lines, CHUNK_SIZE)]
+            if not file_names:
+                break
+            yield parent_path, file_names
+
+
+# 把目录分组攒成约 CHUNK_SIZE 个文件一批，每批作为一个任务提交
+def iter_group_batches(groups):
+    batch, batch_files = [], 0
+    for group in groups:
+        batch.append(group)
+        batch_files += len(group[1])
+        if batch_files >= CHUNK_SIZE:
+            yield batch
+            batch, batch_files = [], 0
+    if batch:
+        yield batch
+
+
+def read_strm(dir_fd, strm_name):
+    fd = os.open(strm_name, os.O_RDONLY, dir_fd=dir_fd)
+    try:
+        return os.read(fd, 65536).decode('utf-8', errors='replace')
+    finally:
+        os.close(fd)
+
+
+def write_strm(dir_fd, strm_name, strm_url):
+    fd = os.open(strm_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666, dir_fd=dir_fd)
+    try:
+        os.write(fd, strm_url.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+# 在同一个目录下批量写入 .strm：目录只创建一次，通过目录文件描述符用相对路径打开文件
+# 返回 ([(相对路径, URL)], [新建的 .strm 相对路径], [内容有变化而重写的 .strm 相对路径])
+def write_directory_group(options, parent_path, file_names):
+    dir_path = os.path.join(options['strm_save_path'], parent_path)
+    if dir_path not in _created_dirs:
+        os.makedirs(dir_path, exist_ok=True)
+        _created_dirs.add(dir_path)
+
+    records = []
+    added = []
+    updated = []
+    dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        # 一次性列出目录内容，代替逐个文件检查是否存在
+        existing_names = set(os.listdir(dir_fd))
+        for file_name in file_names:
+            line = join_media_path(parent_path, file_name)
+            strm_name = f"{file_name}.strm"
+            strm_url = f"{options['alist_url']}{urllib.parse.quote(line)}"
+            if strm_name not in existing_names:
+                write_strm(dir_fd, strm_name, strm_url)
+                added.append(join_media_path(parent_path, strm_name))
+            elif options['update_existing'] == 2:
+                # 更新模式下只重写内容有变化的文件，没有变化的不算作更新
+                if read_strm(dir_fd, strm_name) != strm_url:
+                    write_strm(dir_fd, strm_name, strm_url)
+                    updated.append(join_media_path(parent_path, strm_name))
+            elif options['record_existing']:
+                # 跳过的已有文件按实际内容记录，避免记录与文件不一致
+                strm_url = read_strm(dir_fd, strm_name)
+            records.append((line, strm_url))
+    finally:
+        os.close(dir_fd)
+    return records, added, updated
+
+
+# 一个任务处理一批目录分组，结果由主线程汇总，worker 之间不共享计数器和文件句柄；
+# 任务带上所属 .strm 目录的设置（strm_save_path、alist_url、update_existing、record_existing），
+# 批量处理时多个目录树的任务可以提交到同一个线程池或进程池
+def write_group_batch(task):
+    options, batch = task
+    batch_records = []
+    batch_added = []
+    batch_updated = []
+    for parent_path, file_names in batch:
+        records, added, updated = write_directory_group(options, parent_path, file_names)
+        batch_records.extend(records)
+        batch_added.extend(added)
+        batch_updated.extend(updated)
+    return batch_records, batch_added, batch_updated
+
+
+# 根据文件列表创建或更新 .strm 文件
+def create_strm_files(media_paths, options, manifest, journal, executor, workers, counts, echo=print):
+    alist_url = options['alist_url']
+    update_existing = options['update_existing']
+
+    # 在主线程中按批过滤：根据生成记录去掉不需要写入的文件
+    def iter_pending_batches():
+        for batch in iter_group_batches(iter_directory_groups(media_paths)):
+            if manifest:
+                # 有记录的文件：跳过模式下直接跳过，更新模式下只重写 URL 有变化的文件，都不需要访问文件系统
+                known_urls = manifest.lookup([
+                    join_media_path(parent_path, file_name)
+                    for parent_path, file_names in batch for file_name in file_names
+                ])
+                pending_batch = []
+                for parent_path, file_names in batch:
+                    pending_names = []
+                    for file_name in file_names:
+                        line = join_media_path(parent_path, file_name)
+                        if line not in known_urls or (
+                            update_existing == 2 and known_urls[line] != f"{alist_url}{urllib.parse.quote(line)}"
+                        ):
+                            pending_names.append(file_name)
+                        else:
+                            counts['skipped'] += 1
+                    if pending_names:
+                        pending_batch.append((parent_path, pending_names))
+                batch = pending_batch
+
+            if batch:
+                yield options, batch
+
+    for records, added, updated in run_bounded(executor, write_group_batch, iter_pending_batches(), workers * 2):
+        counts['created'] += len(added)
+        counts['updated'] += len(updated)
+        counts['skipped'] += len(records) - len(added) - len(updated)
+        # 先写变更记录再写生成记录，中断后重新运行不会漏掉变化
+        if journal:
+            journal.record('added', added)
+            journal.record('updated', updated)
+        if manifest:
+            manifest.record(records)
+        echo(f"\r创建 .strm：{counts['created'] + counts['updated'] + counts['skipped']}", end='')
+
+
+# 删除一批 .strm 文件，并向上清理变空的目录，返回实际删除的文件
+def delete_file_batch(task):
+    strm_save_path, file_paths = task
+    deleted = []
+    for file_path in file_paths:
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        deleted.append(file_path)
+        parent_dir = os.path.dirname(file_path)
+        while parent_dir and parent_dir != strm_save_path:
+            try:
+                os.rmdir(parent_dir)
+            except OSError:
+                break
+            parent_dir = os.path.dirname(parent_dir)
+    return deleted
+
+
+# 删除多余的 .strm 文件：有生成记录时按记录找出已消失的文件，否则使用归并比较时写出的待删除列表
+def delete_obsolete_files(strm_save_path, manifest, journal, delete_list_file, executor, workers, counts, echo=print):
+    prefix = os.path.join(strm_save_path, '')
+    if manifest and manifest.populated:
+        # 根据生成记录找出已消失的文件，不需要扫描 .strm 目录
+        absent_paths = manifest.absent_paths()
+        total = len(absent_paths)
+
+        def iter_delete_batches():
+            for start in range(0, total, CHUNK_SIZE):
+                yield strm_save_path, [os.path.join(strm_save_path, f"{path}.strm") for path in absent_paths[start:start + CHUNK_SIZE]]
+    else:
+        # 待删除列表在文件中，逐批读取，不在内存中保存
+        with open(delete_list_file, 'r', encoding='utf-8', newline='\n') as delete_file:
+            total = sum(1 for _ in delete_file)
+
+        def iter_delete_batches():
+            with open(delete_list_file, 'r', encoding='utf-8', newline='\n') as delete_file:
+                while True:
+                    batch = [f"{prefix}{line[:-1]}.strm" for line in islice(delete_file, CHUNK_SIZE)]
+                    if not batch:
+                        break
+                    yield strm_save_path, batch
+    processed = 0
+
+    for deleted in run_bounded(executor, delete_file_batch, iter_delete_batches(), workers * 2):
+        processed = min(processed + CHUNK_SIZE, total)
+        counts['deleted'] += len(deleted)
+        if journal:
+            journal.record('removed', [file_path[len(prefix):] for file_path in deleted])
+        echo(f"\r删除 .strm：{processed}/{total} ({processed / total:.2%})", end='')
+
+    if manifest and manifest.populated:
+        manifest.forget(absent_paths)
+
+
+def generate_strm_files(config, paths, manifest_file, journal_file, metrics, executor=None, workers=None, echo=print):
+    """根据目录树路径生成 .strm，按配置跳过或更新已有文件，并删除多余的 .strm
+
+    没有传入 executor 时按配置创建线程池或进程池，用完关闭；批量处理时由调用方传入共用的池，
+    并传入 echo 关闭各任务的进度输出，避免多个任务的进度混在一起。
+    """
+    strm_save_path = config['strm_save_path']
+    if not strm_save_path:
+        raise SystemExit('没有配置 .strm 文件保存的路径（strm_save_path）。')
+    os.makedirs(strm_save_path, exist_ok=True)
+    update_existing = int(config['update_existing'])
+    delete_absent = int(config['delete_absent'])
+    use_manifest = int(config['use_manifest'])
+
+    media_extensions = MEDIA_EXTENSIONS | set(config['custom_extensions'].split())
+    options = {
+        'strm_save_path': strm_save_path,
+        'alist_url': strm_base_url(config['alist_url'], config['mount_path']),
+        'update_existing': update_existing,
+        'record_existing': use_manifest == 1,
+    }
+
+    manifest = StrmManifest(manifest_file, os.path.abspath(strm_save_path)) if use_manifest == 1 else None
+    journal = ChangeJournal(journal_file, os.path.abspath(strm_save_path))
+    journal.start_run()
+    try:
+        with tempfile.TemporaryDirectory(prefix='115-strm-') as temp_dir:
+            delete_list_file = os.path.join(temp_dir, 'to_delete.txt')
+            # 只有在需要删除多余文件、且没有可用的生成记录时，才扫描现有的 .strm 文件
+            scan_existing = delete_absent == 1 and not (manifest and manifest.populated)
+            if scan_existing:
+                echo("检测现有 .strm 文件...")
+                with metrics.stage('scan'):
+                    existing_paths = ExternalSorter(temp_dir, 'existing')
+                    for path in iter_existing_files(strm_save_path):
+                        existing_paths.add(sort_key(path))
+
+            if executor is None:
+                _created_dirs.clear()
+                executor, workers = create_executor(int(config['strm_workers']), int(config['strm_worker_mode']))
+                executor_context = executor
+            else:
+                executor_context = nullcontext()
+            with executor_context:
+                echo("创建 .strm 文件...")
+                with metrics.stage('create'):
+                    media_paths = iter_media_paths(paths, int(config['exclude_option']), media_extensions, metrics.counts)
+                    if scan_existing:
+                        # 两边都在有界内存中外部排序后一次归并，得出需要创建、需要删除和没有变化的文件
+                        media_paths = diff_media_paths(media_paths, existing_paths, temp_dir, delete_list_file,
+                                                       update_existing == 2 or manifest is not None, metrics.counts)
+                    create_strm_files(media_paths, options, manifest, journal, executor, workers, metrics.counts, echo)
+
+                if delete_absent == 1:
+                    echo("\n删除多余的 .strm 文件...")
+                    with metrics.stage('delete'):
+                        delete_obsolete_files(strm_save_path, manifest, journal, delete_list_file, executor, workers,
+                                              metrics.counts, echo)
+    finally:
+        journal.close()
+        if manifest:
+            manifest.close()
+    echo(f"\n.strm 文件已生成：新建 {metrics.counts['created']} 个，更新 {metrics.counts['updated']} 个，"
+          f"跳过 {metrics.counts['skipped']} 个，删除 {metrics.counts['deleted']} 个")
+
+
+# ---------------------------------------------------------------------------
+# index：导入 alist 索引数据库
+# ---------------------------------------------------------------------------
+
+# 遍历路径树产出待插入的数据，有子项的是文件夹，没有子项时按名称判断
+def iter_search_nodes(trie, exclude_level, mount_path):
+    for node, path_parts in trie.iter_nodes():
+        if len(path_parts) <= exclude_level:
+            continue
+
+        # 新增目录层级加到剔除目录层级后的信息前面
+        parent = mount_path + '/' + '/'.join(path_parts[exclude_level:-1])
+        is_dir = 1 if trie.is_dir(node) else 0
+        yield parent, path_parts[-1], is_dir
+
+
+# 将数据分批插入到临时数据库中，返回导入的行数
+def insert_data_into_temp_db(trie, db_path, exclude_level, mount_path):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # 临时数据库用完即删，关闭日志和同步写入以加快导入
+    cursor.execute('PRAGMA journal_mode = OFF')
+    cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('PRAGMA temp_store = MEMORY')
+
+    # 创建表结构
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS x_search_nodes (
+        parent TEXT,
+        name TEXT,
+        is_dir INTEGER,
+        size INTEGER
+    )
+    ''')
+
+    start_time = last_report = time.time()
+    total_nodes = len(trie) or 1
+    processed = 0
+
+    def report():
+        elapsed_time = time.time() - start_time
+        minutes, seconds = divmod(int(elapsed_time), 60)
+        print(f"\r已处理：{processed}/{len(trie)}，剔除数：{exclude_level}，进度：{processed / total_nodes:.2%}，耗时：{minutes:02}:{seconds:02}", end='')
+
+    rows = iter_search_nodes(trie, exclude_level, mount_path)
+    while True:
+        batch = list(islice(rows, INDEX_BATCH_SIZE))
+        if not batch:
+            break
+        # 插入数据到表中
+        cursor.executemany('INSERT INTO x_search_nodes (parent, name, is_dir, size) VALUES (?, ?, ?, 0)', batch)
+        processed += len(batch)
+
+        if time.time() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.time()
+            report()
+
+    report()
+    print()  # 换行显示
+    conn.commit()
+    imported = cursor.execute('SELECT COUNT(*) FROM x_search_nodes').fetchone()[0]
+    print(f"总条目数：{len(trie)}，导入：{imported}")
+    conn.close()
+    return imported
+
+
+# 新增到现有索引表，并按 (parent, name) 去重
+def append_search_nodes(db_path, temp_db_path):
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.execute('ATTACH DATABASE ? AS tempdb', (temp_db_path,))
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('''
+        INSERT INTO main.x_search_nodes (parent, name, is_dir, size)
+        SELECT parent, name, is_dir, size FROM tempdb.x_search_nodes
+        ''')
+        # 去重逻辑
+        conn.execute('''
+        DELETE FROM x_search_nodes
+        WHERE rowid NOT IN (
+            SELECT MIN(rowid)
+            FROM x_search_nodes
+            GROUP BY parent, name
+        )
+        ''')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('DETACH DATABASE tempdb')
+    conn.close()
+
+
+# 替换现有索引表的全部数据
+def replace_search_nodes(db_path, temp_db_path):
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.execute('ATTACH DATABASE ? AS tempdb', (temp_db_path,))
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM x_search_nodes')
+        conn.execute('''
+        INSERT INTO main.x_search_nodes (parent, name, is_dir, size)
+        SELECT parent, name, is_dir, size FROM tempdb.x_search_nodes
+        ''')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('DETACH DATABASE tempdb')
+    conn.close()
+
+
+def read_index_roots(roots_file, mount_path):
+    """上次增量更新时目录树的顶层名称；没有记录或挂载路径已改变时返回空列表"""
+    if not roots_file or not os.path.exists(roots_file):
+        return []
+    with open(roots_file, 'r', encoding='utf-8') as file:
+        saved = json.load(file)
+    return saved['roots'] if saved.get('mount_path') == mount_path else []
+
+
+def write_index_roots(roots_file, mount_path, roots):
+    if not roots_file:
+        return
+    temp_file = roots_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump({'mount_path': mount_path, 'roots': sorted(roots)}, file, ensure_ascii=False)
+    os.replace(temp_file, roots_file)
+
+
+# 计算增量：在临时数据库中完成比较，只读取一次 alist 数据库，不持有写锁。
+# 只比较本目录树顶层目录（和上次导入时的顶层目录）下的记录，同一挂载路径下其他目录树导入的记录不受影响；
+# 库中 (parent, name) 重复的记录全部删除后重新插入一条。返回 ([各表行数], 本次的顶层名称)
+def build_search_nodes_delta(db_path, temp_db_path, mount_path, previous_roots=()):
+    conn = sqlite3.connect(temp_db_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    # 顶层的记录 parent 为 "挂载路径/"，与原脚本相同
+    top_parent = mount_path + '/'
+    roots = [row[0] for row in conn.execute('SELECT DISTINCT name FROM x_search_nodes WHERE parent = ?', (top_parent,))]
+    conn.execute('CREATE TABLE scope_roots (name TEXT PRIMARY KEY)')
+    conn.executemany('INSERT OR IGNORE INTO scope_roots (name) VALUES (?)', ((root,) for root in roots + list(previous_roots)))
+
+    conn.execute('ATTACH DATABASE ? AS live', (db_path,))
+    # 按挂载路径范围读出一次（parent 等于挂载路径或以 "挂载路径/" 开头），再按所属的顶层名称过滤
+    conn.execute('''
+    CREATE TABLE current_nodes AS
+    SELECT parent, name, is_dir, size FROM (
+        SELECT parent, name, is_dir, size,
+            CASE WHEN parent = ? OR parent = ? THEN name
+                ELSE substr(parent, ?, instr(substr(parent, ?) || '/', '/') - 1) END AS root
+        FROM live.x_search_nodes
+        WHERE parent = ? OR (parent >= ? AND parent < ?)
+    )
+    WHERE root IN (SELECT name FROM scope_roots)
+    ''', (mount_path, top_parent, len(top_parent) + 1, len(top_parent) + 1, mount_path, top_parent, mount_path + '0'))
+    conn.execute('DETACH DATABASE live')
+
+    # 内容有变化、已消失或重复的记录按 (parent, name) 删除，再插入新增和变化后的记录
+    conn.execute('''
+    CREATE TABLE delta_delete AS
+    SELECT parent, name FROM (
+        SELECT parent, name, is_dir, size FROM current_nodes
+        EXCEPT
+        SELECT parent, name, is_dir, size FROM x_search_nodes
+    )
+    UNION
+    SELECT parent, name FROM current_nodes GROUP BY parent, name HAVING COUNT(*) > 1
+    ''')
+    conn.execute('''
+    CREATE TABLE delta_insert AS
+    SELECT parent, name, is_dir, size FROM x_search_nodes
+    EXCEPT
+    SELECT parent, name, is_dir, size FROM current_nodes
+    UNION
+    SELECT n.parent, n.name, n.is_dir, n.size FROM x_search_nodes n
+    JOIN delta_delete d ON n.parent = d.parent AND n.name = d.name
+    ''')
+    counts = [conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ('x_search_nodes', 'current_nodes', 'delta_delete', 'delta_insert')]
+    conn.close()
+    return counts, roots
+
+
+# 在一个短事务中应用增量，alist 的数据库只被锁定很短的时间
+def apply_search_nodes_delta(db_path, temp_db_path):
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    create_search_indexes(conn)
+    conn.execute('ATTACH DATABASE ? AS delta', (temp_db_path,))
+    start_time = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('''
+        DELETE FROM x_search_nodes WHERE rowid IN (
+            SELECT x.rowid FROM x_search_nodes x
+            JOIN delta.delta_delete d ON x.parent = d.parent AND x.name = d.name
+        )
+        ''')
+        conn.execute('''
+        INSERT INTO x_search_nodes (parent, name, is_dir, size)
+        SELECT parent, name, is_dir, size FROM delta.delta_insert
+        ''')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    lock_time = time.time() - start_time
+    conn.execute('DETACH DATABASE delta')
+    conn.close()
+    return lock_time
+
+
+def create_search_indexes(conn):
+    for index_name, columns in SEARCH_NODE_INDEXES:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON x_search_nodes ({columns})')
+
+
+# 建立搜索用到的索引，并用 ANALYZE 更新统计信息，让查询计划按实际数据选择索引
+def maintain_search_indexes(db_path):
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    try:
+        create_search_indexes(conn)
+        conn.execute(f'PRAGMA analysis_limit = {ANALYZE_LIMIT}')
+        conn.execute('ANALYZE x_search_nodes')
+    finally:
+        conn.close()
+
+
+# 增量更新：与库中本目录树已有的索引比较，只写入有变化的记录；顶层名称保存在 roots_file 中，
+# 下次运行时顶层目录整个消失也能删除
+def update_search_nodes(db_path, temp_db_path, mount_path, roots_file=None):
+    counts, roots = build_search_nodes_delta(db_path, temp_db_path, mount_path, read_index_roots(roots_file, mount_path))
+    new_count, current_count, delete_count, insert_count = counts
+    print(f"本次目录：{new_count}，库中已有：{current_count}，待删除：{delete_count}，待新增：{insert_count}")
+    if new_count == 0:
+        # 目录为空时不应用增量，避免误删该目录树的全部索引
+        print("本次目录没有任何记录，已跳过增量更新。")
+        return
+    if delete_count or insert_count:
+        lock_time = apply_search_nodes_delta(db_path, temp_db_path)
+        print(f"增量已写入，数据库锁定耗时：{lock_time * 1000:.0f} 毫秒")
+    else:
+        print("索引没有变化，无需更新。")
+    write_index_roots(roots_file, mount_path, roots)
+
+def build_index_database(config, trie, metrics, roots_file=None):
+    """把路径树导入 alist 的 x_search_nodes 表，index_mode：1 新增 2 替换 3 增量更新"""
+    db_file = config['db_file']
+    if not db_file or not os.path.exists(db_file):
+        raise SystemExit(f"alist 数据库文件不存在：{db_file}")
+    index_mode = int(config['index_mode'])
+    if index_mode not in (1, 2, 3):
+        raise SystemExit(f"无效的索引导入方式：{index_mode}，请使用 1、2 或 3。")
+    mount_path = normalize_mount_path(config['mount_path'])
+
+    # 创建临时数据库文件以存储处理结果
+    fd, temp_db_file = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        metrics.counts['indexed'] = insert_data_into_temp_db(trie, temp_db_file, int(config['exclude_option']), mount_path)
+        if index_mode == 1:
+            append_search_nodes(db_file, temp_db_file)
+        elif index_mode == 2:
+            replace_search_nodes(db_file, temp_db_file)
+        else:
+            update_search_nodes(db_file, temp_db_file, mount_path, roots_file)
+
+        # 在数据库中创建索引并更新统计信息
+        with metrics.stage('index_maintenance'):
+            maintain_search_indexes(db_file)
+    finally:
+        os.remove(temp_db_file)
+    print("操作完成，索引已更新。")
+
+
+# ---------------------------------------------------------------------------
+# download：下载指定格式文件
+# 长连接复用、令牌桶限速、断点续传、自动识别风控返回的占位内容，任务状态保存在数据库中，中断后再次运行会继续
+# ---------------------------------------------------------------------------
+
+# 令牌桶限速：平均每 interval 秒放行一个请求，最多积攒 burst 个，所有下载线程共用
+class TokenBucket:
+    def __init__(self, interval, burst):
+        self.interval = interval
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    if self.interval <= 0:
+                        return
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) * self.interval
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """暂停所有请求，恢复后从空桶开始，逐步放行"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.updated = self.paused_until
+            self.tokens = 0
+
+
+# 连接池：每个下载线程对每个主机保留一个长连接（keep-alive），alist 重定向到其他主机时另建连接
+class ConnectionPool:
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self, scheme, netloc):
+        connections = self.local.__dict__.setdefault('connections', {})
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connections[(scheme, netloc)] = connection_class(netloc, timeout=self.timeout)
+        return conn
+
+    def _drop(self, scheme, netloc):
+        conn = self.local.__dict__.get('connections', {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def get(self, url, headers, max_redirects=5):
+        for _ in range(max_redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            # 只对非 ASCII 字符编码，已经编码过的路径保持不变
+            path = urllib.parse.quote(parts.path or '/', safe="/%:@!$&'()*+,;=~")
+            if parts.query:
+                path += '?' + parts.query
+            for retry in range(2):
+                conn = self._connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    break
+                except (http.client.HTTPException, OSError):
+                    # 长连接可能已被服务器关闭，换一个新连接重试一次
+                    self._drop(parts.scheme, parts.netloc)
+                    if retry:
+                        raise
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                response.read()
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            if response.getheader('Connection', '').lower() == 'close':
+                # 读完响应后服务器会关闭连接，下次使用新连接
+                self.local.__dict__.get('connections', {}).pop((parts.scheme, parts.netloc), None)
+            return response
+        raise http.client.HTTPException('重定向次数过多')
+
+
+# 识别 115 风控时返回的占位内容。HTML/JSON 响应直接判定为占位内容；其他小文件只有短时间内连续多个不同文件
+# 返回了完全相同的内容时才怀疑，再重新请求一个之前返回了其他内容的文件确认：它也返回同样的内容才判定为占位内容。
+# 相同的歌词、字幕很常见，确认不是占位内容时重新计数；已保存的文件只有确认是占位内容时才撤销
+class StubDetector:
+    def __init__(self, probe):
+        self.probe = probe  # probe(url) 返回该地址开头的最多 STUB_SIZE + 1 字节，请求失败时返回 None
+        self.lock = threading.Lock()
+        self.stubs = set()
+        self.streak_digest = None
+        self.streak = []  # [(时间, url)]，连续返回 streak_digest 的请求
+        self.saved = []  # [(strm_path, url)]，连续返回 streak_digest 且已保存的任务
+        self.reference = None  # 最近一个返回了其他内容的地址
+
+    def check(self, url, body, content_type):
+        """返回 (是否为占位内容, 内容摘要, 之前被当作正常文件保存的任务)"""
+        content_type = content_type.lower()
+        if 'text/html' in content_type or 'application/json' in content_type:
+            return True, None, []
+        digest = hashlib.sha1(body).hexdigest()
+        now = time.monotonic()
+        with self.lock:
+            if digest in self.stubs:
+                return True, digest, []
+            if digest != self.streak_digest:
+                if self.streak:
+                    self.reference = self.streak[-1][1]
+                self.streak_digest = digest
+                self.streak = []
+                self.saved = []
+            self.streak = [(seen, seen_url) for seen, seen_url in self.streak if now - seen <= STUB_WINDOW and seen_url != url]
+            self.streak.append((now, url))
+            if len(self.streak) < STUB_REPEAT:
+                return False, digest, []
+            reference = self.reference
+            self.streak = []
+
+        # 请求参考地址确认，没有参考地址或请求失败时只把本次当作占位内容，不撤销已保存的文件
+        probe_body = self.probe(reference) if reference else None
+        if probe_body is None:
+            return True, digest, []
+        with self.lock:
+            if len(probe_body) <= STUB_SIZE and hashlib.sha1(probe_body).hexdigest() == digest:
+                self.stubs.add(digest)
+                reverted = self.saved if digest == self.streak_digest else []
+                self.saved = []
+                return True, digest, reverted
+            if digest == self.streak_digest:
+                self.saved = []
+            return False, digest, []
+
+    def on_saved(self, strm_path, url, digest):
+        """内容已保存后调用；返回 False 表示保存期间已确认为占位内容，需要撤销"""
+        with self.lock:
+            if digest in self.stubs:
+                return False
+            if digest == self.streak_digest:
+                self.saved.append((strm_path, url))
+            return True
+
+    def on_large(self, url):
+        """大文件不可能是占位内容，中断连续相同内容的计数，并作为之后确认时的参考地址"""
+        with self.lock:
+            self.streak_digest = None
+            self.streak = []
+            self.saved = []
+            self.reference = url
+
+
+# 多个下载线程同时输出时，整行加锁输出，避免内容交错
+print_lock = threading.Lock()
+
+
+def log(message):
+    with print_lock:
+        print(message, flush=True)
+
+
+# 任务状态数据库，多个下载线程共用一个连接，定期提交
+class DownloadState:
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.pending_writes = 0
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS download_jobs (
+            strm_path TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            target TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            updated REAL
+        )
+        ''')
+        # 旧版本按内容相同记录的占位内容特征会误判相同的歌词、字幕，不再使用
+        self.conn.execute('DROP TABLE IF EXISTS stub_signatures')
+        self.conn.execute('DROP TABLE IF EXISTS small_bodies')
+        self.conn.commit()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            self.conn.execute(sql, params)
+            self.pending_writes += 1
+            if self.pending_writes >= 50:
+                self.commit()
+
+    def executemany(self, sql, rows):
+        with self.lock:
+            self.conn.executemany(sql, rows)
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+class Downloader:
+    """下载 .strm 目录中指定格式的文件，下载完成后删除对应的 .strm"""
+
+    def __init__(self, state_path, strm_directory, specified_formats, interval_time, download_workers):
+        self.strm_directory = strm_directory
+        self.specified_formats = specified_formats
+        self.interval_time = interval_time
+        self.download_workers = download_workers
+        self.state = DownloadState(state_path)
+        self.limiter = TokenBucket(interval_time, burst=download_workers)
+        self.pool = ConnectionPool(REQUEST_TIMEOUT)
+        self.detector = StubDetector(self.probe)
+        self.stats = {'stub': 0}
+        self.consecutive_stubs = 0
+        self.stats_lock = threading.Lock()
+
+    # 扫描目录中的指定格式 .strm，更新任务列表：本次找到的任务重新开始计数，.strm 已不存在且未完成的任务删除
+    def scan_jobs(self):
+        state = self.state
+        found = 0
+        # 上次失败的任务重新计数，未完成的任务保留尝试次数继续
+        state.executemany('UPDATE download_jobs SET attempts = 0 WHERE status = ?', [('failed',)])
+        state.executemany('UPDATE download_jobs SET status = ? WHERE status != ?', [('missing', 'done')])
+        for root, _, files in os.walk(self.strm_directory):
+            for file in files:
+                if not file.endswith('.strm'):
+                    continue
+                strm_path = os.path.join(root, file)
+                original_name = file[:-len('.strm')]
+                name_extension = original_name.rsplit('.', 1)[-1].lower() if '.' in original_name else ''
+                # 文件名中带有格式（xxx.lrc.strm）时直接按文件名过滤，不需要读取不相关的 .strm
+                if name_extension and name_extension not in self.specified_formats:
+                    continue
+                with open(strm_path, 'r', encoding='utf-8') as strm_file:
+                    url = strm_file.read().strip()
+                if url.rsplit('/', 1)[-1].rsplit('.', 1)[-1].lower() not in self.specified_formats:
+                    continue
+                state.executemany('''
+                INSERT INTO download_jobs (strm_path, url, target, status, attempts) VALUES (?, ?, ?, 'pending', 0)
+                ON CONFLICT (strm_path) DO UPDATE SET url = excluded.url, target = excluded.target,
+                    status = 'pending', attempts = CASE WHEN download_jobs.status = 'missing' THEN download_jobs.attempts ELSE 0 END
+                ''', [(strm_path, url, os.path.join(root, original_name))])
+                found += 1
+        state.executemany("DELETE FROM download_jobs WHERE status = ?", [('missing',)])
+        state.commit()
+        return found
+
+    def finish_job(self, strm_path, status, size=0, message=None):
+        self.state.execute(
+            'UPDATE download_jobs SET status = ?, attempts = attempts + ?, bytes = ?, message = ?, updated = ? WHERE strm_path = ?',
+            (status, 0 if status == 'done' else 1, size, message, time.time(), strm_path)
+        )
+
+    def probe(self, url):
+        """单独请求一次地址开头的内容，用于确认风控占位内容，不占用下载线程的长连接"""
+        parts = urllib.parse.urlsplit(url)
+        url = urllib.parse.urlunsplit(parts._replace(path=urllib.parse.quote(parts.path or '/', safe="/%:@!$&'()*+,;=~")))
+        request = urllib.request.Request(url, headers={
+            'User-Agent': '115-strm', 'Accept-Encoding': 'identity', 'Range': f'bytes=0-{STUB_SIZE}'
+        })
+        self.limiter.acquire()
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                return response.read(STUB_SIZE + 1)
+        except (http.client.HTTPException, OSError):
+            return None
+
+    def revert(self, strm_path, url):
+        # 撤销被当作正常文件保存的占位内容：删除文件，恢复 .strm，重新排队
+        target = strm_path[:-len('.strm')]
+        if os.path.exists(target):
+            os.remove(target)
+        with open(strm_path, 'w', encoding='utf-8') as strm_file:
+            strm_file.write(url)
+        self.state.execute("UPDATE download_jobs SET status = 'pending' WHERE strm_path = ?", (strm_path,))
+        log(f"识别到风控占位内容，已撤销：{target}")
+
+    def on_stub(self, strm_path, reverted):
+        # reverted 中只有本次运行保存的任务
+        for earlier_strm_path, earlier_url in reverted:
+            self.revert(earlier_strm_path, earlier_url)
+        self.finish_job(strm_path, 'stub', message='风控占位内容')
+        with self.stats_lock:
+            self.stats['stub'] += 1
+            self.consecutive_stubs += 1
+            seconds = min(MAX_BACKOFF, FIRST_BACKOFF * 2 ** (self.consecutive_stubs - 1))
+        log(f"疑似触发风控，暂停 {seconds} 秒后继续：{strm_path}")
+        self.limiter.pause(seconds)
+
+    def download_job(self, job):
+        strm_path, url, target = job
+        part_file = target + '.part'
+        offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        headers = {'User-Agent': '115-strm', 'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+
+        self.limiter.acquire()
+        try:
+            response = self.pool.get(url, headers)
+        except (http.client.HTTPException, OSError) as error:
+            self.finish_job(strm_path, 'pending', message=str(error))
+            log(f"文件下载失败：{url}（{error}）")
+            return
+
+        try:
+            if response.status == 416 and offset:
+                # 已经下载完整，只差改名
+                response.read()
+            elif response.status not in (200, 206):
+                response.read()
+                self.finish_job(strm_path, 'pending', message=f'HTTP {response.status}')
+                log(f"文件下载失败：{url}（HTTP {response.status}）")
+                return
+            else:
+                if response.status == 200:
+                    offset = 0  # 服务器不支持续传，从头下载
+                content_length = response.getheader('Content-Length')
+                expected_size = offset + int(content_length) if content_length and content_length.isdigit() else None
+                first_chunk = response.read(STUB_SIZE + 1)
+                digest = None
+                if offset == 0 and len(first_chunk) <= STUB_SIZE:
+                    is_stub, digest, reverted = self.detector.check(url, first_chunk, response.getheader('Content-Type', ''))
+                    if is_stub:
+                        self.on_stub(strm_path, reverted)
+                        return
+                else:
+                    self.detector.on_large(url)
+                with open(part_file, 'ab' if offset else 'wb') as output:
+                    output.write(first_chunk)
+                    while True:
+                        chunk = response.read(READ_SIZE)
+                        if not chunk:
+                            break
+                        output.write(chunk)
+                # 连接提前断开时 read 不会报错，按响应头的长度检查是否下载完整
+                if expected_size is not None and os.path.getsize(part_file) < expected_size:
+                    raise http.client.IncompleteRead(b'', expected_size - os.path.getsize(part_file))
+        except (http.client.HTTPException, OSError) as error:
+            # 已下载的部分保留在 .part 文件中，下次从断点继续
+            self.finish_job(strm_path, 'pending', message=str(error))
+            log(f"文件下载中断，下次从断点继续：{url}（{error!r}）")
+            return
+
+        os.replace(part_file, target)
+        size = os.path.getsize(target)
+        os.remove(strm_path)
+        self.finish_job(strm_path, 'done', size)
+        if digest is not None and not self.detector.on_saved(strm_path, url, digest):
+            self.revert(strm_path, url)
+            return
+        with self.stats_lock:
+            self.consecutive_stubs = 0
+        log(f"文件下载完成：{target}，已删除对应的 .strm 文件")
+
+    def run_pass(self, jobs):
+        job_iter = iter(jobs)
+        job_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with job_lock:
+                    job = next(job_iter, None)
+                if job is None:
+                    return
+                self.download_job(job)
+
+        threads = [threading.Thread(target=worker) for _ in range(self.download_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.state.commit()
+
+    def run(self):
+        """返回 (找到的任务数, 成功下载数, 失败数)"""
+        state = self.state
+        print(f"正在扫描目录 {self.strm_directory} 中的指定文件格式 .strm...")
+        total_jobs = self.scan_jobs()
+        if total_jobs == 0:
+            print("目录中没有发现任何带有指定格式的 .strm，请检查路径或文件内容。")
+            state.close()
+            return 0, 0, 0
+        print(f"共 {total_jobs} 个待下载文件，{self.download_workers} 个连接，每个请求间隔约 {self.interval_time} 秒")
+        started = time.time()
+        try:
+            # 失败和遇到风控的任务留到下一轮重试，直到全部完成或达到最大尝试次数
+            while True:
+                jobs = state.query(
+                    "SELECT strm_path, url, target FROM download_jobs WHERE status IN ('pending', 'stub') AND attempts < ? ORDER BY strm_path",
+                    (DOWNLOAD_MAX_ATTEMPTS,)
+                )
+                if not jobs:
+                    break
+                self.run_pass(jobs)
+        finally:
+            state.executemany("UPDATE download_jobs SET status = 'failed' WHERE status IN (?, ?) AND attempts >= ?", [('pending', 'stub', DOWNLOAD_MAX_ATTEMPTS)])
+            failed = state.query("SELECT COUNT(*) FROM download_jobs WHERE status = 'failed'")[0][0]
+            # 成功数按数据库统计本次运行完成的任务，撤销后重新下载的任务只算一次
+            done = state.query("SELECT COUNT(*) FROM download_jobs WHERE status = 'done' AND updated >= ?", (started,))[0][0]
+            state.close()
+        print(f"文件下载完成，共 {total_jobs} 个 .strm 文件，成功下载 {done} 个，识别到风控 {self.stats['stub']} 次，失败 {failed} 个。")
+        return total_jobs, done, failed
+
+
+def download_specified_files(config, state_path, metrics):
+    strm_directory = config['last_strm_directory']
+    if not os.path.isdir(strm_directory):
+        raise SystemExit(f".strm 文件所在目录不存在：{strm_directory}")
+    specified_formats = set(config['last_user_formats'].lower().split())
+    if not specified_formats:
+        raise SystemExit("没有配置要下载的文件格式（last_user_formats）。")
+    downloader = Downloader(
+        state_path, strm_directory, specified_formats,
+        float(config['last_interval_time'] or 3), max(1, int(config['download_workers'] or 2))
+    )
+    _, downloaded, failed = downloader.run()
+    metrics.counts['downloaded'] = downloaded
+    metrics.counts['download_failed'] = failed
+
+
+# ---------------------------------------------------------------------------
+# rename：去除 .strm 文件名中的原始格式（xx.mp4.strm -> xx.strm）
+# ---------------------------------------------------------------------------
+
+# 冲突的处理方式，与菜单中的选项相同
+RENAME_OVERWRITE, RENAME_SKIP, RENAME_NUMBERED = 1, 2, 3
+
+
+def renamed_strm_name(file_name):
+    """去除 .strm 前面的一层格式，与 sed 's/\\.[^.]*\\.strm$/\\.strm/' 相同；不需要改名时返回原名"""
+    stem = file_name[:-len('.strm')]
+    if '.' not in stem:
+        return file_name
+    return stem.rpartition('.')[0] + '.strm'
+
+
+def plan_strm_renames(strm_directory):
+    """用 os.scandir 遍历一次 .strm 目录，产出每个需要改名的目录的计划
+
+    产出 (目录, [(原文件名, 新文件名)], {冲突的新文件名: [原文件名]}, 该目录的 .strm 数量)。
+    目标文件已存在、或多个文件改名后相同都算冲突；同名的文件只会在同一目录中，按目录分别判断即可。
+    和 find 相同，不跟随符号链接。
+    """
+    pending = [strm_directory]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as entries:
+            entries = list(entries)
+        names = set()
+        renames = []
+        sources = {}
+        strm_count = 0
+        for entry in entries:
+            names.add(entry.name)
+            if entry.name.endswith('.strm') and entry.is_file(follow_symlinks=False):
+                strm_count += 1
+                target_name = renamed_strm_name(entry.name)
+                if target_name != entry.name:
+                    renames.append((entry.name, target_name))
+                    sources.setdefault(target_name, []).append(entry.name)
+        # 子目录按读取的顺序处理
+        pending.extend(reversed([entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]))
+        conflicts = {
+            target_name: source_names for target_name, source_names in sources.items()
+            if len(source_names) > 1
+            or (target_name in names and os.path.exists(os.path.join(directory, target_name)))
+        }
+        yield directory, renames, conflicts, strm_count
+
+
+def write_rename_plan(strm_directory, plan_path):
+    """扫描 .strm 目录并写出重命名计划，打印冲突文件，返回 (计划, 统计)
+
+    计划文件第一行为汇总，之后每个目录一行 JSON：{"dir": 目录, "renames": [[原文件名, 新文件名]]}。
+    """
+    plan = []
+    totals = {'files': 0, 'renames': 0, 'conflicts': 0}
+    conflict_lines = []
+    for directory, renames, conflicts, strm_count in plan_strm_renames(strm_directory):
+        totals['files'] += strm_count
+        if not renames:
+            continue
+        totals['renames'] += len(renames)
+        totals['conflicts'] += len(conflicts)
+        plan.append((directory, renames))
+        for target_name, source_names in conflicts.items():
+            conflict_lines.append(f"目标文件：{os.path.join(directory, target_name)}")
+            conflict_lines.append("冲突文件：")
+            conflict_lines.extend(f"  - {os.path.join(directory, name)}" for name in source_names)
+            conflict_lines.append("=" * 64)
+
+    temp_path = plan_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(dict(strm_directory=strm_directory, **totals), ensure_ascii=False) + '\n')
+        for directory, renames in plan:
+            file.write(json.dumps({'dir': directory, 'renames': renames}, ensure_ascii=False) + '\n')
+    os.replace(temp_path, plan_path)
+
+    print(f"扫描完毕：共 {totals['files']} 个 .strm 文件，需要重命名 {totals['renames']} 个，"
+          f"无需重命名 {totals['files'] - totals['renames']} 个。")
+    print(f"重命名计划已写入：{plan_path}")
+    if conflict_lines:
+        print("")
+        print("注意：以下文件重命名后会产生文件名冲突：")
+        print("=" * 64)
+        print('\n'.join(conflict_lines))
+    return plan, totals
+
+
+def read_rename_plan(strm_directory, plan_path):
+    """读取上次扫描写出的重命名计划，目录与本次不同时需要重新扫描"""
+    with open(plan_path, 'r', encoding='utf-8') as file:
+        header = json.loads(file.readline())
+        if header['strm_directory'] != strm_directory:
+            raise SystemExit(f"重命名计划不是为 {strm_directory} 生成的，请重新扫描。")
+        return [(item['dir'], [tuple(rename) for rename in item['renames']]) for item in map(json.loads, file)], header
+
+
+def rename_directory_files(task):
+    """按顺序处理一个目录中的改名，返回 [重命名, 覆盖, 自动重命名, 跳过, 失败] 的数量
+
+    目标是否存在在改名时再检查，多个文件改名后相同时，第一个直接改名，后面的按冲突处理；
+    没有选择冲突处理方式时跳过。
+    """
+    directory, renames, conflict_choice = task
+    counts = [0, 0, 0, 0, 0]
+    for source_name, target_name in renames:
+        source_path = os.path.join(directory, source_name)
+        target_path = os.path.join(directory, target_name)
+        try:
+            if not os.path.exists(target_path):
+                os.rename(source_path, target_path)
+                counts[0] += 1
+            elif conflict_choice == RENAME_OVERWRITE:
+                os.replace(source_path, target_path)
+                counts[1] += 1
+            elif conflict_choice == RENAME_NUMBERED:
+                counter = 1
+                while os.path.exists(f"{target_path[:-len('.strm')]}({counter}).strm"):
+                    counter += 1
+                os.rename(source_path, f"{target_path[:-len('.strm')]}({counter}).strm")
+                counts[2] += 1
+            else:
+                counts[3] += 1
+        except OSError as e:
+            log(f"重命名失败：{source_path}：{e}")
+            counts[4] += 1
+    return counts
+
+
+def rename_strm_files(config, plan_path, metrics, dry_run=False, use_plan=False, conflict_choice=RENAME_SKIP):
+    """去除 .strm 文件名中的原始格式；dry_run 时只扫描并写出计划，use_plan 时按上次的计划执行，不再扫描"""
+    strm_directory = config['last_strm_directory']
+    if not os.path.isdir(strm_directory):
+        raise SystemExit(f".strm 文件所在目录不存在：{strm_directory}")
+    if use_plan:
+        plan, totals = read_rename_plan(strm_directory, plan_path)
+    else:
+        print(f"正在扫描目录 {strm_directory} 中的所有 .strm 文件...")
+        plan, totals = write_rename_plan(strm_directory, plan_path)
+    metrics.counts['rename_conflicts'] = totals['conflicts']
+    if dry_run:
+        return
+
+    print("正在处理文件...")
+    # 不同目录之间没有冲突，按目录并行改名，同一目录中保持扫描的顺序
+    totals_done = [0, 0, 0, 0, 0]
+    executor, workers = create_executor(int(config['strm_workers']), int(config['strm_worker_mode']))
+    with executor:
+        tasks = ((directory, renames, conflict_choice) for directory, renames in plan)
+        for counts in run_bounded(executor, rename_directory_files, tasks, workers * 2):
+            totals_done = [total + count for total, count in zip(totals_done, counts)]
+    renamed, overwritten, numbered, skipped, failed = totals_done
+    metrics.counts['renamed'] = renamed + overwritten + numbered
+    print(f"文件处理完成：重命名 {renamed} 个，覆盖 {overwritten} 个，自动重命名 {numbered} 个，"
+          f"跳过 {skipped} 个，失败 {failed} 个，无需重命名 {totals['files'] - totals['renames']} 个。")
+
+
+# ---------------------------------------------------------------------------
+# notify：通知 Emby 刷新有变化的目录
+# ---------------------------------------------------------------------------
+
+def post_json(url, api_key, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode('utf-8'), method='POST',
+        headers={'Content-Type': 'application/json', 'X-Emby-Token': api_key},
+    )
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        response.read()
+
+
+def media_update_type(local_directory, changes):
+    """目录中只有新增时为 Created，只有删除且目录已被清理时为 Deleted，其他为 Modified"""
+    if changes == {'added'}:
+        return 'Created'
+    if changes == {'removed'} and not os.path.isdir(local_directory):
+        return 'Deleted'
+    return 'Modified'
+
+
+def notify_media_server(config, journal_file, metrics):
+    """把还没有通知的变化按目录发给 Emby 的 /Library/Media/Updated，Emby 只扫描这些目录
+
+    通知失败时保留记录，下次运行时与新的变化一起通知。
+    """
+    emby_url = config['emby_url'].rstrip('/')
+    if not emby_url:
+        raise SystemExit('没有配置 Emby 地址（emby_url）。')
+    strm_root = os.path.abspath(config['strm_save_path'])
+    # Emby 中看到的 .strm 目录，例如 Docker 中挂载到了其他路径；留空时与本机路径相同
+    media_root = (config['emby_strm_path'] or strm_root).rstrip('/')
+
+    journal = ChangeJournal(journal_file, strm_root)
+    try:
+        run_ids, directories = journal.pending_directories()
+        if not directories:
+            journal.mark_notified(run_ids)
+            print("没有需要通知 Emby 的变化。")
+            return
+        try:
+            if len(directories) > NOTIFY_MAX_DIRECTORIES:
+                print(f"有变化的目录共 {len(directories)} 个，通知 Emby 刷新整个媒体库...")
+                post_json(f"{emby_url}/Library/Refresh", config['emby_api_key'], {})
+            else:
+                updates = [
+                    {
+                        'Path': f"{media_root}/{directory}" if directory else media_root,
+                        'UpdateType': media_update_type(os.path.join(strm_root, directory), changes),
+                    }
+                    for directory, changes in directories
+                ]
+                for start in range(0, len(updates), NOTIFY_BATCH_SIZE):
+                    post_json(f"{emby_url}/Library/Media/Updated", config['emby_api_key'],
+                              {'Updates': updates[start:start + NOTIFY_BATCH_SIZE]})
+                print(f"已通知 Emby 刷新 {len(updates)} 个有变化的目录。")
+        except OSError as e:
+            print(f"通知 Emby 失败：{e}，变化已保留，下次运行时重新通知。")
+            metrics.counts['notify_pending'] = len(directories)
+            return
+        journal.mark_notified(run_ids)
+        metrics.counts['notified_directories'] = len(directories)
+    finally:
+        journal.close()
+
+
+# ---------------------------------------------------------------------------
+# batch：一次运行处理多个目录树
+# ---------------------------------------------------------------------------
+
+def read_batch_jobs(jobs_file, config):
+    """读取批量任务文件：每个任务以 [名称] 开头，之后是覆盖主配置的配置项，格式与配置文件相同
+
+    返回 [(名称, 任务配置)]；名称用于区分各任务的生成记录和变更记录，只能使用字母、数字、下划线和减号。
+    """
+    jobs = []
+    with open(jobs_file, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                name = line[1:-1].strip()
+                if not name or not all(char.isalnum() or char in '_-' for char in name):
+                    raise SystemExit(f"批量任务名称只能使用字母、数字、下划线和减号（第 {line_number} 行）：{name}")
+                if any(name == job_name for job_name, _ in jobs):
+                    raise SystemExit(f"批量任务名称重复（第 {line_number} 行）：{name}")
+                jobs.append((name, dict(config)))
+                continue
+            item = parse_config_line(line)
+            if not item or not jobs:
+                raise SystemExit(f"批量任务文件格式错误（第 {line_number} 行），应为 [任务名称] 或 键=\"值\"：{line}")
+            jobs[-1][1][item[0]] = item[1]
+    if not jobs:
+        raise SystemExit(f"批量任务文件中没有任务：{jobs_file}")
+    for name, job_config in jobs:
+        if not (job_config['directory_tree_url'] or job_config['directory_tree_file']):
+            raise SystemExit(f"批量任务 {name} 没有配置目录树（directory_tree_url 或 directory_tree_file）。")
+    return jobs
+
+
+def prepare_batch_job(task):
+    """在子进程中准备一个任务：下载并解析目录树，按需写出目录文件，写出快照；要导入索引时在任务自己的临时数据库中准备好数据
+
+    目录树已经有有效的快照时直接加载，不再解析。子进程的输出不显示，结果返回给主进程汇总。
+    """
+    name, job_config, convert, index_db_file, roots_file = task
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        metrics = RunMetrics(name, '', '')
+        tree_file = job_config['directory_tree_url'] or job_config['directory_tree_file']
+        if tree_file.startswith('http'):
+            with metrics.stage('download'):
+                tree_file = fetch_tree_file(tree_file)
+        if not os.path.isfile(tree_file):
+            raise SystemExit(f"批量任务 {name} 的目录树文件不存在：{tree_file}")
+        source = TreeSource(tree_file, False, metrics, 1, default_snapshot_file(tree_file))
+        trie = source.trie()
+        if convert:
+            directory_file = default_directory_file(tree_file)
+            with metrics.stage('convert'):
+                metrics.counts['converted'] = write_directory_file(trie.iter_paths(), directory_file)
+            source.save_snapshot(directory_file)
+        elif source.parsed:
+            source.save_snapshot()
+
+        delta = None
+        if index_db_file:
+            mount_path = normalize_mount_path(job_config['mount_path'])
+            with metrics.stage('index_prepare'):
+                metrics.counts['indexed'] = insert_data_into_temp_db(trie, index_db_file, int(job_config['exclude_option']), mount_path)
+                if job_config['index_mode'] == '3':
+                    delta = build_search_nodes_delta(job_config['db_file'], index_db_file, mount_path,
+                                                     read_index_roots(roots_file, mount_path))
+    return tree_file, metrics.stages, metrics.counts, delta
+
+
+def merge_search_nodes(combined_db_file, job_db_files, index_mode):
+    """把各任务临时数据库中的数据（增量模式下为增量）合并到一个临时数据库，之后在一个事务中写入 alist 的数据库"""
+    conn = sqlite3.connect(combined_db_file, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    if index_mode == 3:
+        tables = ('delta_delete', 'delta_insert')
+        conn.execute('CREATE TABLE delta_delete (parent TEXT, name TEXT)')
+        conn.execute('CREATE TABLE delta_insert (parent TEXT, name TEXT, is_dir INTEGER, size INTEGER)')
+    else:
+        tables = ('x_search_nodes',)
+        conn.execute('CREATE TABLE x_search_nodes (parent TEXT, name TEXT, is_dir INTEGER, size INTEGER)')
+    for job_db_file in job_db_files:
+        conn.execute('ATTACH DATABASE ? AS job', (job_db_file,))
+        for table in tables:
+            conn.execute(f'INSERT INTO main.{table} SELECT * FROM job.{table}')
+        conn.execute('DETACH DATABASE job')
+    conn.close()
+
+
+def check_batch_index_roots(jobs, deltas):
+    """增量更新按目录树的顶层名称划分范围，同一数据库、同一挂载路径下的两个任务有相同的顶层名称时会互相删除记录"""
+    owners = {}
+    for name, job_config in jobs:
+        if deltas.get(name) is None:
+            continue
+        key = (job_config['db_file'], normalize_mount_path(job_config['mount_path']))
+        for root in deltas[name][1]:
+            other = owners.setdefault(key + (root,), name)
+            if other != name:
+                raise SystemExit(f"批量任务 {other} 和 {name} 挂载在同一路径 {key[1] or '/'} 下，且都有顶层目录 {root}，"
+                                 f"不能使用增量更新（index_mode=3），请修改挂载路径或改用其他导入方式。")
+
+
+def apply_batch_search_nodes(db_file, index_mode, job_results, temp_dir):
+    """把同一个 alist 数据库的所有任务合并后，在一个事务中写入，并整理索引"""
+    job_db_files = []
+    applied_roots = []
+    for name, job_db_file, delta, mount_path, roots_file in job_results:
+        if index_mode == 3:
+            (new_count, current_count, delete_count, insert_count), roots = delta
+            print(f"[{name}] 本次目录：{new_count}，库中已有：{current_count}，待删除：{delete_count}，待新增：{insert_count}")
+            if new_count == 0:
+                # 目录为空时不应用增量，避免误删该目录树的全部索引
+                print(f"[{name}] 本次目录没有任何记录，已跳过增量更新。")
+                continue
+            applied_roots.append((roots_file, mount_path, roots))
+        job_db_files.append(job_db_file)
+
+    fd, combined_db_file = tempfile.mkstemp(suffix='.db', dir=temp_dir)
+    os.close(fd)
+    merge_search_nodes(combined_db_file, job_db_files, index_mode)
+    if index_mode == 1:
+        append_search_nodes(db_file, combined_db_file)
+    elif index_mode == 2:
+        replace_search_nodes(db_file, combined_db_file)
+    elif job_db_files:
+        lock_time = apply_search_nodes_delta(db_file, combined_db_file)
+        print(f"增量已写入 {db_file}，数据库锁定耗时：{lock_time * 1000:.0f} 毫秒")
+        for roots_file, mount_path, roots in applied_roots:
+            write_index_roots(roots_file, mount_path, roots)
+    maintain_search_indexes(db_file)
+
+
+def run_batch(config, stages, jobs, config_file=None, script_name='115-strm'):
+    """批量处理多个目录树：并行解析，.strm 共用一个线程池（或进程池）写入，索引在一个事务中写入
+
+    每个任务的生成记录和变更记录保存在配置文件旁边的 xxx.<任务名称>.manifest.db 和 xxx.<任务名称>.journal.db。
+    """
+    unsupported = [stage for stage in stages if stage not in ('convert', 'strm', 'index', 'notify')]
+    if unsupported:
+        raise SystemExit(f"批量处理只支持 convert、strm、index、notify 阶段：{' '.join(unsupported)}")
+    report_file = config['metrics_report']
+    if not report_file and config_file:
+        report_file = state_file(config_file, '.report.json')
+    metrics = RunMetrics(script_name, report_file, config['metrics_textfile'])
+
+    def merge_job_metrics(name, stages_of_job, counts):
+        for stage_name, stage in stages_of_job.items():
+            metrics.stages[f'{name}.{stage_name}'] = stage
+        for key, value in counts.items():
+            metrics.counts[key] = metrics.counts.get(key, 0) + value
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='115-strm-batch-') as temp_dir:
+            index_jobs = {}
+            if 'index' in stages:
+                for name, job_config in jobs:
+                    if not job_config['db_file'] or not os.path.exists(job_config['db_file']):
+                        raise SystemExit(f"批量任务 {name} 的 alist 数据库文件不存在：{job_config['db_file']}")
+                    if job_config['index_mode'] not in ('1', '2', '3'):
+                        raise SystemExit(f"批量任务 {name} 的索引导入方式无效：{job_config['index_mode']}，请使用 1、2 或 3。")
+                    index_jobs[name] = os.path.join(temp_dir, f'{name}.db')
+
+            # 各任务在子进程中并行下载、解析目录树并写出快照，总耗时接近最大的一个目录树
+            tree_files = {}
+            deltas = {}
+            if any(stage in stages for stage in ('convert', 'strm', 'index')):
+                parse_workers = int(config['parse_workers'])
+                if parse_workers <= 0:
+                    parse_workers = min(32, os.cpu_count() or 1)
+                print(f"并行解析 {len(jobs)} 个目录树...")
+                tasks = [(name, job_config, 'convert' in stages, index_jobs.get(name),
+                          state_file(config_file, f'.{name}.index-roots.json')) for name, job_config in jobs]
+                with metrics.stage('prepare'), ProcessPoolExecutor(
+                        max_workers=min(parse_workers, len(jobs)), mp_context=multiprocessing.get_context('fork')) as executor:
+                    for (name, _), result in zip(jobs, executor.map(prepare_batch_job, tasks)):
+                        tree_files[name], stages_of_job, counts, deltas[name] = result
+                        merge_job_metrics(name, stages_of_job, counts)
+                        print(f"[{name}] 目录树已就绪：{tree_files[name]}")
+
+            if index_jobs:
+                check_batch_index_roots(jobs, deltas)
+
+            if 'strm' in stages:
+                with metrics.stage('strm'):
+                    run_batch_strm(config, jobs, tree_files, config_file, merge_job_metrics)
+
+            if index_jobs:
+                with metrics.stage('index'):
+                    # 同一个 alist 数据库的所有任务在一个事务中写入
+                    by_db_file = {}
+                    for name, job_config in jobs:
+                        by_db_file.setdefault((job_config['db_file'], int(job_config['index_mode'])), []).append(
+                            (name, index_jobs[name], deltas[name], normalize_mount_path(job_config['mount_path']),
+                             state_file(config_file, f'.{name}.index-roots.json')))
+                    for (db_file, index_mode), job_results in by_db_file.items():
+                        apply_batch_search_nodes(db_file, index_mode, job_results, temp_dir)
+                print("操作完成，索引已更新。")
+
+            if 'notify' in stages:
+                with metrics.stage('notify'):
+                    for name, job_config in jobs:
+                        if not job_config['emby_url']:
+                            print(f"[{name}] 没有配置 Emby 地址，跳过通知。")
+                            continue
+                        print(f"[{name}] ", end='')
+                        notify_media_server(job_config, state_file(config_file, f'.{name}.journal.db'), metrics)
+    except BaseException:
+        metrics.write('failed')
+        raise
+    metrics.write('ok')
+    return metrics
+
+
+def run_batch_strm(config, jobs, tree_files, config_file, merge_job_metrics):
+    """每个任务在自己的线程中生成 .strm，写文件的任务都提交到同一个有界的线程池（或进程池）"""
+    executor, workers = create_executor(int(config['strm_workers']), int(config['strm_worker_mode']))
+    _created_dirs.clear()
+    with executor:
+        # 多进程模式下先启动子进程，再创建各任务的线程，避免在有其他线程时 fork
+        executor.submit(int).result()
+        results = {}
+
+        def run_job(name, job_config):
+            job_metrics = RunMetrics(name, '', '')
+            tree_file = tree_files[name]
+            source = TreeSource(tree_file, False, job_metrics, 1, default_snapshot_file(tree_file))
+            generate_strm_files(job_config, source.iter_paths(), state_file(config_file, f'.{name}.manifest.db'),
+                                state_file(config_file, f'.{name}.journal.db'), job_metrics, executor, workers,
+                                lambda *args, **kwargs: None)
+            return job_metrics
+
+        with ThreadPoolExecutor(max_workers=len(jobs)) as job_executor:
+            futures = [(name, job_executor.submit(run_job, name, job_config)) for name, job_config in jobs]
+            for name, future in futures:
+                results[name] = future.result()
+    for name, job_metrics in results.items():
+        counts = job_metrics.counts
+        print(f"[{name}] 新建 {counts['created']} 个，更新 {counts['updated']} 个，跳过 {counts['skipped']} 个，删除 {counts['deleted']} 个")
+        merge_job_metrics(name, job_metrics.stages, counts)
+
+
+def default_directory_file(tree_file):
+    """与 shell 脚本相同：目录树文件名去掉 .txt 后加上 _目录文件.txt"""
+    base = tree_file[:-len('.txt')] if tree_file.endswith('.txt') else tree_file
+    return base + '_目录文件.txt'
+
+
+def run_stages(config, stages, config_file=None, tree_file=None, directory_file=None,
+               script_name='115-strm', shell_stages=(), tree_unchanged=False, rename_dry_run=False, rename_use_plan=False):
+    """在一个进程中按顺序执行选中的阶段，返回运行指标"""
+    report_file = config['metrics_report']
+    if not report_file and config_file:
+        report_file = state_file(config_file, '.report.json')
+    metrics = RunMetrics(script_name, report_file, config['metrics_textfile'])
+    for name, started, finished, bytes_written in shell_stages:
+        values = {'bytes_written': bytes_written} if bytes_written is not None else {}
+        if name == 'download':
+            values['changed'] = not tree_unchanged
+        metrics.add_stage(name, started, finished, **values)
+
+    if tree_unchanged:
+        # 目录树没有变化，跳过解析和生成，只重试上次没有通知成功的变化并更新运行报告
+        print("目录树没有变化，跳过生成 .strm 文件。")
+        if 'notify' in stages:
+            with metrics.stage('notify'):
+                notify_media_server(config, state_file(config_file, '.journal.db'), metrics)
+        metrics.write('ok')
+        return metrics
+
+    try:
+        tree_stages = [stage for stage in stages if stage in ('convert', 'strm', 'index')]
+        source = None
+        if tree_stages:
+            if not tree_file:
+                tree_file = config['directory_tree_url'] or config['directory_tree_file']
+            if ('convert' not in stages and not directory_file and config['strm_source'] != '2'
+                    and tree_file and os.path.isfile(tree_file)):
+                # 从上次转换的目录文件生成时，目录文件不存在或比目录树旧（目录树已更新）就先重新转换
+                existing_directory_file = default_directory_file(tree_file)
+                if (not os.path.isfile(existing_directory_file)
+                        or os.path.getmtime(existing_directory_file) < os.path.getmtime(tree_file)):
+                    print(f"目录文件不存在或比目录树旧，先重新转换：{existing_directory_file}")
+                    stages = ['convert'] + list(stages)
+                    tree_stages = ['convert'] + tree_stages
+            # 没有转换步骤、且指定了目录文件或配置为从目录文件生成时，读取目录文件；否则读取目录树
+            use_directory_file = 'convert' not in stages and (directory_file or config['strm_source'] != '2')
+            if use_directory_file:
+                directory_file = directory_file or default_directory_file(tree_file)
+            elif tree_file.startswith('http'):
+                with metrics.stage('download'):
+                    tree_file = fetch_tree_file(tree_file)
+            source_file = directory_file if use_directory_file else tree_file
+            if not source_file or not os.path.isfile(source_file):
+                raise SystemExit(f"{'目录文件' if use_directory_file else '目录树文件'}不存在：{source_file}")
+            parse_workers = int(config['parse_workers'])
+            if parse_workers <= 0:
+                parse_workers = min(32, os.cpu_count() or 1)
+            source = TreeSource(source_file, use_directory_file, metrics, parse_workers, default_snapshot_file(source_file))
+            # 多个阶段都要用到目录树、需要判断文件夹或要写出快照时先解析为路径树，之后都从内存读取
+            if len(tree_stages) > 1 or 'index' in tree_stages or 'convert' in tree_stages:
+                source.trie()
+
+        if 'convert' in stages:
+            output_path = default_directory_file(tree_file)
+            with metrics.stage('convert'):
+                written = write_directory_file(source.iter_paths(), output_path)
+            metrics.stages['convert']['items'] = written
+            print(f"目录文件已生成：{output_path}")
+            # 快照同时记录目录树和刚生成的目录文件，之后的菜单使用任意一个都可以直接加载快照
+            source.save_snapshot(output_path)
+        elif source and source.parsed:
+            source.save_snapshot()
+
+        if 'strm' in stages:
+            generate_strm_files(config, source.iter_paths(), state_file(config_file, '.manifest.db'),
+                                state_file(config_file, '.journal.db'), metrics)
+
+        if 'index' in stages:
+            with metrics.stage('index'):
+                build_index_database(config, source.trie(), metrics, state_file(config_file, '.index-roots.json'))
+
+        if 'download' in stages:
+            with metrics.stage('download_files'):
+                download_specified_files(config, state_file(config_file, '.download.db'), metrics)
+
+        if 'rename' in stages:
+            with metrics.stage('rename'):
+                rename_strm_files(config, state_file(config_file, '.rename-plan.jsonl'), metrics,
+                                  rename_dry_run, rename_use_plan, int(config['rename_conflict']))
+
+        if 'notify' in stages:
+            with metrics.stage('notify'):
+                notify_media_server(config, state_file(config_file, '.journal.db'), metrics)
+    except BaseException:
+        metrics.write('failed')
+        raise
+    metrics.write('ok')
+    return metrics
+
+
+# ---------------------------------------------------------------------------
+# 命令行
+# ---------------------------------------------------------------------------
+
+def parse_shell_stage(value):
+    """解析 --shell-stage 的值：名称,开始时间,结束时间[,字节数]"""
+    parts = value.split(',')
+    if len(parts) not in (3, 4):
+        raise argparse.ArgumentTypeError(f"格式应为 名称,开始时间,结束时间[,字节数]：{value}")
+    bytes_written = int(parts[3] or 0) if len(parts) == 4 else None
+    return parts[0], parts[1], parts[2], bytes_written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='115-strm 处理引擎：解析目录树、生成 .strm、导入 alist 索引、下载指定格式文件')
+    parser.add_argument('stages', nargs='+', choices=STAGES, help='要执行的阶段，按 convert、strm、index、download、rename、notify 的顺序执行')
+    parser.add_argument('-c', '--config', help='配置文件，格式与 115-strm-update.conf 相同；生成记录、下载状态和运行报告保存在它旁边')
+    parser.add_argument('--set', action='append', default=[], metavar='键=值', help='覆盖配置项，可以重复使用，例如 --set exclude_option=2')
+    parser.add_argument('--tree', help='目录树文件或下载链接，默认使用配置中的 directory_tree_url 或 directory_tree_file')
+    parser.add_argument('--directory-file', help='目录文件，默认为目录树文件名加 _目录文件.txt')
+    parser.add_argument('--db-file', help='alist 的 data.db（index 阶段），与 --set db_file=... 相同')
+    parser.add_argument('--index-mode', choices=('1', '2', '3'), help='索引导入方式：1 新增 2 替换 3 增量更新，默认 3')
+    parser.add_argument('--rename-conflict', choices=('1', '2', '3'), help='重命名冲突的处理方式：1 覆盖 2 跳过 3 自动重命名，默认 2')
+    parser.add_argument('--dry-run', action='store_true', help='rename 阶段只扫描并写出重命名计划，不改名；有冲突时返回 3')
+    parser.add_argument('--plan', action='store_true', help='rename 阶段按上次 --dry-run 写出的计划改名，不再扫描')
+    parser.add_argument('--name', default='115-strm', help='运行报告和指标中的脚本名称，默认 115-strm')
+    parser.add_argument('--shell-stage', action='append', default=[], type=parse_shell_stage, metavar='名称,开始,结束[,字节数]',
+                        help='记录在 shell 中完成的阶段，时间为 date +%%s.%%N 的输出')
+    parser.add_argument('--tree-unchanged', action='store_true', help='目录树没有变化：不执行任何阶段，只写运行报告')
+    parser.add_argument('--jobs', help='批量任务文件：一次处理多个目录树，每个任务以 [名称] 开头，之后是覆盖的配置项')
+    args = parser.parse_args(argv)
+
+    config = read_config(args.config)
+    for item in args.set:
+        key, sep, value = item.partition('=')
+        if not sep:
+            parser.error(f"--set 的格式应为 键=值：{item}")
+        config[key] = value
+    if args.db_file:
+        config['db_file'] = args.db_file
+    if args.index_mode:
+        config['index_mode'] = args.index_mode
+    if args.rename_conflict:
+        config['rename_conflict'] = args.rename_conflict
+
+    stages = [stage for stage in STAGES if stage in args.stages]
+    if args.jobs:
+        run_batch(config, stages, read_batch_jobs(args.jobs, config), args.config, args.name)
+        return 0
+    metrics = run_stages(config, stages, args.config, args.tree, args.directory_file,
+                         args.name, args.shell_stage, args.tree_unchanged, args.dry_run, args.plan)
+    if args.dry_run and metrics.counts.get('rename_conflicts'):
+        return 3
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())